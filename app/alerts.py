@@ -0,0 +1,119 @@
+import asyncio
+import math
+import re
+import time
+from typing import AsyncIterator, Optional, Union
+
+import config as c
+from . import metrics
+from .schemas import SceneAnalysis
+
+_WORD = re.compile(r"[a-z]+")
+_UNITS = {"m", "cm", "mm", "km", "ft", "in", "meter", "meters", "feet", "foot"}
+
+
+def alert_text(analysis: Union[SceneAnalysis, str]) -> Optional[str]:
+    """
+    The short spoken alert for a frame analysis reporting a hazard (None:
+    no hazard, an uncertain one, or a custom-prompt result).
+    """
+    if not c.HAZARD_ALERT_ENABLED:
+        return None
+    if not isinstance(analysis, SceneAnalysis) or not analysis.has_hazard:
+        return None
+    hazard = analysis.hazard.strip().rstrip(".")
+    if hazard.lower() in c.HAZARD_ALERT_IGNORE:
+        return None
+    return c.HAZARD_ALERT_TEMPLATE.format(hazard=hazard)
+
+
+def hazard_key(hazard: str) -> str:
+    """
+    Identity of a hazard across frames: its words without distances, so "Car
+    right 6 m" and "Car right 4 m" count as the same hazard.
+    """
+    return " ".join(
+        word for word in _WORD.findall(hazard.lower()) if word not in _UNITS
+    )
+
+
+class HazardAlerts:
+    """
+    Alerts raised for the frames of one request or session, as soon as each
+    frame's analysis is parsed and ahead of synthesis. A hazard already
+    alerted isn't repeated within `repeat_after` seconds (by default, not at
+    all), so a hazard seen in several frames is announced once.
+
+    `alerts` keeps every alert raised, for request-scoped use; long-lived
+    users (sessions) pass `keep=False`.
+    """
+
+    def __init__(self, source: str, repeat_after: float = math.inf, keep: bool = True):
+        self.source = source
+        self.repeat_after = repeat_after
+        self.keep = keep
+        self.alerts: list[dict] = []
+        self._last_alerted: dict[str, float] = {}
+        self._added = asyncio.Event()
+        # resolved with the first alert
+        self.first: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def add(
+        self,
+        frame: int,
+        analysis: Union[SceneAnalysis, str],
+        started: float,
+    ) -> Optional[dict]:
+        """
+        Raise an alert if the analysis reports a hazard not alerted recently.
+
+        Args:
+            frame: Index or number of the frame, echoed in the alert
+            analysis: The frame's analysis
+            started: `time.perf_counter()` when the request or frame arrived, for the time-to-alert metric
+
+        Returns:
+            The alert ({"frame", "hazard", "text"}), or None
+        """
+        text = alert_text(analysis)
+        if text is None:
+            return None
+        now = time.perf_counter()
+        key = hazard_key(analysis.hazard)
+        if now - self._last_alerted.get(key, -math.inf) < self.repeat_after:
+            return None
+        if not self.keep:
+            # forget hazards that may be alerted again anyway
+            self._last_alerted = {
+                other: at
+                for other, at in self._last_alerted.items()
+                if now - at < self.repeat_after
+            }
+        self._last_alerted[key] = now
+
+        alert = {"frame": frame, "hazard": analysis.hazard, "text": text}
+        if self.keep:
+            self.alerts.append(alert)
+            self._added.set()
+        if not self.first.done():
+            self.first.set_result(alert)
+        metrics.HAZARD_ALERT_LATENCY.labels(self.source).observe(now - started)
+        return alert
+
+    async def follow(self, task: asyncio.Future) -> AsyncIterator[dict]:
+        """
+        Yield alerts as they are raised until `task` (the analysis) finishes.
+        """
+        sent = 0
+        while True:
+            while sent < len(self.alerts):
+                yield self.alerts[sent]
+                sent += 1
+            if task.done():
+                return
+            self._added.clear()
+            added = asyncio.ensure_future(self._added.wait())
+            try:
+                await asyncio.wait({task, added}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                added.cancel()
@@ -0,0 +1,404 @@
+"""
+Offline batch processor: runs recorded wearer sessions through the same
+VLM -> transcription analysis -> synthesis flow as /api/pipeline, without
+going through the HTTP API, and writes one JSONL result per session.
+
+Each session is a directory under the input directory holding
+`transcript.txt` and its frames (JPEG, PNG or WebP, directly or under
+`frames/`, in file name order):
+
+    recordings/
+        2024-05-01-kitchen/
+            transcript.txt
+            frames/000001.jpg
+            frames/000002.jpg
+
+    python -m app.batch recordings results.jsonl
+    python -m app.batch recordings results.jsonl --base-url http://127.0.0.1:9000  # bench/fakegroq.py
+
+Results are appended as each session finishes, and the results file is the
+checkpoint: re-running the same command skips sessions already processed
+successfully and retries the failed ones. Upstream calls go through the
+same scheduler as the API (BACKGROUND priority), so with enough sessions in
+flight throughput is bounded by the configured rate limits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Iterator
+
+import config as c
+from .framecache import FrameCache
+from .generation import set_profile
+from .groqclient import close_client
+from .imageprocessing import FramePreprocessor
+from .llmsynthesis import LLMSynthesis
+from .pipeline import Pipeline
+from .resilience import Deadline, percentile, reset_deadline, set_deadline
+from .responsecache import create_response_cache
+from .scheduler import Priority, set_priority
+from .streaming import encode_json
+from .transcriptionanalysis import TranscriptionAnalysis
+from .vlm import VLM
+
+IMAGE_EXTENSIONS = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+STAGES = ("load", "preprocess", "vlm", "transcription_analysis", "synthesis", "total")
+
+
+class RecordedSession:
+    """
+    A recorded session on disk; files are only read when it is processed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.id = os.path.basename(path)
+
+    def frame_paths(self) -> list[str]:
+        frames_dir = os.path.join(self.path, "frames")
+        directory = frames_dir if os.path.isdir(frames_dir) else self.path
+        return sorted(
+            entry.path
+            for entry in os.scandir(directory)
+            if entry.is_file()
+            and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+        )
+
+    def load(self, max_frames: int) -> tuple[str, list[tuple[bytes, str]]]:
+        """
+        Read the transcript and up to `max_frames` frames, evenly spaced over the session.
+
+        Returns:
+            The transcript and (image bytes, mime type) pairs in capture order
+        """
+        with open(os.path.join(self.path, "transcript.txt"), encoding="utf-8") as f:
+            transcript = f.read().strip()
+        if not transcript:
+            raise ValueError("transcript.txt is empty")
+        paths = self.frame_paths()
+        if max_frames and len(paths) > max_frames:
+            step = len(paths) / max_frames
+            paths = [paths[int(i * step)] for i in range(max_frames)]
+        frames = []
+        for path in paths:
+            with open(path, "rb") as f:
+                frames.append((f.read(), IMAGE_EXTENSIONS[os.path.splitext(path)[1].lower()]))
+        return transcript, frames
+
+
+def iter_sessions(root: str, done: set[str]) -> Iterator[RecordedSession]:
+    """
+    Sessions under `root` in name order, skipping those in `done`.
+    """
+    names = sorted(
+        entry.name for entry in os.scandir(root) if entry.is_dir() and entry.name not in done
+    )
+    for name in names:
+        yield RecordedSession(os.path.join(root, name))
+
+
+def read_checkpoint(path: str) -> set[str]:
+    """
+    Ids of the sessions already processed successfully according to the
+    results file. A line cut short by an interrupted run is removed.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok":
+            done.add(record["session"])
+    return done
+
+
+class BatchProcessor:
+    """
+    Bounded pipeline over recorded sessions: a reader feeds sessions lazily
+    into a bounded queue, `concurrency` workers run each one through the
+    stages (frames and transcript analyzed concurrently, then synthesis),
+    and a single writer appends the results.
+    """
+
+    def __init__(self, pipeline, concurrency: int, max_frames: int):
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.max_frames = max_frames
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.ok = 0
+        self.failed = 0
+        self.frames = 0
+
+    async def process(self, session: RecordedSession) -> dict:
+        timings = {}
+        started = time.perf_counter()
+
+        def lap(stage: str, since: float):
+            timings[stage] = time.perf_counter() - since
+
+        deadline_token = set_deadline(Deadline(c.BATCH_SESSION_BUDGET_SECONDS))
+        try:
+            stage_started = time.perf_counter()
+            transcript, images = await asyncio.to_thread(session.load, self.max_frames)
+            lap("load", stage_started)
+
+            async def analyze_frames():
+                stage_started = time.perf_counter()
+                prepared = await asyncio.gather(
+                    *[
+                        self.pipeline.preprocessor.prepare(image, mime_type)
+                        for image, mime_type in images
+                    ]
+                )
+                lap("preprocess", stage_started)
+                stage_started = time.perf_counter()
+                analyses = await self.pipeline.vlm.analyze_frames(
+                    [(frame.data_uri, frame.phash) for frame in prepared]
+                )
+                lap("vlm", stage_started)
+                return analyses
+
+            async def analyze_transcript():
+                stage_started = time.perf_counter()
+                analysis = await self.pipeline.transcription.analyze_transcript(
+                    transcript=transcript
+                )
+                lap("transcription_analysis", stage_started)
+                return analysis
+
+            surrounding_analysis, transcription_analysis = await asyncio.gather(
+                analyze_frames(), analyze_transcript()
+            )
+            stage_started = time.perf_counter()
+            response = await self.pipeline.synthesis.synthesize(
+                transcription_analysis=transcription_analysis,
+                surrounding_analysis=surrounding_analysis,
+            )
+            lap("synthesis", stage_started)
+        except Exception as e:
+            lap("total", started)
+            self.failed += 1
+            return {
+                "session": session.id,
+                "status": "error",
+                "error": f"{type(e).__name__}: {e}",
+                "timing_ms": _milliseconds(timings),
+            }
+        finally:
+            reset_deadline(deadline_token)
+
+        lap("total", started)
+        self.ok += 1
+        self.frames += len(images)
+        for stage, seconds in timings.items():
+            self.latencies[stage].append(seconds)
+        return {
+            "session": session.id,
+            "status": "ok",
+            "transcript": transcript,
+            "frames": len(images),
+            "transcription_analysis": transcription_analysis,
+            "surrounding_analysis": surrounding_analysis,
+            "response": response,
+            "timing_ms": _milliseconds(timings),
+        }
+
+    async def run(
+        self,
+        sessions: Iterator[RecordedSession],
+        output: str,
+        progress_seconds: float = 10.0,
+    ) -> dict:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started = time.perf_counter()
+
+        async def read():
+            for session in sessions:
+                await queue.put(session)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while (session := await queue.get()) is not None:
+                await results.put(await self.process(session))
+
+        async def produce():
+            await asyncio.gather(read(), *[work() for _ in range(self.concurrency)])
+            await results.put(None)
+
+        async def write():
+            with open(output, "a", encoding="utf-8") as f:
+                while (record := await results.get()) is not None:
+                    f.write(encode_json(record) + "\n")
+                    # a crash loses at most the sessions still in flight
+                    f.flush()
+
+        async def report():
+            while True:
+                await asyncio.sleep(progress_seconds)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"[{elapsed:7.1f} s] {self.ok} ok, {self.failed} failed, "
+                    f"{self.ok / elapsed:.2f} sessions/s",
+                    file=sys.stderr,
+                )
+
+        producer = asyncio.ensure_future(produce())
+        writer = asyncio.ensure_future(write())
+        reporter = asyncio.ensure_future(report())
+        tasks = (producer, writer, reporter)
+        try:
+            done, _ = await asyncio.wait(
+                {producer, writer}, return_when=asyncio.FIRST_EXCEPTION
+            )
+            # a failed writer (disk full, ...) would leave the workers blocked on
+            # its queue: raise, and the workers are cancelled below
+            for task in done:
+                task.result()
+            await writer
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, wall: float) -> dict:
+        return {
+            "ok": self.ok,
+            "failed": self.failed,
+            "wall_seconds": round(wall, 2),
+            "sessions_per_second": round(self.ok / wall, 2) if wall else None,
+            "frames_per_second": round(self.frames / wall, 2) if wall else None,
+            "stages": {
+                stage: {
+                    f"p{p}_ms": (
+                        round(percentile(ordered, p) * 1000, 1) if ordered else None
+                    )
+                    for p in (50, 95, 99)
+                }
+                for stage in STAGES
+                if (ordered := sorted(self.latencies[stage]))
+            },
+        }
+
+
+def _milliseconds(timings: dict[str, float]) -> dict[str, float]:
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+
+
+def print_report(summary: dict):
+    print(
+        f"\n{summary['ok']} sessions ok, {summary['failed']} failed in "
+        f"{summary['wall_seconds']} s: {summary['sessions_per_second']} sessions/s, "
+        f"{summary['frames_per_second']} frames/s"
+    )
+    print(f"{'stage':<24} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, stats in summary["stages"].items():
+        print(
+            f"{stage:<24} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+        )
+
+
+async def _main(args) -> dict:
+    # evaluation re-runs want fresh answers, so caches are opt-in
+    cache = create_response_cache() if args.cache else None
+    pipeline = Pipeline(
+        VLM(frame_cache=FrameCache() if args.cache else None),
+        TranscriptionAnalysis(cache=cache),
+        LLMSynthesis(cache=cache),
+        FramePreprocessor(),
+    )
+    set_priority(Priority.BACKGROUND)
+    set_profile(args.profile)
+
+    done = set() if args.restart else read_checkpoint(args.output)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    if done:
+        print(f"Resuming: {len(done)} sessions already done", file=sys.stderr)
+
+    processor = BatchProcessor(pipeline, args.concurrency, args.max_frames)
+    await pipeline.preprocessor.start()
+    try:
+        return await processor.run(
+            iter_sessions(args.input, done), args.output, args.progress_seconds
+        )
+    finally:
+        await close_client()
+        pipeline.preprocessor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0].strip(),
+        epilog=__doc__.split("\n\n", 1)[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("input", help="directory with one subdirectory per recorded session")
+    parser.add_argument("output", help="JSONL results file (appended to; also the checkpoint)")
+    parser.add_argument("--base-url", help="Groq API base URL, e.g. a local bench/fakegroq.py")
+    parser.add_argument("--api-key", help="defaults to GROQ_API_KEY")
+    parser.add_argument("--concurrency", type=int, default=c.BATCH_CONCURRENCY)
+    parser.add_argument(
+        "--max-frames",
+        type=int,
+        default=c.BATCH_MAX_FRAMES,
+        help="frames analyzed per session, evenly spaced (0: all)",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=list(c.GENERATION_PROFILES),
+        default=None,
+        help="generation profile (default GENERATION_DEFAULT_PROFILE)",
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="use the response and frame caches"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard previous results instead of resuming",
+    )
+    parser.add_argument("--progress-seconds", type=float, default=10.0)
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    if args.base_url:
+        os.environ["GROQ_BASE_URL"] = args.base_url
+    if args.api_key:
+        os.environ["GROQ_API_KEY"] = args.api_key
+    if not os.path.isdir(args.input):
+        parser.error(f"{args.input} is not a directory")
+
+    try:
+        summary = asyncio.run(_main(args))
+    except OSError as e:
+        # results written so far are kept; re-running resumes from them
+        sys.exit(f"Batch aborted: {e}")
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
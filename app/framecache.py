@@ -0,0 +1,113 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+import config as c
+from . import generation
+from .schemas import SceneAnalysis
+
+
+class FrameCache:
+    """
+    Bounded LRU of recent VLM results keyed by the frame's perceptual hash.
+
+    A lookup hits when a live entry for the same prompt and generation
+    profile is within `max_distance` bits (Hamming distance) of the frame's
+    hash, so a wearer standing still doesn't pay a VLM round trip per frame.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = c.FRAME_CACHE_MAX_ENTRIES,
+        ttl: float = c.FRAME_CACHE_TTL_SECONDS,
+        max_distance: int = c.FRAME_CACHE_MAX_DISTANCE,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # (phash, prompt, profile) -> (response, stored_at), oldest first
+        self._entries: OrderedDict[
+            tuple[int, Optional[str], str], tuple[str, float]
+        ] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.hit_distances = [0] * (max_distance + 1)
+
+    def get(
+        self, phash: int, prompt: Optional[str] = None
+    ) -> Optional[tuple[Union[SceneAnalysis, str], int]]:
+        """
+        Find the closest live entry within `max_distance` of `phash`.
+
+        Returns:
+            The cached response and its Hamming distance, or None on a miss
+        """
+        now = time.monotonic()
+        scope = (prompt, generation.current_profile())
+        best_key, best_distance = None, self.max_distance + 1
+        expired = []
+        for key, (_, stored_at) in reversed(self._entries.items()):
+            if now - stored_at > self.ttl:
+                expired.append(key)
+                continue
+            if key[1:] != scope:
+                continue
+            distance = (key[0] ^ phash).bit_count()
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+                if distance == 0:
+                    break
+        for key in expired:
+            del self._entries[key]
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.hit_distances[best_distance] += 1
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][0], best_distance
+
+    def put(
+        self,
+        phash: int,
+        response: Union[SceneAnalysis, str],
+        prompt: Optional[str] = None,
+    ):
+        """
+        Store a VLM response for a frame. Responses reporting a hazard are not
+        cached, so a moving hazard is always re-analyzed.
+        """
+        if isinstance(response, SceneAnalysis):
+            if response.has_hazard:
+                return
+        else:
+            try:
+                hazard = json.loads(response).get("hazard", "none")
+            except (ValueError, AttributeError):
+                return
+            if hazard != "none":
+                return
+
+        key = (phash, prompt, generation.current_profile())
+        self._entries[key] = (response, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "max_distance": self.max_distance,
+            "ttl_seconds": self.ttl,
+            "hit_distances": {
+                str(distance): count
+                for distance, count in enumerate(self.hit_distances)
+            },
+        }
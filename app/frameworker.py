@@ -0,0 +1,66 @@
+# Code run in the frame preprocessing pool's processes (see FramePreprocessor).
+# Spawned processes import this module by name, so it must not import anything
+# from the app that registers metrics: every process that touches app.metrics
+# writes its own files to PROMETHEUS_MULTIPROC_DIR.
+
+import io
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import config as c
+
+
+def dhash(frame: Image.Image) -> Optional[int]:
+    """
+    64-bit difference hash: one bit per horizontally adjacent pixel pair of a
+    9x8 grayscale thumbnail. Near-identical frames differ in only a few bits.
+
+    None for a flat frame (less than FRAME_CACHE_MIN_CONTRAST gray levels
+    across the thumbnail), whose bits say nothing about what it shows.
+    """
+    # one byte per pixel, row by row
+    pixels = frame.convert("L").resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+    if max(pixels) - min(pixels) < c.FRAME_CACHE_MIN_CONTRAST:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def normalize_frame(
+    image: bytes, size: int, quality: int
+) -> tuple[Optional[bytes], Optional[int]]:
+    """
+    Downscale an image to fit within size x size, re-encode it as JPEG and
+    compute its perceptual hash.
+
+    Runs in a worker process. The re-encoded image is None when it would not
+    be smaller than the original.
+    """
+    try:
+        frame = Image.open(io.BytesIO(image))
+        # let the JPEG decoder scale down by a power of two while decoding
+        frame.draft("RGB", (size, size))
+        frame = ImageOps.exif_transpose(frame)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise ValueError("Invalid image: could not decode frame")
+
+    if frame.mode != "RGB":
+        frame = frame.convert("RGB")
+    frame.thumbnail((size, size), Image.Resampling.BICUBIC, reducing_gap=2.0)
+    phash = dhash(frame)
+
+    out = io.BytesIO()
+    frame.save(out, format="JPEG", quality=quality)
+    if out.tell() >= len(image):
+        return None, phash
+    return out.getvalue(), phash
+
+
+def warm_up():
+    pass
@@ -0,0 +1,58 @@
+from contextvars import ContextVar
+from typing import Optional
+
+import config as c
+
+_request_profile: ContextVar[Optional[str]] = ContextVar(
+    "generation_profile", default=None
+)
+
+
+def set_profile(profile: Optional[str]):
+    return _request_profile.set(profile)
+
+
+def reset_profile(token):
+    _request_profile.reset(token)
+
+
+def current_profile() -> str:
+    """
+    The current request's generation profile (X-Generation-Profile), or the default.
+    """
+    return _request_profile.get() or c.GENERATION_DEFAULT_PROFILE
+
+
+def params(stage: str, model: str, outputs: int = 1) -> dict:
+    """
+    Generation parameters for one chat completion under the current request's
+    profile: the profile's entry for `stage`, with GENERATION_MODEL_OVERRIDES
+    for `model` merged over it (a None value removes the parameter).
+    `reasoning_effort` is only sent to GENERATION_REASONING_MODELS.
+
+    Args:
+        stage: "vlm", "transcription_analysis" or "synthesis"
+        model: The model the completion will run on
+        outputs: Number of answers in the completion (batched VLM frames);
+            scales `max_completion_tokens`
+
+    Returns:
+        Keyword arguments for `chat.completions.create`
+    """
+    merged = {
+        **c.GENERATION_PROFILES[current_profile()].get(stage, {}),
+        **c.GENERATION_MODEL_OVERRIDES.get(model, {}),
+    }
+    if model not in c.GENERATION_REASONING_MODELS:
+        merged.pop("reasoning_effort", None)
+    merged = {key: value for key, value in merged.items() if value is not None}
+    if "max_completion_tokens" in merged and outputs > 1:
+        merged["max_completion_tokens"] *= outputs
+    return merged
+
+
+def profiles() -> dict:
+    return {
+        "default": c.GENERATION_DEFAULT_PROFILE,
+        "profiles": c.GENERATION_PROFILES,
+    }
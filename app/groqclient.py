@@ -0,0 +1,70 @@
+import os
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+import config as c
+from . import timing
+
+load_dotenv()
+
+_client: Optional[AsyncGroq] = None
+
+
+async def _mark_sent(request: httpx.Request):
+    request.extensions["jarvis_sent_at"] = time.perf_counter()
+
+
+async def _record_ttfb(response: httpx.Response):
+    # response hooks run once the status line and headers are in, before the body
+    sent_at = response.request.extensions.get("jarvis_sent_at")
+    if sent_at is not None:
+        timing.record("ttfb", time.perf_counter() - sent_at)
+
+
+def get_client() -> AsyncGroq:
+    """
+    Return the process-wide async Groq client, creating it on first use.
+
+    VLM, TranscriptionAnalysis and LLMSynthesis all share this client so that
+    every upstream call in a worker goes through one keep-alive connection pool.
+    """
+    global _client
+    if _client is None:
+        api_key = os.environ.get("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in env vars")
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=c.GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=c.GROQ_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=c.GROQ_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                c.GROQ_REQUEST_TIMEOUT, connect=c.GROQ_CONNECT_TIMEOUT
+            ),
+            event_hooks={"request": [_mark_sent], "response": [_record_ttfb]},
+        )
+        # retries are handled per stage and deadline in upstream.create_completion;
+        # GROQ_BASE_URL points the service at a stand-in such as bench/fakegroq.py
+        _client = AsyncGroq(
+            api_key=api_key,
+            base_url=os.environ.get("GROQ_BASE_URL"),
+            http_client=http_client,
+            max_retries=0,
+        )
+    return _client
+
+
+async def close_client():
+    """
+    Close the shared client and its connection pool (called on app shutdown).
+    """
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
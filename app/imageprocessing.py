@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import binascii
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import config as c
+from .frameworker import normalize_frame, warm_up
+from .vlm import encode_image
+
+
+@dataclass
+class PreprocessedFrame:
+    data_uri: str
+    bytes_saved: int = 0
+    # 64-bit dHash, set when the frame was decoded and isn't flat
+    phash: Optional[int] = None
+
+
+def decode_image(base64_image: str) -> tuple[bytes, str]:
+    """
+    Decode a base64 image string (with or without data URI prefix).
+
+    Returns:
+        The raw image bytes and their mime type
+    """
+    mime_type = "image/jpeg"
+    if base64_image.startswith("data:"):
+        header, _, base64_image = base64_image.partition(",")
+        mime_type = header[len("data:") :].split(";")[0] or mime_type
+    try:
+        return base64.b64decode(base64_image, validate=True), mime_type
+    except binascii.Error:
+        raise ValueError("Invalid base64 image")
+
+
+class FramePreprocessor:
+    """
+    Normalizes frames to the resolution the VLM prompt expects before they
+    are sent upstream. Decoding and resizing run in a process pool so the
+    event loop stays free.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = c.VLM_PREPROCESS_ENABLED,
+        size: int = c.VLM_FRAME_SIZE,
+        quality: int = c.VLM_JPEG_QUALITY,
+        max_workers: int = c.VLM_PREPROCESS_WORKERS,
+    ):
+        self.enabled = enabled
+        self.size = size
+        self.quality = quality
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # created lazily so gunicorn forks workers before any pool exists
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def start(self):
+        """
+        Spawn the pool's processes ahead of the first frame (called on app startup).
+        """
+        if self.enabled:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._get_pool(), warm_up)
+
+    async def normalize(
+        self, image: bytes, mime_type: str = "image/jpeg"
+    ) -> PreprocessedFrame:
+        """
+        Downscale and re-encode a frame, keeping the original if that is smaller.
+        """
+        if not image:
+            raise ValueError("Image body is empty")
+
+        loop = asyncio.get_running_loop()
+        try:
+            normalized, phash = await loop.run_in_executor(
+                self._get_pool(), normalize_frame, image, self.size, self.quality
+            )
+        except BrokenProcessPool:
+            # a crashed worker process breaks the whole pool; start a fresh one next time
+            self.shutdown()
+            raise
+        if normalized is None:
+            return PreprocessedFrame(encode_image(image, mime_type), 0, phash)
+        return PreprocessedFrame(
+            encode_image(normalized, "image/jpeg"), len(image) - len(normalized), phash
+        )
+
+    async def normalize_base64(self, base64_image: str) -> PreprocessedFrame:
+        """
+        Same as `normalize`, for a base64 image string.
+        """
+        image, mime_type = decode_image(base64_image)
+        return await self.normalize(image, mime_type)
+
+    async def prepare(
+        self, image: Union[bytes, str], mime_type: str = "image/jpeg"
+    ) -> PreprocessedFrame:
+        """
+        Turn raw image bytes or a base64 string into the data URI sent upstream,
+        normalizing it first when preprocessing is enabled.
+        """
+        if not self.enabled:
+            if isinstance(image, str):
+                return PreprocessedFrame(image)
+            return PreprocessedFrame(encode_image(image, mime_type))
+
+        if isinstance(image, str):
+            return await self.normalize_base64(image)
+        return await self.normalize(image, mime_type)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -1,50 +1,224 @@
 import config as c
-from groq import Groq
-from dotenv import load_dotenv
-import os
+from groq import AsyncGroq
+from groq.types import CompletionUsage
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from .groqclient import get_client
+from . import generation, metrics, prompts
+from .upstream import create_completion
+from .responsecache import ResponseCache, cache_key, normalize_json
+from .schemas import SceneInput, TranscriptInput, to_json
+from .singleflight import SingleFlight
 
-load_dotenv()
+
+class SynthesisStream:
+    """
+    Async iterator over the text deltas of a streamed synthesis completion.
+
+    `model` is the model that answered (taken from the chunks, as the router
+    may have picked another tier). `usage` and `finish_reason` are populated
+    from the final chunks once the stream is exhausted (and counted against
+    `model` and `profile` in the metrics), and `on_complete` (if given)
+    receives the full text.
+    """
+
+    def __init__(
+        self,
+        stream,
+        on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+        model: Optional[str] = None,
+        profile: Optional[str] = None,
+    ):
+        self._stream = stream
+        self._on_complete = on_complete
+        self.model = model
+        self._profile = profile
+        self._text: Optional[str] = None
+        self.usage: Optional[CompletionUsage] = None
+        self.finish_reason: Optional[str] = None
+
+    @classmethod
+    def from_text(cls, text: str) -> "SynthesisStream":
+        """
+        A stream that yields an already known response (e.g. a cache hit) at once.
+        """
+        stream = cls(None)
+        stream._text = text
+        return stream
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iter_deltas()
+
+    async def _iter_deltas(self) -> AsyncIterator[str]:
+        if self._stream is None:
+            yield self._text
+            return
+
+        parts = []
+        async for chunk in self._stream:
+            self.model = chunk.model or self.model
+            usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+            if usage is not None:
+                self.usage = usage
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason:
+                self.finish_reason = chunk.choices[0].finish_reason
+            if chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+        if self.model is not None:
+            metrics.record_usage(self.model, self.usage)
+            metrics.record_completion(
+                self.model,
+                "synthesis",
+                self._profile or c.GENERATION_DEFAULT_PROFILE,
+                self.finish_reason,
+            )
+        if self._on_complete is not None and parts:
+            await self._on_complete("".join(parts))
+
+    async def close(self):
+        if self._stream is not None:
+            await self._stream.close()
 
 
 class LLMSynthesis:
-    def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-        if not self.client.api_key:
-            raise ValueError("GROQ_API_KEY not found in env vars")
+    def __init__(
+        self,
+        client: Optional[AsyncGroq] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.cache = cache
+        self.single_flight = SingleFlight()
+
+    def _build_messages(
+        self,
+        transcription_analysis: TranscriptInput,
+        surrounding_analysis: list[SceneInput],
+    ) -> list[dict]:
+        # Construct the user message with all analysis data
+        if c.PROMPT_COMPACTION_ENABLED:
+            transcription_analysis = prompts.compact_json(transcription_analysis)
+            frame_lines = prompts.compact_frames(surrounding_analysis)
+        else:
+            transcription_analysis = to_json(transcription_analysis)
+            frame_lines = [
+                f"Frame {i+1}: {to_json(analysis)}"
+                for i, analysis in enumerate(surrounding_analysis)
+            ]
+        surrounding_context = "\n".join(frame_lines)
+
+        user_message = f"""Transcription Analysis:
+{transcription_analysis}
+
+Surrounding Visual Analysis:
+{surrounding_context}"""
+
+        return [
+            {"role": "system", "content": prompts.SYNTHESIS_SYSTEM_PROMPT},
+            {"role": "user", "content": user_message},
+        ]
 
-    def synthesize(
-        self, transcription_analysis: str, surrounding_analysis: list[str]
+    def _cache_key(
+        self,
+        transcription_analysis: TranscriptInput,
+        surrounding_analysis: list[SceneInput],
+    ) -> str:
+        return cache_key(
+            c.GROQ_LLM_SYNTHESIS_MODEL,
+            generation.current_profile(),
+            prompts.SYNTHESIS_SYSTEM_PROMPT,
+            normalize_json(to_json(transcription_analysis)),
+            *[normalize_json(to_json(analysis)) for analysis in surrounding_analysis],
+        )
+
+    async def synthesize(
+        self,
+        transcription_analysis: TranscriptInput,
+        surrounding_analysis: list[SceneInput],
     ) -> str:
         """
         Synthesize transcription analysis and surrounding visual analyses into a conversational response.
 
         Args:
-            transcription_analysis: JSON string containing the transcription analysis result
-            surrounding_analysis: List of JSON strings containing VLM analysis results
+            transcription_analysis: The transcription analysis (typed or as a JSON string)
+            surrounding_analysis: VLM analysis results (typed or as JSON strings)
 
         Returns:
             A conversational response synthesizing the audio and visual context
         """
-        # Construct the user message with all analysis data
-        surrounding_context = "\n".join(
-            [
-                f"Frame {i+1}: {analysis}"
-                for i, analysis in enumerate(surrounding_analysis)
-            ]
+        key = self._cache_key(transcription_analysis, surrounding_analysis)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        return await self.single_flight.do(
+            key,
+            lambda: self._complete(key, transcription_analysis, surrounding_analysis),
         )
 
-        user_message = f"""Transcription Analysis:
-{transcription_analysis}
+    async def _complete(
+        self,
+        key: str,
+        transcription_analysis: TranscriptInput,
+        surrounding_analysis: list[SceneInput],
+    ) -> str:
+        chat_completion = await create_completion(
+            self.client,
+            stage="synthesis",
+            messages=self._build_messages(transcription_analysis, surrounding_analysis),
+            model=c.GROQ_LLM_SYNTHESIS_MODEL,
+        )
 
-Surrounding Visual Analysis:
-{surrounding_context}"""
+        response = chat_completion.choices[0].message.content
+        # answers from a fallback tier stand in for this request only
+        if (
+            self.cache is not None
+            and response
+            and chat_completion.model == c.GROQ_LLM_SYNTHESIS_MODEL
+        ):
+            await self.cache.set(key, response)
+        return response
+
+    async def synthesize_stream(
+        self,
+        transcription_analysis: TranscriptInput,
+        surrounding_analysis: list[SceneInput],
+    ) -> SynthesisStream:
+        """
+        Same as `synthesize`, but stream the response as the model produces it.
+
+        The upstream request is started before this returns, so connection and
+        API errors surface here rather than mid-stream.
 
-        chat_completion = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": c.GROQ_SYNTHESIS_SYSTEM_PROMPT},
-                {"role": "user", "content": user_message},
-            ],
+        Returns:
+            A SynthesisStream yielding text deltas
+        """
+        on_complete = None
+        if self.cache is not None:
+            key = self._cache_key(transcription_analysis, surrounding_analysis)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return SynthesisStream.from_text(cached)
+
+            async def on_complete(response: str):
+                # answers from a fallback tier stand in for this request only
+                if synthesis_stream.model == c.GROQ_LLM_SYNTHESIS_MODEL:
+                    await self.cache.set(key, response)
+
+        stream = await create_completion(
+            self.client,
+            stage="synthesis",
+            messages=self._build_messages(transcription_analysis, surrounding_analysis),
             model=c.GROQ_LLM_SYNTHESIS_MODEL,
+            # usage arrives in the final chunk's x_groq (see SynthesisStream)
+            stream=True,
         )
 
-        return chat_completion.choices[0].message.content
+        synthesis_stream = SynthesisStream(
+            stream, on_complete, profile=generation.current_profile()
+        )
+        return synthesis_stream
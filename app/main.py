@@ -1,30 +1,111 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Depends,
+    Header,
+    Query,
+    Request,
+    WebSocket,
+    status,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match
+from starlette.datastructures import UploadFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal, Optional, Union
+from contextlib import asynccontextmanager
+import asyncio
+import math
 import os
+import time
+import groq
 from dotenv import load_dotenv
-from .vlm import VLM
+from .groqclient import close_client
+from .vlm import VLM, IMAGE_MIME_TYPES
+from .imageprocessing import FramePreprocessor
+from .framecache import FrameCache
+from .transcriptindex import TranscriptIndex
+from .responsecache import create_response_cache
+from .scenestore import SESSION_ID_PATTERN, create_scene_store, validate_session_id
 from .transcriptionanalysis import TranscriptionAnalysis
+from .speculation import SpeculativeAnalysis
+from .utterancestore import create_utterance_store
 from .llmsynthesis import LLMSynthesis
+from .pipeline import Pipeline
+from .alerts import HazardAlerts
+from .streaming import SSE_HEADERS, encode_json, format_sse, stream_synthesis_events
+from .resilience import (
+    CircuitOpen,
+    Deadline,
+    DeadlineExceeded,
+    set_deadline,
+    reset_deadline,
+)
+from .scheduler import (
+    Priority,
+    SchedulerOverloaded,
+    reset_priority,
+    scheduler,
+    set_priority,
+)
+from . import generation, metrics, prompts, schemas, session, timing, upstream
+from .schemas import (
+    SCENE_UNCLEAR,
+    SceneAnalysis,
+    SceneInput,
+    TranscriptAnalysis,
+    TranscriptInput,
+)
+from .timing import timed_endpoint
+from .profiling import RequestProfiler
+import config as c
 import uvicorn
 
 
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await frame_preprocessor.start()
+    yield
+    # Release the shared upstream connection pool and preprocessing processes on worker shutdown
+    await close_client()
+    frame_preprocessor.shutdown()
+
+
 app = FastAPI(
     title="Jarvis External Models API",
     description="API for VLM and Transcription Analysis using Groq models",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 security = HTTPBearer()
 AUTH_TOKEN = os.environ.get("API_AUTH_TOKEN")
 
 # Initialize service instances
-vlm_service = VLM()
-transcription_service = TranscriptionAnalysis()
-synthesis_service = LLMSynthesis()
+frame_cache = FrameCache() if c.FRAME_CACHE_ENABLED else None
+vlm_service = VLM(frame_cache=frame_cache)
+response_cache = create_response_cache()
+scene_store = create_scene_store()
+transcript_index = TranscriptIndex() if c.TRANSCRIPT_INDEX_ENABLED else None
+transcription_service = TranscriptionAnalysis(
+    cache=response_cache, index=transcript_index
+)
+synthesis_service = LLMSynthesis(cache=response_cache)
+speculative_analysis = (
+    SpeculativeAnalysis(transcription_service, create_utterance_store())
+    if c.SPECULATION_ENABLED
+    else None
+)
+frame_preprocessor = FramePreprocessor()
+request_profiler = RequestProfiler()
+pipeline_service = Pipeline(
+    vlm_service, transcription_service, synthesis_service, frame_preprocessor
+)
 
 
 # Pydantic models for request/response validation
@@ -45,13 +126,33 @@ class VLMRequest(BaseModel):
         }
 
 
+class HazardAlert(BaseModel):
+    frame: int = Field(..., description="Index of the frame the hazard was seen in")
+    hazard: str = Field(..., description="The hazard as reported by the VLM")
+    text: str = Field(..., description="Short alert to speak before the full response")
+
+
 class VLMResponse(BaseModel):
-    response: str = Field(..., description="VLM analysis response")
+    response: Union[SceneAnalysis, str] = Field(
+        ...,
+        description="Scene analysis (the model's raw output when a custom prompt is used)",
+    )
+    alert: Optional[HazardAlert] = Field(
+        None, description="Present when the frame shows a hazard"
+    )
 
     class Config:
         json_schema_extra = {
             "example": {
-                "response": '{"hazard": "none", "people": "2 ahead 1.5 m", "actions": ["walking forward"], "objects": ["counter front 3 m"], "path": "clear left 4 m", "notes": "daylight", "confidence": 0.93}'
+                "response": {
+                    "hazard": "none",
+                    "people": "2 ahead 1.5 m",
+                    "actions": ["walking forward"],
+                    "objects": ["counter front 3 m"],
+                    "path": "clear left 4 m",
+                    "notes": "daylight",
+                    "confidence": 0.93,
+                }
             }
         }
 
@@ -61,6 +162,11 @@ class TranscriptionAnalysisRequest(BaseModel):
     prompt: Optional[str] = Field(
         None, description="Custom prompt to override the default system prompt"
     )
+    utterance_id: Optional[str] = Field(
+        None,
+        pattern=SESSION_ID_PATTERN.pattern,
+        description="Commit the final transcript of an utterance posted to /api/transcription-analysis/partial, reusing its speculative analysis if it still applies",
+    )
 
     class Config:
         json_schema_extra = {
@@ -71,31 +177,97 @@ class TranscriptionAnalysisRequest(BaseModel):
         }
 
 
+class PartialTranscriptRequest(BaseModel):
+    utterance_id: str = Field(
+        ...,
+        pattern=SESSION_ID_PATTERN.pattern,
+        description="Client-chosen id of the utterance (unique per utterance, e.g. a UUID)",
+    )
+    transcript: str = Field(
+        ...,
+        max_length=c.SESSION_MAX_UTTERANCE_CHARS,
+        description="The utterance so far, as currently recognized",
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "utterance_id": "3f2b9c1e-utt-17",
+                "transcript": "where is the counter",
+            }
+        }
+
+
+class PartialTranscriptResponse(BaseModel):
+    speculating: Optional[str] = Field(
+        None, description="The prefix of the utterance being analyzed, if any"
+    )
+
+
 class TranscriptionAnalysisResponse(BaseModel):
-    analysis: str = Field(..., description="Analysis result of the transcript")
+    analysis: Union[TranscriptAnalysis, str] = Field(
+        ...,
+        description="Analysis of the transcript (the model's raw output when a custom prompt is used)",
+    )
 
     class Config:
         json_schema_extra = {
             "example": {
-                "analysis": '{"context": "Team discussion about project delivery timeline", "keywords": ["project", "deadline", "update", "client"], "domain": "business", "actions": ["send progress report", "confirm next meeting"], "tone": "collaborative", "confidence": 0.94}'
+                "analysis": {
+                    "context": "Team discussion about project delivery timeline",
+                    "keywords": ["project", "deadline", "update", "client"],
+                    "domain": "business",
+                    "actions": ["send progress report", "confirm next meeting"],
+                    "tone": "collaborative",
+                    "notes": "none",
+                    "confidence": 0.94,
+                }
             }
         }
 
 
 class SynthesisRequest(BaseModel):
-    transcription_analysis: str = Field(
-        ..., description="JSON string containing the transcription analysis result"
+    transcription_analysis: TranscriptInput = Field(
+        ...,
+        description="Transcription analysis: the object returned by /api/transcription-analysis, or a JSON string",
     )
-    surrounding_analysis: list[str] = Field(
-        ..., description="List of JSON strings containing VLM analysis results"
+    surrounding_analysis: list[SceneInput] = Field(
+        default_factory=list,
+        description="VLM analysis results: objects returned by /api/vlm, or JSON strings",
+    )
+    session_id: Optional[str] = Field(
+        None,
+        pattern=SESSION_ID_PATTERN.pattern,
+        description="Also use the scenes recorded for this session (X-Session-Id on /api/vlm, /api/pipeline or /api/session), before surrounding_analysis",
+    )
+    session_window_seconds: Optional[float] = Field(
+        None,
+        gt=0,
+        le=c.SCENE_STORE_TTL_SECONDS,
+        description="How far back to take the session's scenes (default SCENE_STORE_DEFAULT_WINDOW_SECONDS)",
     )
 
     class Config:
         json_schema_extra = {
             "example": {
-                "transcription_analysis": '{"context": "User asking about nearby objects", "keywords": ["where", "counter"], "domain": "casual", "actions": ["locate object"], "tone": "inquisitive", "confidence": 0.91}',
+                "transcription_analysis": {
+                    "context": "User asking about nearby objects",
+                    "keywords": ["where", "counter"],
+                    "domain": "casual",
+                    "actions": ["locate object"],
+                    "tone": "inquisitive",
+                    "confidence": 0.91,
+                },
                 "surrounding_analysis": [
-                    '{"hazard": "none", "people": "2 ahead 1.5 m", "actions": ["walking forward"], "objects": ["counter front 3 m"], "path": "clear left 4 m", "notes": "daylight", "confidence": 0.93}'
+                    {
+                        "hazard": "none",
+                        "people": "2 ahead 1.5 m",
+                        "actions": ["walking forward"],
+                        "objects": ["counter front 3 m"],
+                        "path": "clear left 4 m",
+                        "notes": "daylight",
+                        "confidence": 0.93,
+                    }
                 ],
             }
         }
@@ -114,6 +286,213 @@ class SynthesisResponse(BaseModel):
         }
 
 
+class PipelineRequest(BaseModel):
+    transcript: str = Field(..., description="The text transcript to analyze")
+    frames: list[str] = Field(
+        default_factory=list,
+        max_length=c.PIPELINE_MAX_FRAMES,
+        description="Base64 encoded images (with or without data URI prefix), in capture order",
+    )
+    include_intermediate: bool = Field(
+        False,
+        description="Also return the transcription analysis and per-frame VLM analyses",
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "transcript": "Where is the counter?",
+                "frames": ["data:image/jpeg;base64,/9j/4AAQSkZJRg..."],
+                "include_intermediate": False,
+            }
+        }
+
+
+class PipelineResponse(BaseModel):
+    response: str = Field(
+        ..., description="Conversational response synthesizing audio and visual context"
+    )
+    transcription_analysis: Optional[TranscriptAnalysis] = Field(
+        None, description="Transcription analysis (only with include_intermediate)"
+    )
+    surrounding_analysis: Optional[list[SceneAnalysis]] = Field(
+        None, description="Per-frame VLM analyses (only with include_intermediate)"
+    )
+    alerts: Optional[list[HazardAlert]] = Field(
+        None, description="Hazard alerts, one per distinct hazard in the frames"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "response": "The counter is directly in front of you, about 3 meters away."
+            }
+        }
+
+
+def request_options(headers) -> tuple[float, Optional[Priority], Optional[str]]:
+    """
+    Read the per-request options from the request (or WebSocket handshake) headers.
+
+    Returns:
+        The latency budget in seconds, the scheduling priority and the generation profile (None: defaults)
+
+    Raises:
+        ValueError: A header has an invalid value
+    """
+    budget = c.REQUEST_DEFAULT_BUDGET_SECONDS
+    header = headers.get("x-deadline-ms")
+    if header is not None:
+        try:
+            budget = min(float(header) / 1000, c.REQUEST_MAX_BUDGET_SECONDS)
+        except ValueError:
+            raise ValueError("X-Deadline-Ms must be a number of milliseconds")
+
+    priority = None
+    header = headers.get("x-priority")
+    if header is not None:
+        try:
+            priority = Priority[header.strip().upper()]
+        except KeyError:
+            raise ValueError("X-Priority must be one of: high, normal, background")
+
+    profile = headers.get("x-generation-profile")
+    if profile is not None:
+        profile = profile.strip().lower()
+        if profile not in c.GENERATION_PROFILES:
+            raise ValueError(
+                "X-Generation-Profile must be one of: " + ", ".join(c.GENERATION_PROFILES)
+            )
+
+    return budget, priority, profile
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    Start the request's latency budget: `X-Deadline-Ms` if the client sent one,
+    otherwise REQUEST_DEFAULT_BUDGET_SECONDS. Every upstream call made while
+    handling the request is bounded by what is left of it.
+
+    `X-Priority` (high, normal or background) sets the scheduling priority of
+    those upstream calls; without it each stage uses SCHEDULER_STAGE_PRIORITIES.
+    `X-Generation-Profile` picks one of GENERATION_PROFILES for them.
+    """
+    try:
+        budget, priority, profile = request_options(request.headers)
+    except ValueError as e:
+        return JSONResponse(
+            {"detail": str(e)}, status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    deadline_token = set_deadline(Deadline(budget))
+    priority_token = set_priority(priority)
+    profile_token = generation.set_profile(profile)
+    try:
+        return await call_next(request)
+    finally:
+        generation.reset_profile(profile_token)
+        reset_priority(priority_token)
+        reset_deadline(deadline_token)
+
+
+def _route_path(request: Request) -> str:
+    """
+    The path template of the route handling `request`, so metrics stay low-cardinality.
+    """
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def _authenticated(request: Request) -> bool:
+    # middleware runs before verify_token; without API_AUTH_TOKEN nobody is
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    return bool(AUTH_TOKEN) and scheme.lower() == "bearer" and credentials == AUTH_TOKEN
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """
+    Report the request's stage timings (see app/timing.py) in a `Server-Timing`
+    header, and profile the request if RequestProfiler selects it.
+    """
+    timings_token = timing.start_request()
+    timings = timing.current()
+    profile = request_profiler.start(request.headers, _authenticated(request))
+    try:
+        response = await call_next(request)
+        if timings.handler_finished is not None:
+            timings.add("serialize", time.perf_counter() - timings.handler_finished)
+        response.headers["Server-Timing"] = timings.header()
+        return response
+    finally:
+        if profile is not None:
+            await request_profiler.finish(
+                profile,
+                f"{request.method} {request.url.path}",
+                time.perf_counter() - timings.started,
+            )
+        timing.reset(timings_token)
+
+
+# Registered after the other middleware so it is the outermost one and also
+# times the requests they reject.
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """
+    Record request latency and in-flight counts per endpoint for /metrics.
+    """
+    endpoint = _route_path(request)
+    in_flight = metrics.REQUESTS_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        metrics.REQUEST_LATENCY.labels(
+            endpoint, request.method, str(status_code)
+        ).observe(time.perf_counter() - started)
+
+
+def _retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def service_error(e: Exception, action: str) -> HTTPException:
+    """
+    Map an exception raised by a service call to the HTTP error returned to the client.
+    """
+    metrics.record_error("api", e)
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    if isinstance(e, (SchedulerOverloaded, CircuitOpen)):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers=_retry_after_header(e.retry_after),
+        )
+    if isinstance(e, groq.RateLimitError):
+        # still rate limited after retries: shed instead of reporting a server error
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Upstream rate limited while {action}",
+            headers=_retry_after_header(upstream.retry_after(e)),
+        )
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error {action}: {str(e)}",
+    )
+
+
 # Authentication dependency
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify the bearer token for authentication"""
@@ -126,6 +505,131 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return credentials.credentials
 
 
+# /api/vlm body parsing: JSON (base64), multipart/form-data or a raw image body
+VLM_REQUEST_BODY = {
+    "content": {
+        "application/json": {"schema": VLMRequest.model_json_schema()},
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["image"],
+                "properties": {
+                    "image": {"type": "string", "format": "binary"},
+                    "prompt": {"type": "string"},
+                },
+            }
+        },
+        **{
+            mime_type: {"schema": {"type": "string", "format": "binary"}}
+            for mime_type in IMAGE_MIME_TYPES
+        },
+    },
+    "required": True,
+}
+
+
+async def read_vlm_request(
+    request: Request,
+) -> tuple[Union[bytes, str], str, Optional[str]]:
+    """
+    Read the image and optional prompt from a /api/vlm request body.
+
+    Binary uploads are kept as bytes so they are encoded once, after
+    preprocessing, instead of clients having to base64 the frame themselves.
+    Raw image bodies take the prompt from the `prompt` query parameter;
+    multipart bodies from a `prompt` form field.
+
+    Returns:
+        The image (raw bytes, or base64 / data URI from JSON), its mime type and the prompt override, if any
+    """
+    content_type = (
+        request.headers.get("content-type", "application/json")
+        .split(";")[0]
+        .strip()
+        .lower()
+    )
+
+    if content_type in IMAGE_MIME_TYPES or content_type == "application/octet-stream":
+        mime_type = content_type if content_type in IMAGE_MIME_TYPES else "image/jpeg"
+        image = await request.body()
+        return image, mime_type, request.query_params.get("prompt")
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("image")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Multipart body must include an 'image' file field",
+            )
+        mime_type = (
+            upload.content_type if upload.content_type in IMAGE_MIME_TYPES else "image/jpeg"
+        )
+        image = await upload.read()
+        prompt = form.get("prompt")
+        return image, mime_type, prompt if isinstance(prompt, str) else None
+
+    if content_type != "application/json":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content type: {content_type}",
+        )
+
+    try:
+        body = VLMRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    return body.base64_image, "image/jpeg", body.prompt
+
+
+def session_id_header(
+    session_id: Optional[str] = Header(
+        None,
+        alias="X-Session-Id",
+        description="Record the scene analyses under this session for later synthesis",
+    ),
+) -> Optional[str]:
+    if session_id is None:
+        return None
+    try:
+        return validate_session_id(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+async def record_scenes(session_id: Optional[str], analyses: list):
+    """
+    Add the scene analyses to the session's scene memory. Custom-prompt
+    output and the SCENE_UNCLEAR fallback (open breaker, unparseable
+    output) aren't scenes, so later syntheses must not read them as context.
+    """
+    if session_id is None:
+        return
+    for analysis in analyses:
+        if isinstance(analysis, SceneAnalysis) and analysis is not SCENE_UNCLEAR:
+            await scene_store.add(session_id, analysis)
+
+
+async def synthesis_scenes(request: SynthesisRequest) -> list[SceneInput]:
+    """
+    The scene analyses to synthesize from: the session's recent scenes, if a
+    session is given, followed by those sent in the request.
+    """
+    if request.session_id is None:
+        return request.surrounding_analysis
+    recorded = await scene_store.recent(
+        request.session_id, request.session_window_seconds
+    )
+    return [*recorded, *request.surrounding_analysis]
+
+
+@app.get("/metrics", tags=["Health"], response_class=Response)
+async def prometheus_metrics():
+    """Prometheus metrics, aggregated across gunicorn workers"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health", tags=["Health"])
 async def health():
     """Health check endpoint"""
@@ -135,7 +639,39 @@ async def health():
         "endpoints": {
             "vlm": "/api/vlm",
             "transcription_analysis": "/api/transcription-analysis",
+            "transcription_analysis_partial": "/api/transcription-analysis/partial",
             "synthesis": "/api/synthesize",
+            "synthesis_stream": "/api/synthesize/stream",
+            "pipeline": "/api/pipeline",
+            "pipeline_stream": "/api/pipeline/stream",
+            "session": "/api/session",
+            "metrics": "/metrics",
+        },
+        "frame_cache": frame_cache.stats() if frame_cache is not None else None,
+        "response_cache": (
+            response_cache.stats() if response_cache is not None else None
+        ),
+        "transcript_index": (
+            transcript_index.stats() if transcript_index is not None else None
+        ),
+        "scene_store": scene_store.stats(),
+        "vlm_batching": vlm_service.batch_stats(),
+        "upstream": upstream.stats(),
+        "upstream_streams": upstream.stream_stats(),
+        "router": upstream.router.stats(),
+        "circuit_breakers": upstream.circuit_stats(),
+        "sessions": session.stats(),
+        "speculation": (
+            speculative_analysis.stats() if speculative_analysis is not None else None
+        ),
+        "prompts": prompts.prompt_stats(),
+        "generation": generation.profiles(),
+        "structured_output": schemas.stats(),
+        "scheduler": scheduler.stats(),
+        "single_flight": {
+            "vlm": vlm_service.single_flight.stats(),
+            "transcription_analysis": transcription_service.single_flight.stats(),
+            "synthesis": synthesis_service.single_flight.stats(),
         },
     }
 
@@ -145,29 +681,59 @@ async def health():
     response_model=VLMResponse,
     tags=["VLM"],
     summary="Analyze image using Vision Language Model",
-    description="Processes a base64-encoded image and returns scene analysis in JSON format",
+    description="Processes an image (base64 JSON, multipart upload or raw image body) and returns scene analysis in JSON format",
+    openapi_extra={"requestBody": VLM_REQUEST_BODY},
 )
-async def analyze_image(request: VLMRequest, token: str = Depends(verify_token)):
+@timed_endpoint
+async def analyze_image(
+    token: str = Depends(verify_token),
+    vlm_input: tuple[Union[bytes, str], str, Optional[str]] = Depends(
+        read_vlm_request
+    ),
+    session_id: Optional[str] = Depends(session_id_header),
+):
     """
     Analyze an image using the VLM (Vision Language Model).
 
-    - **base64_image**: Base64 encoded image (with or without data URI prefix)
-    - **prompt**: Optional custom prompt to override default system prompt
+    The image can be sent as:
+    - **application/json**: `base64_image` (with or without data URI prefix) and optional `prompt`
+    - **multipart/form-data**: an `image` file field and optional `prompt` field
+    - **image/jpeg** (or png/webp): the raw image as the body, with optional `?prompt=`
+
+    Frames are downscaled to 386x386 and re-encoded before the upstream call; the
+    `X-Frame-Bytes-Saved` response header reports how many bytes that saved. A frame
+    nearly identical to a recent one reuses its analysis (`X-Frame-Cache: hit; distance=N`).
+    With `X-Session-Id`, the analysis is also recorded for that session (see `/api/synthesize`).
 
-    Returns a JSON-formatted scene analysis including hazards, people, actions, objects, and path information.
+    Returns the scene analysis (hazard, people, actions, objects, path, notes, confidence) as a JSON object,
+    and an `alert` (a short sentence to speak right away) when it reports a hazard.
     """
+    image, mime_type, prompt = vlm_input
+    started = time.perf_counter()
     try:
-        response = vlm_service.get_response(
-            base64_image=request.base64_image, prompt=request.prompt
+        with timing.span("preprocess"):
+            frame = await frame_preprocessor.prepare(image, mime_type)
+        response, cache_distance = await vlm_service.analyze_frame(
+            frame.data_uri, frame.phash, prompt=prompt
         )
-        return VLMResponse(response=response)
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing image: {str(e)}",
+        await record_scenes(session_id, [response])
+        alert = HazardAlerts("vlm").add(0, response, started)
+        return Response(
+            VLMResponse(response=response, alert=alert).model_dump_json(
+                exclude={"alert"} if alert is None else None
+            ),
+            media_type="application/json",
+            headers={
+                "X-Frame-Bytes-Saved": str(frame.bytes_saved),
+                "X-Frame-Cache": (
+                    "miss"
+                    if cache_distance is None
+                    else f"hit; distance={cache_distance}"
+                ),
+            },
         )
+    except Exception as e:
+        raise service_error(e, "processing image")
 
 
 @app.post(
@@ -177,6 +743,7 @@ async def analyze_image(request: VLMRequest, token: str = Depends(verify_token))
     summary="Analyze transcript text",
     description="Analyzes a text transcript and returns context, keywords, domain, actions, and tone",
 )
+@timed_endpoint
 async def analyze_transcript(
     request: TranscriptionAnalysisRequest, token: str = Depends(verify_token)
 ):
@@ -185,21 +752,65 @@ async def analyze_transcript(
 
     - **transcript**: The text transcript to analyze
     - **prompt**: Optional custom prompt to override default system prompt
+    - **utterance_id**: The utterance whose partial transcripts were posted to `/api/transcription-analysis/partial`
 
-    Returns a JSON-formatted analysis including context, keywords, domain, actions, tone, and confidence.
+    Returns the analysis (context, keywords, domain, actions, tone, notes, confidence) as a JSON object.
+    With `utterance_id`, `X-Speculation` reports whether the speculative analysis was reused
+    (`hit`, `in_flight`) or the final transcript was analyzed now (`miss`).
     """
     try:
-        analysis = transcription_service.analyze_transcript(
-            transcript=request.transcript, prompt=request.prompt
+        if request.utterance_id is None or speculative_analysis is None:
+            analysis = await transcription_service.analyze_transcript(
+                transcript=request.transcript, prompt=request.prompt
+            )
+            return TranscriptionAnalysisResponse(analysis=analysis)
+        if request.prompt is not None:
+            # speculation only runs with the default prompt
+            await speculative_analysis.discard(request.utterance_id)
+            analysis = await transcription_service.analyze_transcript(
+                transcript=request.transcript, prompt=request.prompt
+            )
+            return TranscriptionAnalysisResponse(analysis=analysis)
+        analysis, outcome = await speculative_analysis.commit(
+            request.utterance_id, request.transcript
+        )
+        return Response(
+            TranscriptionAnalysisResponse(analysis=analysis).model_dump_json(),
+            media_type="application/json",
+            headers={"X-Speculation": outcome},
         )
-        return TranscriptionAnalysisResponse(analysis=analysis)
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error analyzing transcript: {str(e)}",
+        raise service_error(e, "analyzing transcript")
+
+
+@app.post(
+    "/api/transcription-analysis/partial",
+    response_model=PartialTranscriptResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Transcription Analysis"],
+    summary="Post a partial transcript for speculative analysis",
+    description="Starts analyzing the stable part of an utterance while the user is still speaking",
+)
+@timed_endpoint
+async def partial_transcript(
+    request: PartialTranscriptRequest, token: str = Depends(verify_token)
+):
+    """
+    Post the utterance so far, as the speech recognizer currently has it, each
+    time it changes. Words that are unchanged since the previous snapshot (or
+    the whole text, once it ends a sentence) are analyzed in the background;
+    a newer prefix cancels a stale analysis. Commit the final transcript with
+    `utterance_id` on `/api/transcription-analysis` to get the analysis.
+
+    Returns the prefix being analyzed (null while nothing is stable yet).
+    """
+    if speculative_analysis is None:
+        return PartialTranscriptResponse()
+    return PartialTranscriptResponse(
+        speculating=await speculative_analysis.snapshot(
+            request.utterance_id, request.transcript
         )
+    )
 
 
 @app.post(
@@ -209,29 +820,306 @@ async def analyze_transcript(
     summary="Synthesize transcription and visual analyses",
     description="Combines transcription analysis and visual scene analyses into a conversational response",
 )
+@timed_endpoint
 async def synthesize(request: SynthesisRequest, token: str = Depends(verify_token)):
     """
     Synthesize transcription analysis and visual scene analyses into a conversational response.
 
-    - **transcription_analysis**: JSON string containing the transcription analysis result
-    - **surrounding_analysis**: List of JSON strings containing VLM analysis results from multiple frames
+    - **transcription_analysis**: The transcription analysis object (or a JSON string)
+    - **surrounding_analysis**: VLM analysis objects (or JSON strings) from multiple frames
+    - **session_id**: Use the session's scenes from the last `session_window_seconds` instead of resending them
 
     Returns a natural, conversational response that combines the audio context with the visual scene information,
     suitable for speaking to the user.
     """
     try:
-        response = synthesis_service.synthesize(
+        response = await synthesis_service.synthesize(
             transcription_analysis=request.transcription_analysis,
-            surrounding_analysis=request.surrounding_analysis,
+            surrounding_analysis=await synthesis_scenes(request),
         )
         return SynthesisResponse(response=response)
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error synthesizing response: {str(e)}",
+        raise service_error(e, "synthesizing response")
+
+
+@app.post(
+    "/api/synthesize/stream",
+    tags=["Synthesis"],
+    summary="Stream a synthesized response as Server-Sent Events",
+    description="Same input as /api/synthesize; streams the response as it is generated",
+    response_class=StreamingResponse,
+)
+@timed_endpoint
+async def synthesize_stream(
+    request: SynthesisRequest,
+    chunking: Literal["sentence", "token"] = Query(
+        "sentence", description="Emit whole sentences or raw model deltas"
+    ),
+    token: str = Depends(verify_token),
+):
+    """
+    Stream a conversational response as Server-Sent Events (`text/event-stream`).
+
+    - **chunk** events carry `{"text": ...}`: a sentence, or a raw delta with `chunking=token`
+    - the final **done** event carries token `usage` and `timing` (time to first chunk, total)
+    - an **error** event is sent if the upstream stream fails after it has started
+    """
+    started = time.perf_counter()
+    try:
+        stream = await synthesis_service.synthesize_stream(
+            transcription_analysis=request.transcription_analysis,
+            surrounding_analysis=await synthesis_scenes(request),
+        )
+    except Exception as e:
+        raise service_error(e, "synthesizing response")
+
+    return StreamingResponse(
+        stream_synthesis_events(stream, started, chunking=chunking),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.post(
+    "/api/pipeline",
+    response_model=PipelineResponse,
+    response_model_exclude_none=True,
+    tags=["Pipeline"],
+    summary="Analyze transcript and frames, then synthesize, in one call",
+    description="Runs transcription analysis and per-frame VLM analysis concurrently and synthesizes a conversational response",
+)
+@timed_endpoint
+async def pipeline(
+    request: PipelineRequest,
+    token: str = Depends(verify_token),
+    session_id: Optional[str] = Depends(session_id_header),
+):
+    """
+    Run the full transcription -> VLM -> synthesis flow in a single request.
+
+    - **transcript**: The text transcript to analyze
+    - **frames**: Base64 encoded images, in capture order
+    - **include_intermediate**: Also return the intermediate analyses
+
+    The transcription analysis and all frame analyses run in parallel (bounded by
+    `PIPELINE_MAX_CONCURRENCY`), so latency is roughly the slowest stage plus synthesis.
+    With `X-Session-Id`, the frame analyses are recorded for that session.
+    Hazards in the frames are returned as short `alerts` to speak before the response.
+    """
+    started = time.perf_counter()
+    alerts = HazardAlerts("pipeline")
+    try:
+        result = await pipeline_service.run(
+            transcript=request.transcript,
+            frames=request.frames,
+            on_scene=lambda i, analysis: alerts.add(i, analysis, started),
+        )
+        await record_scenes(session_id, result.surrounding_analysis)
+        if not request.include_intermediate:
+            response = PipelineResponse(
+                response=result.response, alerts=alerts.alerts or None
+            )
+        else:
+            response = PipelineResponse(
+                response=result.response,
+                transcription_analysis=result.transcription_analysis,
+                surrounding_analysis=result.surrounding_analysis,
+                alerts=alerts.alerts or None,
+            )
+        return Response(
+            response.model_dump_json(exclude_none=True),
+            media_type="application/json",
+            headers={"X-Frame-Bytes-Saved": str(result.bytes_saved)},
+        )
+    except Exception as e:
+        raise service_error(e, "running pipeline")
+
+
+@app.post(
+    "/api/pipeline/stream",
+    tags=["Pipeline"],
+    summary="Run the pipeline and stream the synthesized response as Server-Sent Events",
+    description="Same input as /api/pipeline; streams the synthesis as it is generated",
+    response_class=StreamingResponse,
+)
+@timed_endpoint
+async def pipeline_stream(
+    request: PipelineRequest,
+    chunking: Literal["sentence", "token"] = Query(
+        "sentence", description="Emit whole sentences or raw model deltas"
+    ),
+    token: str = Depends(verify_token),
+    session_id: Optional[str] = Depends(session_id_header),
+):
+    """
+    Streaming variant of `/api/pipeline`.
+
+    An **alert** event (`{"frame", "hazard", "text"}`) is sent as soon as a frame
+    analysis reports a hazard, while the transcript and other frames are still
+    being analyzed; synthesis continues regardless. With `include_intermediate`,
+    an **analysis** event with the transcription and frame analyses follows.
+    The rest of the stream matches `/api/synthesize/stream`.
+    """
+    started = time.perf_counter()
+    alerts = HazardAlerts("pipeline")
+    run = asyncio.ensure_future(
+        pipeline_service.run_stream(
+            transcript=request.transcript,
+            frames=request.frames,
+            on_scene=lambda i, analysis: alerts.add(i, analysis, started),
+        )
+    )
+
+    def analysis_prelude(result) -> list[str]:
+        if not request.include_intermediate:
+            return []
+        return [
+            format_sse(
+                "analysis",
+                {
+                    "transcription_analysis": result.transcription_analysis,
+                    "surrounding_analysis": result.surrounding_analysis,
+                },
+            )
+        ]
+
+    try:
+        # respond as soon as there is an alert to send, or else once synthesis starts
+        await asyncio.wait({run, alerts.first}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        run.cancel()
+        raise
+
+    if run.done():
+        try:
+            result, stream = run.result()
+            await record_scenes(session_id, result.surrounding_analysis)
+        except Exception as e:
+            raise service_error(e, "running pipeline")
+        prelude = [format_sse("alert", alert) for alert in alerts.alerts]
+        return StreamingResponse(
+            stream_synthesis_events(
+                stream,
+                started,
+                chunking=chunking,
+                prelude=prelude + analysis_prelude(result),
+            ),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "X-Frame-Bytes-Saved": str(result.bytes_saved)},
+        )
+
+    async def events():
+        relayed = False
+        try:
+            async for alert in alerts.follow(run):
+                yield format_sse("alert", alert)
+            try:
+                result, stream = run.result()
+                await record_scenes(session_id, result.surrounding_analysis)
+            except Exception as e:
+                # the status line is already sent; report the failure in the stream
+                metrics.record_error("stream", e)
+                yield format_sse("error", {"detail": f"Error running pipeline: {str(e)}"})
+                return
+            relayed = True
+            async for event in stream_synthesis_events(
+                stream, started, chunking=chunking, prelude=analysis_prelude(result)
+            ):
+                yield event
+        finally:
+            if not run.done():
+                # the client went away while frames were still being analyzed
+                run.cancel()
+            elif not relayed and not run.cancelled() and run.exception() is None:
+                await run.result()[1].close()
+
+    # X-Frame-Bytes-Saved isn't known yet: the frames are still being analyzed
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+# Browsers can't set headers on a WebSocket handshake, so they offer the
+# subprotocols ["bearer", <token>] instead (never a query parameter, which
+# ends up in access logs)
+WS_AUTH_SUBPROTOCOL = "bearer"
+
+
+def _websocket_token(websocket: WebSocket) -> Optional[str]:
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    subprotocols = websocket.scope.get("subprotocols", [])
+    if len(subprotocols) == 2 and subprotocols[0] == WS_AUTH_SUBPROTOCOL:
+        return subprotocols[1]
+    return None
+
+
+@app.websocket("/api/session")
+async def live_session(websocket: WebSocket):
+    """
+    Long-lived session for a device: frames and transcript chunks stream in
+    over one connection, scene analyses and the synthesized reply stream back
+    (see LiveSession for the message protocol).
+
+    Authenticate with `Authorization: Bearer <token>` on the handshake, or
+    where headers can't be set with the subprotocols `["bearer", <token>]`
+    (`bearer` is selected). `X-Priority` and
+    `X-Generation-Profile` on the handshake apply to the whole session.
+    `?session_id=` (or `X-Session-Id`) reuses a session id, sharing its
+    scene memory with the HTTP endpoints; otherwise one is generated.
+    """
+    if AUTH_TOKEN and _websocket_token(websocket) != AUTH_TOKEN:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        _, priority, profile = request_options(websocket.headers)
+        session_id = websocket.query_params.get(
+            "session_id", websocket.headers.get("x-session-id")
+        )
+        if session_id is not None:
+            validate_session_id(session_id)
+    except ValueError as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+        return
+
+    await websocket.accept(
+        subprotocol=(
+            WS_AUTH_SUBPROTOCOL
+            if WS_AUTH_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+            else None
         )
+    )
+    # tasks started by the session inherit these
+    set_priority(priority)
+    generation.set_profile(profile)
+    live = session.LiveSession(
+        pipeline_service,
+        scene_store,
+        lambda message: websocket.send_text(encode_json(message)),
+        session_id=session_id,
+        speculation=speculative_analysis,
+    )
+    metrics.SESSIONS_ACTIVE.inc()
+    try:
+        await live.send({"type": "ready", "session_id": live.id})
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    websocket.receive(), c.SESSION_IDLE_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle")
+                break
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await live.handle_bytes(message["bytes"])
+            elif message.get("text") is not None:
+                await live.handle_text(message["text"])
+    finally:
+        await live.close()
+        metrics.SESSIONS_ACTIVE.dec()
 
 
 if __name__ == "__main__":
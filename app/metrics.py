@@ -0,0 +1,130 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+# (see gunicorn_conf.py) and /metrics merges them, whichever worker serves it.
+# Gauges use "livesum" so values from dead workers drop out.
+
+# Request latency buckets: from cache hits up to the 55 s request budget
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 12, 20)
+
+REQUEST_LATENCY = Histogram(
+    "jarvis_request_duration_seconds",
+    "Time to respond to an API request (to the first byte for streams)",
+    ["endpoint", "method", "status"],
+    buckets=REQUEST_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "jarvis_requests_in_flight",
+    "API requests being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+SESSIONS_ACTIVE = Gauge(
+    "jarvis_sessions_active",
+    "Open /api/session WebSocket connections",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "jarvis_upstream_duration_seconds",
+    "Latency of one Groq chat completion request (to the first chunk for streams)",
+    ["model", "stage", "profile", "outcome"],
+    buckets=UPSTREAM_BUCKETS,
+)
+HAZARD_ALERT_LATENCY = Histogram(
+    "jarvis_hazard_alert_seconds",
+    "Time from receiving a frame (or request) to raising its hazard alert",
+    ["source"],
+    buckets=UPSTREAM_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "jarvis_upstream_in_flight",
+    "Groq calls admitted by the scheduler and not yet finished",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_QUEUED = Gauge(
+    "jarvis_upstream_queued",
+    "Groq calls waiting in the scheduler queue",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+TOKENS = Counter(
+    "jarvis_upstream_tokens",
+    "Tokens reported in completion usage",
+    ["model", "kind"],
+)
+COMPLETIONS = Counter(
+    "jarvis_upstream_completions",
+    "Finished completions by finish reason (\"length\": cut off at max_completion_tokens)",
+    ["model", "stage", "profile", "finish_reason"],
+)
+ROUTER_DECISIONS = Counter(
+    "jarvis_router_decisions",
+    "Models picked by the router and why the primary was passed over",
+    ["stage", "model", "reason"],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "jarvis_circuit_transitions",
+    "Circuit breaker state changes per model (\"open\": tripped, \"closed\": recovered)",
+    ["model", "state"],
+)
+CIRCUIT_REJECTED = Counter(
+    "jarvis_circuit_rejected",
+    "Upstream calls failed fast because the model's circuit breaker was open",
+    ["model", "stage"],
+)
+SPECULATION_COMMITS = Counter(
+    "jarvis_speculation_commits",
+    "Final transcripts committed, by whether the speculative analysis was reused",
+    ["outcome"],
+)
+ERRORS = Counter(
+    "jarvis_errors",
+    "Errors by where they surfaced and exception class",
+    ["source", "error"],
+)
+
+
+def record_usage(model: str, usage):
+    """
+    Count prompt and completion tokens from a completion's `usage`, if any.
+    """
+    if usage is None:
+        return
+    TOKENS.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+    TOKENS.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+
+def record_completion(model: str, stage: str, profile: str, finish_reason: str):
+    COMPLETIONS.labels(model, stage, profile, finish_reason or "unknown").inc()
+
+
+def record_error(source: str, error: BaseException):
+    ERRORS.labels(source, type(error).__name__).inc()
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Serialize all metrics in the Prometheus text format.
+
+    Returns:
+        The body and its content type
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
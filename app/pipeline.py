@@ -0,0 +1,134 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import config as c
+from .vlm import VLM
+from .transcriptionanalysis import TranscriptionAnalysis
+from .llmsynthesis import LLMSynthesis, SynthesisStream
+from .imageprocessing import FramePreprocessor
+from .schemas import SceneInput, TranscriptInput
+from . import timing
+
+
+@dataclass
+class PipelineResult:
+    transcription_analysis: TranscriptInput
+    surrounding_analysis: list[SceneInput]
+    bytes_saved: int = 0
+    response: Optional[str] = None  # None until synthesized (or when streaming)
+
+
+class Pipeline:
+    """
+    Runs transcription analysis and VLM analysis of the frames concurrently, then
+    feeds both into synthesis, all within a single request.
+    """
+
+    def __init__(
+        self,
+        vlm: VLM,
+        transcription: TranscriptionAnalysis,
+        synthesis: LLMSynthesis,
+        preprocessor: FramePreprocessor,
+        max_concurrency: int = c.PIPELINE_MAX_CONCURRENCY,
+    ):
+        self.vlm = vlm
+        self.transcription = transcription
+        self.synthesis = synthesis
+        self.preprocessor = preprocessor
+        self.max_concurrency = max_concurrency
+
+    async def analyze(
+        self,
+        transcript: str,
+        frames: list[str],
+        on_scene: Optional[Callable[[int, SceneInput], None]] = None,
+    ) -> PipelineResult:
+        """
+        Fan out the transcription analysis and the VLM analysis of the frames
+        (batched, see `VLM.get_responses`).
+
+        Args:
+            transcript: The text transcript to analyze
+            frames: Base64 encoded images (with or without data URI prefix)
+            on_scene: Called with (frame index, analysis) as soon as each frame is analyzed
+
+        Returns:
+            A PipelineResult with the transcription analysis and the VLM analyses in frame order
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def analyze_transcript():
+            async with semaphore:
+                return await self.transcription.analyze_transcript(
+                    transcript=transcript
+                )
+
+        async def analyze_frames():
+            # preprocessing is bounded by its process pool, not the upstream limit
+            with timing.span("preprocess"):
+                prepared = await asyncio.gather(
+                    *[self.preprocessor.prepare(frame) for frame in frames]
+                )
+            analyses = await self.vlm.analyze_frames(
+                [(frame.data_uri, frame.phash) for frame in prepared],
+                semaphore=semaphore,
+                on_result=on_scene,
+            )
+            return analyses, sum(frame.bytes_saved for frame in prepared)
+
+        tasks = [
+            asyncio.ensure_future(analyze_transcript()),
+            asyncio.ensure_future(analyze_frames()),
+        ]
+
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # one failed stage fails the request; don't leave the rest running
+            for task in tasks:
+                task.cancel()
+            raise
+
+        surrounding_analysis, bytes_saved = results[1]
+        return PipelineResult(
+            transcription_analysis=results[0],
+            surrounding_analysis=surrounding_analysis,
+            bytes_saved=bytes_saved,
+        )
+
+    async def run(
+        self,
+        transcript: str,
+        frames: list[str],
+        on_scene: Optional[Callable[[int, SceneInput], None]] = None,
+    ) -> PipelineResult:
+        """
+        Analyze the transcript and frames, then synthesize the spoken response.
+        """
+        result = await self.analyze(transcript, frames, on_scene)
+        result.response = await self.synthesis.synthesize(
+            transcription_analysis=result.transcription_analysis,
+            surrounding_analysis=result.surrounding_analysis,
+        )
+        return result
+
+    async def run_stream(
+        self,
+        transcript: str,
+        frames: list[str],
+        on_scene: Optional[Callable[[int, SceneInput], None]] = None,
+    ) -> tuple[PipelineResult, SynthesisStream]:
+        """
+        Analyze the transcript and frames, then start a streamed synthesis.
+
+        Returns:
+            The PipelineResult (without `response`) and the synthesis stream
+        """
+        result = await self.analyze(transcript, frames, on_scene)
+        stream = await self.synthesis.synthesize_stream(
+            transcription_analysis=result.transcription_analysis,
+            surrounding_analysis=result.surrounding_analysis,
+        )
+        return result, stream
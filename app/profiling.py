@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from typing import Optional
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional: pip install pyinstrument
+    Profiler = None
+
+import config as c
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-jarvis-profile"
+
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler for slow requests, enabled by setting
+    JARVIS_PROFILE_DIR. A request is profiled when an authenticated client
+    sends `X-Jarvis-Profile: 1` or with probability JARVIS_PROFILE_SAMPLE_RATE;
+    sampled requests are only written out when slower than
+    JARVIS_PROFILE_MIN_MS. Profiles are pyinstrument HTML call trees, one file
+    per request. At most one request per worker is profiled at a time.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        sample_rate: float = None,
+        min_duration_ms: float = None,
+    ):
+        self.directory = directory or os.environ.get("JARVIS_PROFILE_DIR")
+        self.sample_rate = (
+            sample_rate
+            if sample_rate is not None
+            else float(
+                os.environ.get("JARVIS_PROFILE_SAMPLE_RATE", c.PROFILE_SAMPLE_RATE)
+            )
+        )
+        self.min_duration_ms = (
+            min_duration_ms
+            if min_duration_ms is not None
+            else float(os.environ.get("JARVIS_PROFILE_MIN_MS", c.PROFILE_MIN_DURATION_MS))
+        )
+        self._active = False
+        if self.directory and Profiler is None:
+            logger.warning("JARVIS_PROFILE_DIR is set but pyinstrument is not installed")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and Profiler is not None
+
+    def start(self, headers, authenticated: bool) -> Optional[tuple["Profiler", bool]]:
+        """
+        Start profiling the current request if it is selected. The header is
+        only honored with a valid API token (the middleware runs before
+        authentication): forced profiles cost CPU and a file on disk each.
+
+        Returns:
+            The running profiler and whether the client asked for it, or None
+        """
+        if not self.enabled or self._active:
+            return None
+        forced = authenticated and headers.get(PROFILE_HEADER) == "1"
+        if not forced and random.random() >= self.sample_rate:
+            return None
+        profiler = Profiler(interval=c.PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+        profiler.start()
+        self._active = True
+        return profiler, forced
+
+    async def finish(self, profile: tuple["Profiler", bool], label: str, seconds: float):
+        """
+        Stop the profiler and write its call tree if the request was forced or slow.
+        """
+        profiler, forced = profile
+        profiler.stop()
+        self._active = False
+        duration_ms = seconds * 1000
+        if not forced and duration_ms < self.min_duration_ms:
+            return
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", label).strip("-") or "root"
+        path = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{slug}-{duration_ms:.0f}ms.html",
+        )
+        await asyncio.to_thread(self._write, profiler, path)
+
+    def _write(self, profiler: "Profiler", path: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", path, e)
@@ -0,0 +1,159 @@
+import json
+import re
+from typing import Optional, Union
+
+from pydantic import BaseModel
+
+import config as c
+from .schemas import NO_HAZARD
+from .tokens import estimate_tokens
+
+
+def compact_prompt(text: str) -> str:
+    """
+    Minify a JSON system prompt and drop the sections in PROMPT_DROP_KEYS
+    (notes for us, not instructions for the model). Prompts that aren't
+    valid JSON only have their line indentation removed.
+    """
+    try:
+        prompt = json.loads(text)
+    except ValueError:
+        return re.sub(r"\s*\n\s*", " ", text.strip())
+    if isinstance(prompt, dict):
+        for key in c.PROMPT_DROP_KEYS:
+            prompt.pop(key, None)
+    return json.dumps(prompt, separators=(",", ":"), ensure_ascii=False)
+
+
+def _compile(text: str) -> str:
+    return compact_prompt(text) if c.PROMPT_COMPACTION_ENABLED else text
+
+
+# Compiled once at import; these are what is sent upstream
+VLM_SYSTEM_PROMPT = _compile(c.GROQ_VLM_SYSTEM_PROMPT)
+VLM_BATCH_INSTRUCTIONS = _compile(c.GROQ_VLM_BATCH_INSTRUCTIONS)
+TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT = _compile(
+    c.GROQ_TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT
+)
+SYNTHESIS_SYSTEM_PROMPT = _compile(c.GROQ_SYNTHESIS_SYSTEM_PROMPT)
+
+_SOURCES = {
+    "vlm": (c.GROQ_VLM_SYSTEM_PROMPT, VLM_SYSTEM_PROMPT),
+    "transcription_analysis": (
+        c.GROQ_TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT,
+        TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT,
+    ),
+    "synthesis": (c.GROQ_SYNTHESIS_SYSTEM_PROMPT, SYNTHESIS_SYSTEM_PROMPT),
+}
+_prompt_stats = {
+    name: {
+        "raw_tokens": estimate_tokens(raw),
+        "compact_tokens": estimate_tokens(compiled),
+    }
+    for name, (raw, compiled) in _SOURCES.items()
+}
+
+
+def prompt_stats() -> dict:
+    """
+    Estimated token counts of each system prompt before and after compaction.
+    """
+    return _prompt_stats
+
+
+def _minify(analysis: Union[str, BaseModel]) -> tuple[str, Optional[dict]]:
+    if isinstance(analysis, BaseModel):
+        return analysis.model_dump_json(), analysis.model_dump()
+    try:
+        parsed = json.loads(analysis)
+    except ValueError:
+        return " ".join(analysis.split()), None
+    text = json.dumps(parsed, separators=(",", ":"), ensure_ascii=False)
+    return text, parsed if isinstance(parsed, dict) else None
+
+
+def compact_json(analysis: Union[str, BaseModel]) -> str:
+    """
+    Minify a JSON document or typed analysis (whitespace only, key order
+    kept); other text has its whitespace collapsed.
+    """
+    return _minify(analysis)[0]
+
+
+def _has_hazard(parsed: Optional[dict]) -> bool:
+    if parsed is None:
+        return False
+    return str(parsed.get("hazard", "none")).strip().lower() not in NO_HAZARD
+
+
+def _frame_label(numbers: list[int]) -> str:
+    """
+    "Frame 3", or "Frames 1-3" for a run of frames that were collapsed together.
+    """
+    if len(numbers) == 1:
+        return f"Frame {numbers[0]}"
+    return f"Frames {numbers[0]}-{numbers[-1]}"
+
+
+def compact_frames(
+    surrounding_analysis: list[Union[str, BaseModel]], max_tokens: Optional[int] = None
+) -> list[str]:
+    """
+    Shrink the frame analyses sent to synthesis: minify each one, collapse
+    runs of consecutive frames that say the same thing (ignoring
+    `confidence`) into one labelled entry, and fit the result into
+    `max_tokens`. A scene that changes and changes back gets an entry per
+    run, so the last entry is always the latest state. When over budget, frames
+    reporting a hazard are kept first, then the most recent ones; the result
+    stays in frame order.
+
+    Args:
+        surrounding_analysis: VLM analyses (SceneAnalysis or JSON strings) in frame order
+        max_tokens: Token budget (default SYNTHESIS_CONTEXT_MAX_TOKENS)
+
+    Returns:
+        Lines of the form "Frame N: {...}" / "Frames 1-3: {...}"
+    """
+    max_tokens = max_tokens if max_tokens is not None else c.SYNTHESIS_CONTEXT_MAX_TOKENS
+
+    # collapse runs of identical frames; a run keeps its latest frame's text
+    groups: list[dict] = []
+    for number, analysis in enumerate(surrounding_analysis, start=1):
+        text, parsed = _minify(analysis)
+        if parsed is not None:
+            key = json.dumps(
+                {k: v for k, v in parsed.items() if k != "confidence"},
+                sort_keys=True,
+                ensure_ascii=False,
+            )
+        else:
+            key = text
+        if not groups or groups[-1]["key"] != key:
+            groups.append({"key": key, "numbers": [], "hazard": _has_hazard(parsed)})
+        group = groups[-1]
+        group["numbers"].append(number)
+        group["text"] = text
+
+    entries = [
+        {
+            "line": f"{_frame_label(group['numbers'])}: {group['text']}",
+            "last": group["numbers"][-1],
+            "hazard": group["hazard"],
+        }
+        for group in groups
+    ]
+
+    # spend the budget on hazards first, then on the most recent frames
+    keep, used = set(), 0
+    by_priority = sorted(
+        range(len(entries)),
+        key=lambda i: (not entries[i]["hazard"], -entries[i]["last"]),
+    )
+    for i in by_priority:
+        cost = estimate_tokens(entries[i]["line"])
+        if keep and used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+
+    return [entry["line"] for i, entry in enumerate(entries) if i in keep]
@@ -0,0 +1,309 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import config as c
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """
+    The request's latency budget ran out before an upstream call could finish.
+    """
+
+
+class CircuitOpen(Exception):
+    """
+    A model's circuit breaker is open; the caller should retry after `retry_after` seconds.
+    """
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Circuit open for {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must be answered.
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+# Deadline of the request being handled; read by every upstream call it makes
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "current_deadline", default=None
+)
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    return _current_deadline.set(deadline)
+
+
+def reset_deadline(token):
+    _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2^(attempt-1))].
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def percentile(ordered: list[float], p: float) -> Optional[float]:
+    """
+    The p-th percentile (0-100) of already sorted values (nearest rank), or
+    None when there are none.
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class LatencyTracker:
+    """
+    Rolling window of recent call latencies, for percentile-based hedging.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        The p-th percentile (0-100) of the window, or None when it is empty.
+        """
+        return percentile(sorted(self._samples), p)
+
+
+class OutcomeTracker:
+    """
+    Rolling window of recent call outcomes, for error-rate based routing.
+    """
+
+    def __init__(self, window: int = 50):
+        self._outcomes: deque[bool] = deque(maxlen=window)
+
+    def observe(self, ok: bool):
+        self._outcomes.append(ok)
+
+    def __len__(self) -> int:
+        return len(self._outcomes)
+
+    def error_rate(self) -> Optional[float]:
+        """
+        Fraction of failed calls in the window, or None when it is empty.
+        """
+        if not self._outcomes:
+            return None
+        return self._outcomes.count(False) / len(self._outcomes)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream model, over a rolling window of its
+    recent calls (the last `window` calls, no older than `window_seconds`).
+
+    Closed: calls go through, and once the window holds `min_calls` the
+    breaker opens when the share of failed calls exceeds `max_error_rate`
+    or the share of slow ones exceeds `max_slow_rate`. Open: calls are
+    rejected for `open_seconds`. Half-open: one probe call is let through
+    every `probe_interval` seconds; `close_after` successful probes close
+    the breaker, a failed or slow probe opens it again.
+    """
+
+    def __init__(
+        self,
+        window: int = c.CIRCUIT_WINDOW_CALLS,
+        window_seconds: float = c.CIRCUIT_WINDOW_SECONDS,
+        min_calls: int = c.CIRCUIT_MIN_CALLS,
+        max_error_rate: float = c.CIRCUIT_MAX_ERROR_RATE,
+        max_slow_rate: float = c.CIRCUIT_MAX_SLOW_RATE,
+        open_seconds: float = c.CIRCUIT_OPEN_SECONDS,
+        probe_interval: float = c.CIRCUIT_PROBE_INTERVAL_SECONDS,
+        close_after: int = c.CIRCUIT_CLOSE_AFTER_PROBES,
+    ):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.max_error_rate = max_error_rate
+        self.max_slow_rate = max_slow_rate
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        self.close_after = close_after
+        self._calls: deque[tuple[float, bool, bool]] = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        self._next_probe = 0.0
+        self._probe_successes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        "closed", "open" or "half_open".
+        """
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        """
+        Whether a call would be let through now (without taking a probe slot).
+        """
+        state = self.state
+        return state == "closed" or (
+            state == "half_open" and time.monotonic() >= self._next_probe
+        )
+
+    def allow(self) -> bool:
+        """
+        Let a call through, or reject it (False) while the breaker is open
+        or a probe was sent less than `probe_interval` seconds ago.
+        """
+        if not self.available():
+            self.rejected += 1
+            return False
+        if self._opened_at is not None:
+            self._next_probe = time.monotonic() + self.probe_interval
+        return True
+
+    def retry_after(self) -> float:
+        """
+        Seconds until a call may be let through again.
+        """
+        if self._opened_at is None:
+            return 0.0
+        now = time.monotonic()
+        return max(
+            0.0, self._opened_at + self.open_seconds - now, self._next_probe - now
+        )
+
+    def record(self, ok: bool, slow: bool = False) -> Optional[str]:
+        """
+        Count a finished call.
+
+        Args:
+            ok: Whether the call succeeded
+            slow: Whether it took longer than its stage's slow-call threshold
+
+        Returns:
+            "open" or "closed" if the call changed the breaker's state, else None
+        """
+        now = time.monotonic()
+        state = self.state
+        if state == "open":
+            # sent before the breaker opened
+            return None
+        if state == "half_open":
+            if not ok or slow:
+                self._open(now)
+                return "open"
+            self._probe_successes += 1
+            if self._probe_successes < self.close_after:
+                return None
+            self._opened_at = None
+            self._calls.clear()
+            return "closed"
+
+        self._calls.append((now, ok, slow))
+        while self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+        if len(self._calls) < self.min_calls:
+            return None
+        failed = sum(1 for _, ok, _ in self._calls if not ok)
+        slow_calls = sum(1 for _, ok, slow in self._calls if ok and slow)
+        if (
+            failed / len(self._calls) > self.max_error_rate
+            or slow_calls / len(self._calls) > self.max_slow_rate
+        ):
+            self._open(now)
+            return "open"
+        return None
+
+    def _open(self, now: float):
+        self._opened_at = now
+        self._next_probe = now + self.open_seconds
+        self._probe_successes = 0
+        self.trips += 1
+
+    def stats(self) -> dict:
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": (
+                round(sum(1 for _, ok, _ in self._calls if not ok) / calls, 3)
+                if calls
+                else None
+            ),
+            "slow_rate": (
+                round(sum(1 for _, ok, slow in self._calls if ok and slow) / calls, 3)
+                if calls
+                else None
+            ),
+            "retry_after_seconds": round(self.retry_after(), 2),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+async def hedged(
+    make_call: Callable[[], Awaitable[T]], delay: float
+) -> tuple[T, bool]:
+    """
+    Run `make_call()`; if it hasn't finished after `delay` seconds, start a
+    second identical call and take whichever succeeds first. Calls still
+    running when this returns or is cancelled are cancelled.
+
+    Returns:
+        The result and whether a hedge request was sent
+    """
+    pending = {asyncio.ensure_future(make_call())}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return done.pop().result(), False
+
+        pending.add(asyncio.ensure_future(make_call()))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            # let them release their scheduler slots before we go
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import config as c
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize free text for cache keys: case-folded, whitespace collapsed.
+    """
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def normalize_json(text: str) -> str:
+    """
+    Normalize a JSON document for cache keys (sorted keys, no whitespace),
+    falling back to `normalize_text` when it isn't valid JSON.
+    """
+    try:
+        return json.dumps(
+            json.loads(text), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+    except ValueError:
+        return normalize_text(text)
+
+
+def cache_key(model: str, profile: str, system_prompt: str, *inputs: str) -> str:
+    """
+    Content address of a model call: the model, the generation profile (its
+    sampling parameters change the output), the effective system prompt and
+    the already-normalized inputs.
+    """
+    digest = hashlib.sha256()
+    for part in (model, profile, system_prompt, *inputs):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU with TTL and a byte budget. Private to one worker.
+    """
+
+    blocking = False
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._remove(key)
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._bytes += len(key) + len(value)
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(key) + len(entry[0])
+
+
+class SQLiteBackend:
+    """
+    Base for backends in a SQLite file (WAL mode) shared by every gunicorn
+    worker on the host. Calls block, so they are run in a thread.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per thread and per process (workers fork after import)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SQLiteCacheBackend(SQLiteBackend):
+    """
+    LRU with TTL and a byte budget in a SQLite file, so every gunicorn
+    worker on the host shares the same entries.
+    """
+
+    EVICT_EVERY = 64  # writes between budget checks in this process
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(key) + len(value), now + self.ttl, now),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        total, rows = conn.execute("SELECT TOTAL(size), COUNT(*) FROM cache").fetchone()
+        if total <= self.max_bytes or not rows:
+            return
+        # drop the least recently used rows, sized from the average row
+        excess_rows = int((total - self.max_bytes) / (total / rows)) + 1
+        conn.execute(
+            "DELETE FROM cache WHERE key IN"
+            " (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+            (excess_rows,),
+        )
+
+
+class ResponseCache:
+    """
+    Async front for a cache backend, with per-worker hit/miss counters.
+    Backend failures are treated as misses so the cache never fails a request.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self._call(self.backend.get, key)
+        except sqlite3.Error:
+            self.errors += 1
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str):
+        try:
+            await self._call(self.backend.set, key, value)
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the response cache configured by RESPONSE_CACHE_BACKEND, if any.
+    """
+    if c.RESPONSE_CACHE_BACKEND == "sqlite":
+        backend = SQLiteCacheBackend(
+            c.RESPONSE_CACHE_PATH,
+            c.RESPONSE_CACHE_MAX_BYTES,
+            c.RESPONSE_CACHE_TTL_SECONDS,
+        )
+    elif c.RESPONSE_CACHE_BACKEND == "memory":
+        backend = MemoryCacheBackend(
+            c.RESPONSE_CACHE_MAX_BYTES, c.RESPONSE_CACHE_TTL_SECONDS
+        )
+    else:
+        return None
+    return ResponseCache(backend)
@@ -0,0 +1,152 @@
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Mapping, Optional
+
+import config as c
+from . import generation, metrics
+from .resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    OutcomeTracker,
+    current_deadline,
+)
+from .scheduler import scheduler
+from .tokens import estimate_request_tokens
+
+
+class ModelRouter:
+    """
+    Picks the model for each upstream call from the stage's tier list in
+    ROUTER_TIERS (best first). A model is skipped when it is rate-limited
+    (paused by the scheduler), failing (recent error rate above
+    ROUTER_MAX_ERROR_RATE), cut off by its circuit breaker, or expected to
+    take longer than the stage's ROUTER_STAGE_TARGET_SECONDS or the request's
+    remaining budget. The expected time is the model's recent latency
+    percentile plus how long the scheduler would hold a call of this size, so
+    large inputs move to a model with room in its token budget. If no model
+    qualifies, the one expected to answer soonest is used.
+    """
+
+    def __init__(
+        self,
+        latency: Mapping[str, LatencyTracker],
+        errors: Mapping[str, OutcomeTracker],
+        breakers: Mapping[str, CircuitBreaker],
+    ):
+        self.latency = latency
+        self.errors = errors
+        self.breakers = breakers
+        self._decisions = defaultdict(lambda: defaultdict(int))
+
+    def choose(
+        self, stage: str, model: str, messages: list[dict], outputs: int = 1
+    ) -> str:
+        """
+        The model to send this call to.
+
+        Args:
+            stage: "vlm", "transcription_analysis" or "synthesis"
+            model: The model the caller asked for; only a stage's primary
+                (first tier) is rerouted
+            messages: The chat messages, for the token estimate
+            outputs: Number of answers in the completion (see generation.params)
+        """
+        tiers = c.ROUTER_TIERS.get(stage)
+        if not c.ROUTER_ENABLED or not tiers or model != tiers[0]:
+            return model
+
+        limit = c.ROUTER_STAGE_TARGET_SECONDS.get(stage, math.inf)
+        deadline = current_deadline()
+        if deadline is not None:
+            limit = min(limit, deadline.remaining())
+
+        # keep some traffic on the primary so its latency and error stats recover
+        probe = random.random() < c.ROUTER_PROBE_RATE
+
+        reason = None
+        fastest, fastest_time = tiers[0], math.inf
+        for candidate in tiers:
+            params = generation.params(stage, candidate, outputs)
+            cost = estimate_request_tokens(
+                messages, params.get("max_completion_tokens")
+            )
+            problem, expected = self._check(candidate, cost, limit)
+            if problem is None or (
+                probe
+                and candidate == tiers[0]
+                and problem not in ("rate_limited", "circuit_open")
+            ):
+                chosen = candidate
+                break
+            reason = reason or problem
+            if problem not in ("errors", "circuit_open") and expected < fastest_time:
+                fastest, fastest_time = candidate, expected
+        else:
+            chosen = fastest
+
+        decision = "primary" if chosen == tiers[0] else reason
+        self._decisions[stage][(chosen, decision)] += 1
+        metrics.ROUTER_DECISIONS.labels(stage, chosen, decision).inc()
+        return chosen
+
+    def _check(self, model: str, cost: int, limit: float) -> tuple[Optional[str], float]:
+        """
+        Why `model` shouldn't take a call right now (None if it can), and
+        how long the call is expected to take.
+        """
+        queue = scheduler.queue(model)
+        wait = queue.estimated_wait(cost)
+        tracker = self.latency.get(model)
+        expected = wait
+        if tracker is not None and len(tracker) >= c.ROUTER_MIN_SAMPLES:
+            expected += tracker.percentile(c.ROUTER_LATENCY_PERCENTILE)
+
+        if queue.paused_until > time.monotonic():
+            return "rate_limited", expected
+        breaker = self.breakers.get(model)
+        if c.CIRCUIT_BREAKER_ENABLED and breaker is not None:
+            if not breaker.available():
+                return "circuit_open", expected
+            if breaker.state == "half_open":
+                # a recovery probe is due; its outcome decides if the breaker closes
+                return None, expected
+        outcomes = self.errors.get(model)
+        if outcomes is not None and len(outcomes) >= c.ROUTER_MIN_SAMPLES:
+            if outcomes.error_rate() > c.ROUTER_MAX_ERROR_RATE:
+                return "errors", expected
+        if expected > limit:
+            return "slow", expected
+        return None, expected
+
+    def stats(self) -> dict:
+        models = {model for tiers in c.ROUTER_TIERS.values() for model in tiers}
+        health = {}
+        for model in sorted(models):
+            tracker = self.latency.get(model)
+            outcomes = self.errors.get(model)
+            health[model] = {
+                f"p{c.ROUTER_LATENCY_PERCENTILE}_seconds": (
+                    round(tracker.percentile(c.ROUTER_LATENCY_PERCENTILE), 3)
+                    if tracker is not None and len(tracker)
+                    else None
+                ),
+                "error_rate": (
+                    round(outcomes.error_rate(), 3)
+                    if outcomes is not None and len(outcomes)
+                    else None
+                ),
+            }
+        return {
+            "enabled": c.ROUTER_ENABLED,
+            "tiers": c.ROUTER_TIERS,
+            "models": health,
+            "decisions": {
+                stage: {
+                    f"{model} ({decision})": count
+                    for (model, decision), count in decisions.items()
+                }
+                for stage, decisions in self._decisions.items()
+            },
+        }
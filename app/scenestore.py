@@ -0,0 +1,227 @@
+import asyncio
+import re
+import sqlite3
+import time
+from collections import OrderedDict, deque
+
+import config as c
+from . import prompts
+from .responsecache import SQLiteBackend
+from .schemas import SceneAnalysis
+
+# Session ids are chosen by clients; keep them to something safe to log and index
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def validate_session_id(session_id: str) -> str:
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError(
+            "Session id must be 1-128 letters, digits or . _ : - characters"
+        )
+    return session_id
+
+
+class MemorySceneBackend:
+    """
+    Per-session ring buffers in process memory. Private to one worker.
+    """
+
+    blocking = False
+
+    def __init__(self, max_scenes: int, max_bytes: int, ttl: float):
+        self.max_scenes = max_scenes
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # session id -> (written_at, compact scene JSON); least recently written first
+        self._sessions: OrderedDict[str, deque[tuple[float, str]]] = OrderedDict()
+        self._bytes = 0
+
+    def add(self, session_id: str, scene: str, at: float):
+        scenes = self._sessions.pop(session_id, None)
+        if scenes is None:
+            scenes = deque(maxlen=self.max_scenes)
+            self._bytes += len(session_id)
+        if len(scenes) == self.max_scenes:
+            self._bytes -= len(scenes[0][1])
+        scenes.append((at, scene))
+        self._bytes += len(scene)
+        self._sessions[session_id] = scenes
+        self._evict(at)
+
+    def _evict(self, now: float):
+        # sessions idle past the TTL, then the least recently written ones over budget
+        while self._sessions:
+            session_id, scenes = next(iter(self._sessions.items()))
+            if scenes[-1][0] > now - self.ttl and self._bytes <= self.max_bytes:
+                break
+            self._remove(session_id)
+
+    def _remove(self, session_id: str):
+        scenes = self._sessions.pop(session_id)
+        self._bytes -= len(session_id) + sum(len(scene) for _, scene in scenes)
+
+    def recent(self, session_id: str, since: float, limit: int) -> list[str]:
+        scenes = self._sessions.get(session_id)
+        if not scenes:
+            return []
+        since = max(since, time.time() - self.ttl)
+        return [scene for at, scene in scenes if at >= since][-limit:]
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "bytes": self._bytes}
+
+
+class SQLiteSceneBackend(SQLiteBackend):
+    """
+    Per-session ring buffers in a SQLite file, so a frame analyzed by one
+    gunicorn worker is visible to a synthesis handled by another.
+    """
+
+    EVICT_EVERY = 64  # writes between TTL and budget checks in this process
+
+    def __init__(self, path: str, max_scenes: int, max_bytes: int, ttl: float):
+        super().__init__(path)
+        self.max_scenes = max_scenes
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scenes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,"
+                " at REAL NOT NULL, scene TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS scenes_session ON scenes (session_id, id)"
+            )
+
+    def add(self, session_id: str, scene: str, at: float):
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO scenes (session_id, at, scene) VALUES (?, ?, ?)",
+            (session_id, at, scene),
+        )
+        # keep the ring buffer at max_scenes
+        conn.execute(
+            "DELETE FROM scenes WHERE session_id = ? AND id <= ("
+            " SELECT id FROM scenes WHERE session_id = ?"
+            " ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (session_id, session_id, self.max_scenes),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict(conn, at)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM scenes WHERE at <= ?", (now - self.ttl,))
+        total, rows = conn.execute(
+            "SELECT TOTAL(LENGTH(scene)), COUNT(*) FROM scenes"
+        ).fetchone()
+        if total <= self.max_bytes or not rows:
+            return
+        # drop the oldest scenes, sized from the average row
+        excess_rows = int((total - self.max_bytes) / (total / rows)) + 1
+        conn.execute(
+            "DELETE FROM scenes WHERE id IN"
+            " (SELECT id FROM scenes ORDER BY id LIMIT ?)",
+            (excess_rows,),
+        )
+
+    def recent(self, session_id: str, since: float, limit: int) -> list[str]:
+        conn = self._connect()
+        since = max(since, time.time() - self.ttl)
+        rows = conn.execute(
+            "SELECT scene FROM (SELECT id, scene FROM scenes"
+            " WHERE session_id = ? AND at >= ? ORDER BY id DESC LIMIT ?)"
+            " ORDER BY id",
+            (session_id, since, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class SceneStore:
+    """
+    Recent scene analyses per session id: `/api/vlm`, `/api/pipeline` and
+    `/api/session` add to it, synthesis reads "the last N seconds of session
+    X" from it so clients don't resend `surrounding_analysis`. Scenes are
+    stored as compacted JSON, ready for the synthesis prompt. Backend
+    failures are counted and otherwise ignored, like the response cache's.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.added = 0
+        self.reads = 0
+        self.errors = 0
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def add(self, session_id: str, analysis: SceneAnalysis):
+        try:
+            await self._call(
+                self.backend.add, session_id, prompts.compact_json(analysis), time.time()
+            )
+            self.added += 1
+        except sqlite3.Error:
+            self.errors += 1
+
+    async def recent(
+        self,
+        session_id: str,
+        window_seconds: float = None,
+        limit: int = None,
+    ) -> list[str]:
+        """
+        The session's scenes from the last `window_seconds`, oldest first.
+
+        Args:
+            session_id: The session
+            window_seconds: How far back to look (default SCENE_STORE_DEFAULT_WINDOW_SECONDS)
+            limit: At most this many of the most recent scenes (default SCENE_STORE_MAX_SCENES)
+        """
+        if window_seconds is None:
+            window_seconds = c.SCENE_STORE_DEFAULT_WINDOW_SECONDS
+        self.reads += 1
+        try:
+            return await self._call(
+                self.backend.recent,
+                session_id,
+                time.time() - window_seconds,
+                limit or c.SCENE_STORE_MAX_SCENES,
+            )
+        except sqlite3.Error:
+            self.errors += 1
+            return []
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "added": self.added,
+            "reads": self.reads,
+            "errors": self.errors,
+            # the SQLite file's size isn't queried here, to keep /health non-blocking
+            **(self.backend.stats() if not self.backend.blocking else {}),
+        }
+
+
+def create_scene_store() -> SceneStore:
+    """
+    Build the scene store configured by SCENE_STORE_BACKEND ("sqlite" or "memory").
+    """
+    if c.SCENE_STORE_BACKEND == "sqlite":
+        backend = SQLiteSceneBackend(
+            c.SCENE_STORE_PATH,
+            c.SCENE_STORE_MAX_SCENES,
+            c.SCENE_STORE_MAX_BYTES,
+            c.SCENE_STORE_TTL_SECONDS,
+        )
+    else:
+        backend = MemorySceneBackend(
+            c.SCENE_STORE_MAX_SCENES,
+            c.SCENE_STORE_MAX_BYTES,
+            c.SCENE_STORE_TTL_SECONDS,
+        )
+    return SceneStore(backend)
@@ -0,0 +1,288 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Optional
+
+import config as c
+from . import metrics, timing
+from .resilience import DeadlineExceeded, current_deadline
+
+
+class Priority(IntEnum):
+    HIGH = 0  # VLM frames: the hazard path
+    NORMAL = 1
+    BACKGROUND = 2  # batch jobs, speculative work
+
+
+class SchedulerOverloaded(Exception):
+    """
+    A model's admission queue is full; the caller should retry after `retry_after` seconds.
+    """
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Too many queued requests for {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+
+# Priority requested by the client for the request being handled (X-Priority)
+_request_priority: ContextVar[Optional[Priority]] = ContextVar(
+    "request_priority", default=None
+)
+
+
+def set_priority(priority: Optional[Priority]):
+    return _request_priority.set(priority)
+
+
+def reset_priority(token):
+    _request_priority.reset(token)
+
+
+def current_priority() -> Optional[Priority]:
+    return _request_priority.get()
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "cost", "future")
+
+    def __init__(self, priority: Priority, seq: int, cost: int):
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelQueue:
+    """
+    Admission control for one model: a concurrency limit, a tokens-per-minute
+    token bucket, a pause honoring upstream `retry-after`, and a bounded
+    priority queue for calls that can't start yet.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_concurrency: int,
+        tokens_per_minute: int,
+        max_queue: int,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.capacity = tokens_per_minute
+        self.refill_rate = tokens_per_minute / 60
+        self.max_queue = max_queue
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.rejected = 0
+
+    def _wait_time(self, cost: int) -> float:
+        """
+        Seconds until a call costing `cost` tokens could start (inf: wait for a release).
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= self.max_concurrency:
+            return math.inf
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.refill_rate
+        )
+        self.updated = now
+        # a call larger than the whole bucket may still run once the bucket is full
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.refill_rate
+
+    def _admit(self, cost: int):
+        self.in_flight += 1
+        self.tokens -= cost
+        self.admitted += 1
+        metrics.UPSTREAM_IN_FLIGHT.labels(self.model).inc()
+
+    def estimated_wait(self, cost: int) -> float:
+        """
+        Seconds a new call costing `cost` tokens would wait for admission
+        (inf: it would queue behind calls whose finish time isn't known).
+        """
+        if self.waiters:
+            return math.inf
+        return self._wait_time(cost)
+
+    def retry_after(self) -> float:
+        """
+        Rough estimate of when a rejected caller could be admitted.
+        """
+        return max(
+            c.SCHEDULER_OVERLOAD_RETRY_AFTER_SECONDS,
+            self.paused_until - time.monotonic(),
+        )
+
+    async def acquire(self, cost: int, priority: Priority, timeout: Optional[float]):
+        if not self.waiters and self._wait_time(cost) == 0:
+            self._admit(cost)
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            worst = max(self.waiters)
+            if worst.priority <= priority:
+                self.rejected += 1
+                raise SchedulerOverloaded(self.model, self.retry_after())
+            # a more urgent call displaces the least urgent queued one
+            self.waiters.remove(worst)
+            heapq.heapify(self.waiters)
+            self.rejected += 1
+            worst.future.set_exception(
+                SchedulerOverloaded(self.model, self.retry_after())
+            )
+
+        waiter = _Waiter(priority, next(self._seq), cost)
+        heapq.heappush(self.waiters, waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException as e:
+            future = waiter.future
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # admitted just as we gave up: hand the slot back
+                self.release(cost)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                metrics.UPSTREAM_QUEUED.labels(self.model).set(len(self.waiters))
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(
+                    f"Latency budget exhausted queued for {self.model}"
+                ) from None
+            raise
+
+    def release(self, estimated: int, actual: Optional[int] = None):
+        self.in_flight -= 1
+        metrics.UPSTREAM_IN_FLIGHT.labels(self.model).dec()
+        if actual is not None:
+            # settle the bucket with the real usage; it may go briefly negative
+            self.tokens = min(self.capacity, self.tokens - (actual - estimated))
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        """
+        Stop admitting calls for `seconds` (upstream answered 429 with retry-after).
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self.waiters:
+            head = self.waiters[0]
+            if head.future.done():
+                heapq.heappop(self.waiters)
+                continue
+            wait = self._wait_time(head.cost)
+            if wait == 0:
+                heapq.heappop(self.waiters)
+                self._admit(head.cost)
+                head.future.set_result(None)
+                continue
+            if wait != math.inf:
+                self._timer = asyncio.get_running_loop().call_later(
+                    wait, self._dispatch
+                )
+            break
+        metrics.UPSTREAM_QUEUED.labels(self.model).set(len(self.waiters))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "max_concurrency": self.max_concurrency,
+            "tokens_available": int(self.tokens),
+            "tokens_per_minute": self.capacity,
+            "paused_for_seconds": round(
+                max(0.0, self.paused_until - time.monotonic()), 2
+            ),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class Admission:
+    """
+    Handle for an admitted call; record the real token usage before release.
+    """
+
+    def __init__(self):
+        self.total_tokens: Optional[int] = None
+
+    def record_usage(self, usage):
+        if usage is not None:
+            self.total_tokens = usage.total_tokens
+
+
+class Scheduler:
+    """
+    Per-model admission control in front of every upstream call. Budgets
+    from SCHEDULER_MODEL_LIMITS are split evenly across gunicorn workers.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or int(os.environ.get("JARVIS_WORKERS", "1"))
+        self._queues: dict[str, ModelQueue] = {}
+
+    def queue(self, model: str) -> ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            limits = c.SCHEDULER_MODEL_LIMITS.get(model, c.SCHEDULER_DEFAULT_LIMITS)
+            queue = ModelQueue(
+                model,
+                max_concurrency=max(1, limits["max_concurrency"] // self.workers),
+                tokens_per_minute=max(1, limits["tokens_per_minute"] // self.workers),
+                max_queue=c.SCHEDULER_MAX_QUEUE,
+            )
+            self._queues[model] = queue
+        return queue
+
+    @asynccontextmanager
+    async def slot(self, model: str, cost: int, priority: Priority):
+        """
+        Wait (within the request deadline) until `model` can take a call
+        costing about `cost` tokens, and hold a concurrency slot for it.
+        """
+        queue = self.queue(model)
+        deadline = current_deadline()
+        with timing.span("queue"):
+            await queue.acquire(
+                cost, priority, deadline.remaining() if deadline is not None else None
+            )
+        admission = Admission()
+        try:
+            yield admission
+        finally:
+            queue.release(cost, admission.total_tokens)
+
+    def pause(self, model: str, seconds: float):
+        self.queue(model).pause(seconds)
+
+    def stats(self) -> dict:
+        return {model: queue.stats() for model, queue in self._queues.items()}
+
+
+scheduler = Scheduler()
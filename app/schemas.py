@@ -0,0 +1,161 @@
+import json
+import re
+from collections import defaultdict
+from typing import Optional, TypeVar, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+import config as c
+
+# Values of the VLM "hazard" field that mean there is nothing to warn about
+NO_HAZARD = {"", "none", "no", "n/a"}
+
+
+class _Analysis(BaseModel):
+    """
+    Base for model outputs following an `output_schema` in config.py. Input
+    is coerced leniently, since it comes from a model: null strings become
+    "none", a bare string where a list is expected becomes a one-item list,
+    and a confidence given as a percentage is scaled to 0-1.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _coerce(cls, value, info):
+        field = cls.model_fields[info.field_name]
+        if field.annotation is str:
+            return "none" if value is None else str(value)
+        if field.annotation == list[str]:
+            if value is None or (isinstance(value, str) and value.lower() in NO_HAZARD):
+                return []
+            if isinstance(value, str):
+                return [value]
+            return [str(item) for item in value]
+        return value
+
+    @field_validator("confidence", mode="before", check_fields=False)
+    @classmethod
+    def _scale_confidence(cls, value):
+        if isinstance(value, str):
+            value = float(value.strip().rstrip("%"))
+        if isinstance(value, (int, float)) and 1 < value <= 100:
+            value = value / 100
+        return value
+
+
+class SceneAnalysis(_Analysis):
+    """
+    One frame's VLM analysis (GROQ_VLM_SYSTEM_PROMPT output_schema).
+    """
+
+    hazard: str
+    people: str = "none"
+    actions: list[str] = Field(default_factory=list)
+    objects: list[str] = Field(default_factory=list)
+    path: str = "none"
+    notes: str = "none"
+    confidence: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+    @property
+    def has_hazard(self) -> bool:
+        return self.hazard.strip().lower() not in NO_HAZARD
+
+
+class TranscriptAnalysis(_Analysis):
+    """
+    Transcription analysis (GROQ_TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT output_schema).
+    """
+
+    context: str
+    keywords: list[str] = Field(default_factory=list)
+    domain: str = "none"
+    actions: list[str] = Field(default_factory=list)
+    tone: str = "none"
+    notes: str = "none"
+    confidence: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+
+# Analyses as passed around the services: typed with the default prompts,
+# plain strings with a custom prompt (or from clients sending JSON strings)
+SceneInput = Union[SceneAnalysis, str]
+TranscriptInput = Union[TranscriptAnalysis, str]
+
+# Results used when model output can't be parsed even after repair; these are
+# the prompts' own fallbacks
+SCENE_UNCLEAR = SceneAnalysis.model_validate(
+    json.loads(c.GROQ_VLM_SYSTEM_PROMPT)["fallbacks"]["unclear"]
+)
+TRANSCRIPT_NO_SALIENT = TranscriptAnalysis.model_validate(
+    json.loads(c.GROQ_TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT)["fallbacks"]["no_salient"]
+)
+
+T = TypeVar("T", bound=_Analysis)
+
+_stats = defaultdict(lambda: {"valid": 0, "repaired": 0, "fallback": 0})
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def extract_json(content: str):
+    """
+    Best-effort recovery of a JSON value from model output: strips code
+    fences and surrounding prose, and drops trailing commas.
+
+    Returns:
+        The parsed value, or None if nothing parseable was found
+    """
+    text = _FENCE.sub("", content.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    text = text[start : end + 1]
+    for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_analysis(
+    model: type[T], content: Optional[str], stage: str, fallback: T
+) -> tuple[T, bool]:
+    """
+    Validate a model's JSON output against `model`, repairing it if needed.
+
+    Returns:
+        The analysis and whether it was parsed (False: `fallback` was used)
+    """
+    if content:
+        try:
+            analysis = model.model_validate_json(content)
+            _stats[stage]["valid"] += 1
+            return analysis, True
+        except ValidationError:
+            pass
+        data = extract_json(content)
+        if isinstance(data, dict):
+            try:
+                analysis = model.model_validate(data)
+                _stats[stage]["repaired"] += 1
+                return analysis, True
+            except ValidationError:
+                pass
+    _stats[stage]["fallback"] += 1
+    return fallback, False
+
+
+def to_json(analysis: Union[_Analysis, str]) -> str:
+    """
+    JSON text of an analysis, whether it is typed or already a string.
+    """
+    if isinstance(analysis, BaseModel):
+        return analysis.model_dump_json()
+    return analysis
+
+
+def stats() -> dict:
+    return {stage: dict(values) for stage, values in _stats.items()}
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional, Union
+
+import config as c
+from . import metrics
+from .alerts import HazardAlerts
+from .pipeline import Pipeline
+from .resilience import Deadline, reset_deadline, set_deadline
+from .scenestore import SceneStore
+from .speculation import SpeculativeAnalysis
+from .schemas import SCENE_UNCLEAR, SceneAnalysis
+from .streaming import synthesis_events
+
+_stats = defaultdict(int)
+
+
+def image_mime_type(image: bytes) -> str:
+    """
+    Mime type of a binary frame from its magic bytes (JPEG unless PNG or WebP).
+    """
+    if image.startswith(b"\x89PNG"):
+        return "image/png"
+    if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+class LiveSession:
+    """
+    State of one `/api/session` WebSocket connection: frames are analyzed as
+    they arrive (at most SESSION_MAX_FRAMES_IN_FLIGHT at a time; further
+    frames are skipped) and recorded in the SceneStore under the session id,
+    transcript chunks are collected into the current utterance, and when an
+    utterance ends its reply is synthesized from the transcript and the
+    session's recent scenes and streamed back sentence by sentence. A new
+    utterance interrupts a reply still being streamed. A frame showing a
+    hazard produces an alert right away, before its scene message. With a
+    SpeculativeAnalysis, the utterance is analyzed as its chunks arrive.
+
+    Client messages are binary frames (raw JPEG, PNG or WebP) or JSON text:
+        {"type": "frame", "image": "<base64 or data URI>"}
+        {"type": "transcript", "text": "...", "final": false}
+        {"type": "end_utterance"}  (same as a transcript with "final": true)
+        {"type": "ping"}
+
+    Server messages are JSON: ready, alert, scene, frame_skipped, chunk,
+    done, interrupted, pong and error (see README).
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        scenes: SceneStore,
+        send: Callable[[dict], Awaitable[None]],
+        session_id: Optional[str] = None,
+        speculation: Optional[SpeculativeAnalysis] = None,
+    ):
+        self.id = session_id or uuid.uuid4().hex
+        self.pipeline = pipeline
+        self.scenes = scenes
+        self.speculation = speculation
+        # session ids can be shared by connections; speculation keys must not
+        self._key = uuid.uuid4().hex
+        self.alerts = HazardAlerts(
+            "session", c.HAZARD_ALERT_REPEAT_SECONDS, keep=False
+        )
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self._frames = 0
+        self._frame_tasks: set[asyncio.Task] = set()
+        self._utterance: list[str] = []
+        self._utterances = 0
+        self._reply: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def send(self, message: dict):
+        if self._closed:
+            return
+        async with self._send_lock:
+            try:
+                await self._send(message)
+            except Exception:
+                # the connection dropped; the receive loop will close the session
+                self._closed = True
+
+    async def handle_bytes(self, image: bytes):
+        await self.add_frame(image, image_mime_type(image))
+
+    async def handle_text(self, text: str):
+        """
+        Dispatch one JSON control message.
+        """
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, KeyError, TypeError):
+            await self.send(
+                {"type": "error", "detail": 'Messages must be JSON objects with a "type"'}
+            )
+            return
+
+        if kind == "frame" and isinstance(message.get("image"), str):
+            await self.add_frame(message["image"])
+        elif kind == "transcript" and isinstance(message.get("text", ""), str):
+            await self.add_transcript(message.get("text", ""))
+            if message.get("final"):
+                await self.end_utterance(message.get("utterance_id"))
+        elif kind == "end_utterance":
+            await self.end_utterance(message.get("utterance_id"))
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        else:
+            await self.send(
+                {"type": "error", "detail": f"Unsupported message type: {kind}"}
+            )
+
+    async def add_frame(self, image: Union[bytes, str], mime_type: str = "image/jpeg"):
+        self._frames += 1
+        number = self._frames
+        if len(self._frame_tasks) >= c.SESSION_MAX_FRAMES_IN_FLIGHT:
+            # the VLM can't keep up with the camera; newer frames will follow
+            _stats["frames_skipped"] += 1
+            await self.send({"type": "frame_skipped", "frame": number})
+            return
+        _stats["frames"] += 1
+        task = asyncio.ensure_future(
+            self._analyze_frame(number, image, mime_type, time.perf_counter())
+        )
+        self._frame_tasks.add(task)
+        task.add_done_callback(self._frame_tasks.discard)
+
+    async def _analyze_frame(
+        self, number: int, image: Union[bytes, str], mime_type: str, started: float
+    ):
+        deadline_token = set_deadline(Deadline(c.SESSION_FRAME_BUDGET_SECONDS))
+        try:
+            frame = await self.pipeline.preprocessor.prepare(image, mime_type)
+            analysis, cache_distance = await self.pipeline.vlm.analyze_frame(
+                frame.data_uri, frame.phash
+            )
+        except Exception as e:
+            metrics.record_error("session", e)
+            await self.send(
+                {
+                    "type": "error",
+                    "frame": number,
+                    "detail": f"Error processing image: {str(e)}",
+                }
+            )
+            return
+        finally:
+            reset_deadline(deadline_token)
+
+        alert = self.alerts.add(number, analysis, started)
+        if alert is not None:
+            _stats["alerts"] += 1
+            await self.send({"type": "alert", **alert})
+        # not the fallback: later syntheses would read it as the scene
+        if isinstance(analysis, SceneAnalysis) and analysis is not SCENE_UNCLEAR:
+            await self.scenes.add(self.id, analysis)
+        await self.send(
+            {
+                "type": "scene",
+                "frame": number,
+                "analysis": analysis,
+                "frame_cache_distance": cache_distance,
+            }
+        )
+
+    async def add_transcript(self, text: str):
+        if sum(map(len, self._utterance)) + len(text) > c.SESSION_MAX_UTTERANCE_CHARS:
+            await self.send(
+                {
+                    "type": "error",
+                    "detail": f"Utterance exceeds {c.SESSION_MAX_UTTERANCE_CHARS} characters",
+                }
+            )
+            return
+        if text.strip():
+            self._utterance.append(text.strip())
+            if self.speculation is not None:
+                # chunks are finished segments, so the whole utterance so far is stable
+                await self.speculation.speculate(
+                    self._utterance_key(), " ".join(self._utterance)
+                )
+
+    def _utterance_key(self) -> str:
+        return f"{self._key}:{self._utterances}"
+
+    async def end_utterance(self, utterance_id: Optional[str] = None):
+        transcript = " ".join(self._utterance)
+        key = self._utterance_key()
+        self._utterance = []
+        self._utterances += 1
+        utterance_id = utterance_id or str(self._utterances)
+        if not transcript:
+            await self.send(
+                {"type": "error", "utterance": utterance_id, "detail": "Utterance is empty"}
+            )
+            if self.speculation is not None:
+                await self.speculation.discard(key)
+            return
+
+        if self._reply is not None and not self._reply.done():
+            # the user spoke again: the previous answer is no longer wanted
+            _stats["interrupted"] += 1
+            self._reply.cancel()
+        _stats["utterances"] += 1
+        self._reply = asyncio.ensure_future(
+            self._respond(utterance_id, transcript, key)
+        )
+
+    async def _analyze_transcript(self, transcript: str, key: str):
+        if self.speculation is None:
+            return await self.pipeline.transcription.analyze_transcript(
+                transcript=transcript
+            )
+        analysis, _ = await self.speculation.commit(key, transcript)
+        return analysis
+
+    async def _respond(self, utterance_id: str, transcript: str, key: str):
+        started = time.perf_counter()
+        deadline_token = set_deadline(Deadline(c.REQUEST_DEFAULT_BUDGET_SECONDS))
+        try:
+            analysis = asyncio.ensure_future(self._analyze_transcript(transcript, key))
+            try:
+                # give frames captured while the user was speaking a moment to land
+                if self._frame_tasks:
+                    await asyncio.wait(
+                        set(self._frame_tasks), timeout=c.SESSION_FRAME_WAIT_SECONDS
+                    )
+                transcription_analysis = await analysis
+            finally:
+                analysis.cancel()
+            surrounding_analysis = await self.scenes.recent(
+                self.id, c.SESSION_WINDOW_SECONDS, c.SESSION_WINDOW_FRAMES
+            )
+            stream = await self.pipeline.synthesis.synthesize_stream(
+                transcription_analysis=transcription_analysis,
+                surrounding_analysis=surrounding_analysis,
+            )
+            events = synthesis_events(stream, started)
+            try:
+                async for event, data in events:
+                    await self.send({"type": event, "utterance": utterance_id, **data})
+            finally:
+                await events.aclose()
+        except asyncio.CancelledError:
+            await self.send({"type": "interrupted", "utterance": utterance_id})
+            raise
+        except Exception as e:
+            metrics.record_error("session", e)
+            await self.send(
+                {
+                    "type": "error",
+                    "utterance": utterance_id,
+                    "detail": f"Error synthesizing response: {str(e)}",
+                }
+            )
+        finally:
+            reset_deadline(deadline_token)
+
+    async def close(self):
+        """
+        Cancel the frame analyses and reply still running for this connection.
+        """
+        self._closed = True
+        if self.speculation is not None:
+            await self.speculation.discard(self._utterance_key())
+        tasks = [*self._frame_tasks]
+        if self._reply is not None:
+            tasks.append(self._reply)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stats() -> dict:
+    return dict(_stats)
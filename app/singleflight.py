@@ -0,0 +1,127 @@
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from . import timing
+from .resilience import Deadline, current_deadline, set_deadline
+from .scheduler import Priority, current_priority, set_priority
+
+T = TypeVar("T")
+
+
+def _urgency(priority: Optional[Priority]) -> Priority:
+    # no X-Priority means the stage default, which is high or normal
+    return Priority.NORMAL if priority is None else priority
+
+
+class _Flight:
+    __slots__ = ("task", "context", "timings", "deadline", "priority", "waiters")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.context = contextvars.copy_context()
+        self.timings: Optional[timing.RequestTimings] = None
+        self.deadline: Optional[Deadline] = None
+        self.priority: Optional[Priority] = None
+        self.waiters = 0
+
+    def join(self, first: bool):
+        """
+        Loosen the shared call's deadline and raise its priority to suit the
+        caller: it runs on behalf of every waiter, not just the first.
+        """
+        deadline = current_deadline()
+        if first:
+            # a deadline of its own, so later waiters can extend it
+            self.deadline = (
+                Deadline(deadline.remaining()) if deadline is not None else None
+            )
+            self.context.run(set_deadline, self.deadline)
+            # stages go to timings of the flight's own, merged into every
+            # caller's once the call is done (not just the first one's)
+            self.context.run(timing.start_request)
+            self.timings = self.context.run(timing.current)
+        elif self.deadline is not None:
+            if deadline is None:
+                self.deadline = None
+                self.context.run(set_deadline, None)
+            else:
+                self.deadline.expires_at = max(
+                    self.deadline.expires_at, deadline.expires_at
+                )
+
+        priority = current_priority()
+        if first or _urgency(priority) < _urgency(self.priority):
+            self.priority = priority
+            self.context.run(set_priority, priority)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight call
+    whose result (or exception) every caller receives.
+
+    The shared call runs with the loosest deadline and the most urgent
+    priority among its callers (for the upstream calls it has yet to make),
+    and is cancelled once every caller has given up.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn()` unless a call for `key` is already in flight, in which case
+        wait for that one instead.
+        """
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.join(first=True)
+            flight.task = asyncio.get_running_loop().create_task(
+                fn(), context=flight.context
+            )
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda done: self._finish(key, flight))
+            self.calls += 1
+        else:
+            flight.join(first=False)
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # one caller giving up (e.g. client disconnect) must not cancel the shared call
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.task.done():
+                timings = timing.current()
+                if timings is not None:
+                    timings.merge(flight.timings)
+            elif flight.waiters == 0:
+                # ...but once nobody is waiting, stop spending upstream capacity on it
+                self.abandoned += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight):
+        # a cancelled flight can't be joined by the next caller
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+
+    def _finish(self, key: str, flight: _Flight):
+        self._forget(key, flight)
+        if not flight.task.cancelled():
+            # mark the exception retrieved even if every caller went away
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,249 @@
+import asyncio
+import re
+import time
+from collections import defaultdict
+from typing import Optional, Union
+
+import config as c
+from . import generation, metrics
+from .resilience import Deadline, set_deadline
+from .scheduler import Priority, set_priority
+from .schemas import TRANSCRIPT_NO_SALIENT, TranscriptAnalysis
+from .transcriptionanalysis import TranscriptionAnalysis
+from .utterancestore import UtteranceState, UtteranceStore
+
+_WORD = re.compile(r"[\w']+")
+_SENTENCE_END = re.compile(r"[.?!]['\")\]]*\s*$")
+
+
+def _word_keys(text: str) -> list[str]:
+    return [word.casefold() for word in _WORD.findall(text)]
+
+
+def stable_prefix(previous: Optional[str], current: str) -> str:
+    """
+    The part of a partial transcript the recognizer is unlikely to revise:
+    the words it shares with the previous snapshot, or all of it once it
+    ends a sentence.
+    """
+    if _SENTENCE_END.search(current):
+        return current.strip()
+    if previous is None:
+        return ""
+    tokens = current.split()
+    previous_keys = [_word_keys(token) for token in previous.split()]
+    stable = 0
+    for token, previous_key in zip(tokens, previous_keys):
+        if _word_keys(token) != previous_key:
+            break
+        stable += 1
+    return " ".join(tokens[:stable])
+
+
+def covers(analyzed: str, transcript: str) -> bool:
+    """
+    Whether an analysis of `analyzed` also stands for `transcript`: same
+    words, or only up to SPECULATION_MAX_TRIVIAL_WORDS trailing words from
+    SPECULATION_TRIVIAL_WORDS added (case and punctuation are ignored).
+    """
+    analyzed_keys = _word_keys(analyzed)
+    keys = _word_keys(transcript)
+    if keys[: len(analyzed_keys)] != analyzed_keys:
+        return False
+    extra = keys[len(analyzed_keys) :]
+    return len(extra) <= c.SPECULATION_MAX_TRIVIAL_WORDS and all(
+        word in c.SPECULATION_TRIVIAL_WORDS for word in extra
+    )
+
+
+class SpeculativeAnalysis:
+    """
+    Transcription analysis started while the user is still speaking. Partial
+    transcripts are posted under an utterance id; their stable prefix is
+    analyzed in the background (BACKGROUND priority, one call per utterance,
+    a newer prefix cancels the stale call on this worker). When the final
+    transcript is committed, the speculative result is returned if it covers
+    the final text, so the analysis latency is mostly hidden behind speech
+    time.
+
+    Utterance state (last snapshot, text under analysis, result) lives in
+    an UtteranceStore, shared by the gunicorn workers with the SQLite
+    backend: partials and the commit of an utterance may land on different
+    workers. A commit waits for a speculation still running here, or polls
+    for one running on another worker for up to SPECULATION_REMOTE_WAIT_SECONDS.
+    """
+
+    def __init__(self, transcription: TranscriptionAnalysis, store: UtteranceStore):
+        self.transcription = transcription
+        self.store = store
+        # speculations running in this worker: utterance id -> (text, task)
+        self._tasks: dict[str, tuple[str, asyncio.Task]] = {}
+        self._stats = defaultdict(int)
+
+    async def snapshot(self, utterance_id: str, transcript: str) -> Optional[str]:
+        """
+        Record a partial transcript (the whole utterance so far, as currently
+        recognized) and speculate on its stable prefix.
+
+        Returns:
+            The text being analyzed for the utterance, if any
+        """
+        state = await self.store.get(utterance_id)
+        self._stats["snapshots"] += 1
+        prefix = stable_prefix(state.snapshot if state is not None else None, transcript)
+        return await self._speculate(utterance_id, state, transcript, prefix)
+
+    async def speculate(self, utterance_id: str, transcript: str) -> Optional[str]:
+        """
+        Speculate on text that won't be revised (e.g. finished transcript
+        segments appended so far).
+        """
+        state = await self.store.get(utterance_id)
+        return await self._speculate(utterance_id, state, transcript, transcript.strip())
+
+    async def _speculate(
+        self,
+        utterance_id: str,
+        state: Optional[UtteranceState],
+        snapshot: str,
+        text: str,
+    ) -> Optional[str]:
+        current = state.text if state is not None else None
+        profile = generation.current_profile()
+        if len(_word_keys(text)) < c.SPECULATION_MIN_WORDS or (
+            # the current analysis already stands for this text
+            current is not None
+            and state.profile == profile
+            and covers(current, text)
+        ):
+            await self.store.update(
+                utterance_id, snapshot, current, state.profile if state else None
+            )
+            return current
+
+        running = self._tasks.pop(utterance_id, None)
+        if running is not None and not running[1].done():
+            self._stats["cancelled"] += 1
+            running[1].cancel()
+        self._stats["speculations"] += 1
+        await self.store.update(utterance_id, snapshot, text, profile)
+        task = asyncio.ensure_future(self._analyze(utterance_id, text))
+        self._tasks[utterance_id] = (text, task)
+        task.add_done_callback(lambda done: self._forget(utterance_id, done))
+        return text
+
+    def _forget(self, utterance_id: str, task: asyncio.Task):
+        running = self._tasks.get(utterance_id)
+        if running is not None and running[1] is task:
+            del self._tasks[utterance_id]
+
+    async def _analyze(self, utterance_id: str, text: str):
+        # detached from the request that posted the snapshot
+        set_deadline(Deadline(c.SPECULATION_BUDGET_SECONDS))
+        set_priority(Priority.BACKGROUND)
+        try:
+            analysis = await self.transcription.analyze_transcript(
+                transcript=text, coalesce=False
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.record_error("speculation", e)
+            analysis = None
+        if analysis is TRANSCRIPT_NO_SALIENT:
+            # unparseable output: let the final transcript be analyzed for real
+            analysis = None
+        # "" tells commits polling from other workers to stop waiting
+        await self.store.set_result(
+            utterance_id, text, analysis.model_dump_json() if analysis else ""
+        )
+        return analysis
+
+    async def commit(
+        self, utterance_id: str, transcript: str
+    ) -> tuple[Union[TranscriptAnalysis, str], str]:
+        """
+        Analysis of an utterance's final transcript, reusing the speculative
+        one when it covers the final text.
+
+        Returns:
+            The analysis and how it was obtained: "hit" (speculation already
+            finished), "in_flight" (waited for the running speculation) or
+            "miss" (analyzed now)
+        """
+        state = await self.store.get(utterance_id)
+        running = self._tasks.pop(utterance_id, None)
+        outcome = "miss"
+        analysis = None
+        try:
+            if (
+                state is not None
+                and state.text is not None
+                and state.profile == generation.current_profile()
+                and covers(state.text, transcript)
+            ):
+                if state.result:
+                    outcome = "hit"
+                    analysis = TranscriptAnalysis.model_validate_json(state.result)
+                elif (
+                    state.result is None
+                    and running is not None
+                    and running[0] == state.text
+                ):
+                    task = running[1]
+                    await asyncio.wait({task})
+                    if not task.cancelled() and task.result() is not None:
+                        outcome, analysis = "in_flight", task.result()
+                elif state.result is None:
+                    result = await self._wait_remote(utterance_id, state)
+                    if result:
+                        outcome = "in_flight"
+                        analysis = TranscriptAnalysis.model_validate_json(result)
+        finally:
+            if running is not None:
+                running[1].cancel()
+            await self.store.delete(utterance_id)
+
+        if analysis is None:
+            analysis = await self.transcription.analyze_transcript(
+                transcript=transcript
+            )
+        self._stats[outcome] += 1
+        metrics.SPECULATION_COMMITS.labels(outcome).inc()
+        return analysis, outcome
+
+    async def _wait_remote(
+        self, utterance_id: str, state: UtteranceState
+    ) -> Optional[str]:
+        """
+        Poll the store for the result of a speculation running on another
+        worker, while it may still finish within its budget.
+        """
+        give_up = time.monotonic() + min(
+            c.SPECULATION_REMOTE_WAIT_SECONDS,
+            state.speculated_at + c.SPECULATION_BUDGET_SECONDS - time.time(),
+        )
+        while time.monotonic() < give_up:
+            await asyncio.sleep(c.SPECULATION_REMOTE_POLL_SECONDS)
+            current = await self.store.get(utterance_id)
+            if current is None or current.text != state.text:
+                return None
+            if current.result is not None:
+                return current.result
+        return None
+
+    async def discard(self, utterance_id: str):
+        """
+        Drop an utterance's speculation (abandoned or superseded).
+        """
+        running = self._tasks.pop(utterance_id, None)
+        if running is not None:
+            running[1].cancel()
+        await self.store.delete(utterance_id)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._tasks),
+            "store": self.store.stats(),
+        }
@@ -0,0 +1,116 @@
+import json
+import re
+import time
+from typing import AsyncIterator, Optional
+
+from pydantic import BaseModel
+
+from . import metrics
+from .llmsynthesis import SynthesisStream
+
+# Sentence boundary: terminal punctuation followed by whitespace, so "1.5 m" isn't split
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # nginx buffers proxied responses by default, which would hold events back
+    "X-Accel-Buffering": "no",
+}
+
+
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_json(data: dict) -> str:
+    """
+    JSON text of an event payload (Pydantic models allowed).
+    """
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """
+    Format one Server-Sent Event with a JSON payload (Pydantic models allowed).
+    """
+    return f"event: {event}\ndata: {encode_json(data)}\n\n"
+
+
+async def sentence_chunks(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Regroup streamed text deltas into whole sentences for text-to-speech.
+    """
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        parts = _SENTENCE_END.split(buffer)
+        # the last part may still be an unfinished sentence
+        for sentence in parts[:-1]:
+            if sentence.strip():
+                yield sentence.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def synthesis_events(
+    stream: SynthesisStream, started: float, chunking: str = "sentence"
+) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Turn a SynthesisStream into `chunk` events followed by a `done` event
+    carrying token usage and timing, or an `error` event if the stream fails.
+
+    Args:
+        stream: The synthesis stream to relay
+        started: `time.perf_counter()` at the start of the request
+        chunking: "sentence" to emit whole sentences, "token" to relay raw deltas
+
+    Returns:
+        (event, data) pairs
+    """
+    chunks = sentence_chunks(stream) if chunking == "sentence" else stream.__aiter__()
+    first_chunk_at = None
+    try:
+        async for text in chunks:
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            yield "chunk", {"text": text}
+    except Exception as e:
+        metrics.record_error("stream", e)
+        yield "error", {"detail": f"Error synthesizing response: {str(e)}"}
+        return
+    finally:
+        await stream.close()
+
+    finished = time.perf_counter()
+    yield "done", {
+        "usage": stream.usage.model_dump() if stream.usage else None,
+        "timing": {
+            "time_to_first_chunk_ms": (
+                round((first_chunk_at - started) * 1000, 1)
+                if first_chunk_at is not None
+                else None
+            ),
+            "total_ms": round((finished - started) * 1000, 1),
+        },
+    }
+
+
+async def stream_synthesis_events(
+    stream: SynthesisStream,
+    started: float,
+    chunking: str = "sentence",
+    prelude: Optional[list[str]] = None,
+) -> AsyncIterator[str]:
+    """
+    `synthesis_events` formatted as Server-Sent Events.
+
+    Args:
+        prelude: Already formatted events to send before the first chunk
+    """
+    for event in prelude or []:
+        yield event
+    async for event, data in synthesis_events(stream, started, chunking):
+        yield format_sse(event, data)
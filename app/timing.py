@@ -0,0 +1,104 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Order of the entries in the Server-Timing header
+STAGES = ("parse", "preprocess", "queue", "ttfb", "upstream", "serialize")
+
+
+class RequestTimings:
+    """
+    Stage durations of one request, reported in its `Server-Timing` header.
+
+    Stages that run once per upstream call (queue, ttfb, upstream) are summed
+    over the request's calls, which may have run concurrently.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.handler_finished: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def merge(self, other: "RequestTimings"):
+        """
+        Add the stages of work done on this request's behalf elsewhere (see SingleFlight).
+        """
+        for name, seconds in other.durations.items():
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + other.counts[name]
+
+    def header(self) -> str:
+        entries = []
+        for name in STAGES:
+            if name not in self.durations:
+                continue
+            entry = f"{name};dur={self.durations[name] * 1000:.1f}"
+            if self.counts[name] > 1:
+                entry += f';desc="{self.counts[name]} calls"'
+            entries.append(entry)
+        total = time.perf_counter() - self.started
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+def start_request():
+    return _current_timings.set(RequestTimings())
+
+
+def reset(token):
+    _current_timings.reset(token)
+
+
+def current() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+def record(name: str, seconds: float):
+    """
+    Add `seconds` to stage `name` of the current request (no-op outside one).
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed_endpoint(endpoint):
+    """
+    Decorator for route handlers: time up to the handler's start counts as
+    `parse` (body read and validated), time after it returns until the
+    response is ready as `serialize`.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add("parse", time.perf_counter() - timings.started)
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            if timings is not None:
+                timings.handler_finished = time.perf_counter()
+
+    return wrapper
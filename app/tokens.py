@@ -0,0 +1,29 @@
+import config as c
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for budgeting (no tokenizer round trip).
+    """
+    return len(text) // c.CHARS_PER_TOKEN + 1
+
+
+def estimate_request_tokens(
+    messages: list[dict], max_completion_tokens: int = None
+) -> int:
+    """
+    Estimate the tokens a chat completion will consume: prompt text, images
+    and the completion allowance.
+    """
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                total += estimate_tokens(part["text"])
+            elif part["type"] == "image_url":
+                total += c.TOKENS_PER_IMAGE
+    return total + (max_completion_tokens or c.DEFAULT_COMPLETION_TOKENS)
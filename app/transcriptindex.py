@@ -0,0 +1,228 @@
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+import config as c
+from .schemas import TranscriptAnalysis
+
+_WORD = re.compile(r"[a-z0-9]+")
+# speech-to-text spells the same words either way ("where's" / "where is")
+_CONTRACTIONS = (
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'s\b"), " is"),
+    (re.compile(r"'m\b"), " am"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'d\b"), " would"),
+)
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def shingles(text: str, size: int = c.TRANSCRIPT_INDEX_SHINGLE_SIZE) -> frozenset[int]:
+    """
+    Hashed word shingles of a transcript: every run of 1 to `size` words,
+    after case folding, contraction expansion and punctuation removal.
+    Unigrams keep short commands comparable; longer runs keep word order.
+    """
+    text = text.casefold().replace("’", "'")
+    for pattern, replacement in _CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    words = _WORD.findall(text)
+    return frozenset(
+        _hash(" ".join(words[i : i + n]))
+        for n in range(1, size + 1)
+        for i in range(len(words) - n + 1)
+    )
+
+
+def _hash(shingle: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big"
+    )
+
+
+def jaccard(a: frozenset[int], b: frozenset[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("shingles", "bands", "profile", "analysis", "stored_at")
+
+    def __init__(self, shingles, bands, profile, analysis, stored_at):
+        self.shingles = shingles
+        self.bands = bands
+        self.profile = profile
+        self.analysis = analysis
+        self.stored_at = stored_at
+
+
+class TranscriptIndex:
+    """
+    Bounded in-process similarity index over recent transcripts and their
+    analyses, for the repeats exact-match caching misses ("where's the
+    counter" / "where is the counter?").
+
+    Transcripts are reduced to word shingles and MinHash signatures; LSH
+    banding over the signatures finds candidates without scanning the
+    index, and a candidate is reused when the exact Jaccard similarity of
+    the shingle sets reaches `min_similarity` and its analysis' confidence
+    reaches `min_confidence`. Entries expire after `ttl` seconds; beyond
+    `max_entries` the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = c.TRANSCRIPT_INDEX_MAX_ENTRIES,
+        ttl: float = c.TRANSCRIPT_INDEX_TTL_SECONDS,
+        min_similarity: float = c.TRANSCRIPT_INDEX_MIN_SIMILARITY,
+        min_confidence: float = c.TRANSCRIPT_INDEX_MIN_CONFIDENCE,
+        bands: int = c.TRANSCRIPT_INDEX_BANDS,
+        rows: int = c.TRANSCRIPT_INDEX_ROWS,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.bands = bands
+        self.rows = rows
+        # fixed seed: signatures are comparable across restarts and workers
+        rng = random.Random(0x4A415256)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()  # oldest first
+        self._buckets: defaultdict[tuple[int, tuple[int, ...]], set[int]] = (
+            defaultdict(set)
+        )
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.low_confidence = 0
+        self.hit_similarities = defaultdict(int)
+
+    def _bands(self, shingle_set: frozenset[int]) -> list[tuple[int, ...]]:
+        signature = [
+            min(((a * s + b) % _MERSENNE_PRIME for s in shingle_set), default=0)
+            for a, b in self._permutations
+        ]
+        return [
+            tuple(signature[band * self.rows : (band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def get(
+        self, transcript: str, profile: Optional[str] = None
+    ) -> Optional[tuple[TranscriptAnalysis, float]]:
+        """
+        Find the most similar live entry analyzed under the same generation profile.
+
+        Returns:
+            The stored analysis and its similarity, or None on a miss
+        """
+        shingle_set = shingles(transcript)
+        if not shingle_set:
+            return None
+        expired = self._expire()
+
+        candidates = set()
+        for band, rows in enumerate(self._bands(shingle_set)):
+            candidates.update(self._buckets.get((band, rows), ()))
+
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.profile != profile or entry.stored_at <= expired:
+                continue
+            similarity = jaccard(shingle_set, entry.shingles)
+            if similarity > best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None or best_similarity < self.min_similarity:
+            self.misses += 1
+            return None
+        entry = self._entries[best_id]
+        if not self._confident(entry.analysis):
+            self.low_confidence += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # 0.05-wide buckets, labelled by their lower bound
+        self.hit_similarities[f"{int(best_similarity * 20) / 20:.2f}"] += 1
+        self._entries.move_to_end(best_id)
+        return entry.analysis, best_similarity
+
+    def put(
+        self,
+        transcript: str,
+        analysis: TranscriptAnalysis,
+        profile: Optional[str] = None,
+    ):
+        """
+        Index the analysis of a transcript. Low-confidence analyses (or ones
+        without a confidence) are not stored, since they could never be reused.
+        """
+        if not self._confident(analysis):
+            return
+        shingle_set = shingles(transcript)
+        if not shingle_set:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        bands = self._bands(shingle_set)
+        self._entries[entry_id] = _Entry(
+            shingle_set, bands, profile, analysis, time.monotonic()
+        )
+        for band, rows in enumerate(bands):
+            self._buckets[(band, rows)].add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _confident(self, analysis: TranscriptAnalysis) -> bool:
+        # a reply without a confidence can't vouch for reuse
+        return (
+            analysis.confidence is not None
+            and analysis.confidence >= self.min_confidence
+        )
+
+    def _expire(self) -> float:
+        """
+        Drop expired entries from the LRU end; returns the expiry cutoff. Entries
+        reused recently can be expired too, so lookups check it as well.
+        """
+        expired = time.monotonic() - self.ttl
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.stored_at > expired:
+                break
+            self._remove(entry_id)
+        return expired
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band, rows in enumerate(entry.bands):
+            bucket = self._buckets[(band, rows)]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[(band, rows)]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "low_confidence": self.low_confidence,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "min_similarity": self.min_similarity,
+            "min_confidence": self.min_confidence,
+            "hit_similarities": dict(sorted(self.hit_similarities.items())),
+        }
@@ -1,28 +1,118 @@
 import config as c
-from groq import Groq
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+from groq import AsyncGroq
+from typing import Optional, Union
+from .groqclient import get_client
+from . import generation, prompts
+from .resilience import CircuitOpen
+from .upstream import create_completion
+from .responsecache import ResponseCache, cache_key, normalize_text
+from .schemas import TRANSCRIPT_NO_SALIENT, TranscriptAnalysis, parse_analysis
+from .singleflight import SingleFlight
+from .transcriptindex import TranscriptIndex
 
 
 class TranscriptionAnalysis:
-    def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-        if not self.client.api_key:
-            raise ValueError("GROQ_API_KEY not found in env vars")
+    def __init__(
+        self,
+        client: Optional[AsyncGroq] = None,
+        cache: Optional[ResponseCache] = None,
+        index: Optional[TranscriptIndex] = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.cache = cache
+        self.index = index
+        self.single_flight = SingleFlight()
+
+    async def analyze_transcript(
+        self, transcript: str, prompt: str = None, coalesce: bool = True
+    ) -> Union[TranscriptAnalysis, str]:
+        """
+        Analyze a transcript. With the default prompt the model runs in JSON
+        mode and the result is a validated TranscriptAnalysis; a custom
+        prompt's output is returned as is.
 
-    def analyze_transcript(self, transcript: str, prompt: str = None):
+        With `coalesce=False` the call isn't shared with identical concurrent
+        requests, so cancelling the caller also cancels the upstream call
+        (used for speculative analysis that may be superseded).
+        """
+        structured = prompt is None
         sys_prompt = (
             prompt
             if prompt is not None
-            else c.GROQ_TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT
+            else prompts.TRANSCRIPTION_ANALYSIS_SYSTEM_PROMPT
         )
-        chat_completion = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": transcript},
-            ],
-            model=c.GROQ_TRANSCRIPTION_ANALYSIS_MODEL,
+
+        key = cache_key(
+            c.GROQ_TRANSCRIPTION_ANALYSIS_MODEL,
+            generation.current_profile(),
+            sys_prompt,
+            normalize_text(transcript),
+        )
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                if structured:
+                    return TranscriptAnalysis.model_validate_json(cached)
+                return cached
+        if structured and self.index is not None:
+            # a near-identical recent transcript ("where's" / "where is") stands in
+            similar = self.index.get(transcript, generation.current_profile())
+            if similar is not None:
+                return similar[0]
+
+        if not coalesce:
+            return await self._complete(key, transcript, sys_prompt, structured)
+        # concurrent identical transcripts (retries, shared sessions) share one call
+        return await self.single_flight.do(
+            key, lambda: self._complete(key, transcript, sys_prompt, structured)
+        )
+
+    async def _complete(
+        self, key: str, transcript: str, sys_prompt: str, structured: bool
+    ) -> Union[TranscriptAnalysis, str]:
+        try:
+            chat_completion = await create_completion(
+                self.client,
+                stage="transcription_analysis",
+                messages=[
+                    {"role": "system", "content": sys_prompt},
+                    {"role": "user", "content": transcript},
+                ],
+                model=c.GROQ_TRANSCRIPTION_ANALYSIS_MODEL,
+                **(
+                    {"response_format": {"type": "json_object"}} if structured else {}
+                ),
+            )
+        except CircuitOpen:
+            # every tier is cut off: answer at once with the prompt's own
+            # fallback (not cached or indexed)
+            if not structured:
+                raise
+            return TRANSCRIPT_NO_SALIENT
+        content = chat_completion.choices[0].message.content
+        # answers from a fallback tier stand in for this request only
+        cacheable = (
+            self.cache is not None
+            and chat_completion.model == c.GROQ_TRANSCRIPTION_ANALYSIS_MODEL
+        )
+        if not structured:
+            if cacheable and content:
+                await self.cache.set(key, content)
+            return content
+
+        analysis, parsed = parse_analysis(
+            TranscriptAnalysis,
+            content,
+            "transcription_analysis",
+            TRANSCRIPT_NO_SALIENT,
         )
-        return chat_completion.choices[0].message.content
+        # neither is a fallback result
+        if cacheable and parsed:
+            await self.cache.set(key, analysis.model_dump_json())
+        if (
+            self.index is not None
+            and parsed
+            and chat_completion.model == c.GROQ_TRANSCRIPTION_ANALYSIS_MODEL
+        ):
+            self.index.put(transcript, analysis, generation.current_profile())
+        return analysis
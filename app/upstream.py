@@ -0,0 +1,290 @@
+import asyncio
+import math
+import time
+from collections import defaultdict
+
+import groq
+from groq import AsyncGroq
+
+import config as c
+from . import generation, metrics, timing
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    DeadlineExceeded,
+    LatencyTracker,
+    OutcomeTracker,
+    backoff_delay,
+    current_deadline,
+    hedged,
+)
+from .router import ModelRouter
+from .scheduler import Priority, current_priority, scheduler
+from .tokens import estimate_request_tokens
+
+# Errors worth retrying: connection problems/timeouts, 429s and 5xx responses
+TRANSIENT_ERRORS = (
+    groq.APIConnectionError,
+    groq.RateLimitError,
+    groq.InternalServerError,
+)
+
+# model -> recent latencies of successful single-answer calls (batched VLM
+# calls take longer and would raise the percentiles hedging is based on)
+latency = defaultdict(LatencyTracker)
+# model -> recent time to response headers of streamed calls; kept apart from
+# `latency`, which the router and hedging read as time to a full completion
+stream_latency = defaultdict(LatencyTracker)
+errors = defaultdict(OutcomeTracker)  # model -> recent call outcomes
+breakers = defaultdict(CircuitBreaker)  # model -> circuit breaker (per worker)
+router = ModelRouter(latency, errors, breakers)
+_stats = defaultdict(
+    lambda: {
+        "calls": 0,
+        "retries": 0,
+        "hedges": 0,
+        "deadline_exceeded": 0,
+        "circuit_open": 0,
+    }
+)
+
+
+def _attempt_timeout(stage: str) -> float:
+    """
+    Timeout for one attempt: the stage timeout, cut short by the request deadline.
+    """
+    timeout = c.UPSTREAM_STAGE_TIMEOUTS[stage]
+    deadline = current_deadline()
+    if deadline is not None:
+        remaining = deadline.remaining()
+        if remaining < c.UPSTREAM_MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceeded(f"Latency budget exhausted before {stage} call")
+        timeout = min(timeout, remaining)
+    return timeout
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    delay = backoff_delay(
+        attempt, c.UPSTREAM_BACKOFF_BASE_SECONDS, c.UPSTREAM_BACKOFF_MAX_SECONDS
+    )
+    if isinstance(error, groq.RateLimitError):
+        # honor the server's retry-after when it asks for longer than our backoff
+        delay = max(delay, retry_after(error))
+    return delay
+
+
+def retry_after(error: Exception) -> float:
+    """
+    Seconds the server asked us to wait (`retry-after` header), 0 if it did not say.
+    """
+    try:
+        return float(error.response.headers.get("retry-after", 0))
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def _record_outcome(model: str, stage: str, ok: bool, elapsed: float = 0.0):
+    if not c.CIRCUIT_BREAKER_ENABLED:
+        return
+    slow = elapsed > c.CIRCUIT_SLOW_CALL_SECONDS.get(stage, math.inf)
+    transition = breakers[model].record(ok, slow)
+    if transition is not None:
+        metrics.CIRCUIT_TRANSITIONS.labels(model, transition).inc()
+
+
+def _hedge_delay(model: str):
+    tracker = latency[model]
+    if len(tracker) < c.UPSTREAM_HEDGE_MIN_SAMPLES:
+        return None
+    return max(
+        c.UPSTREAM_HEDGE_MIN_DELAY_SECONDS,
+        tracker.percentile(c.UPSTREAM_HEDGE_PERCENTILE),
+    )
+
+
+async def _admitted_create(
+    client: AsyncGroq,
+    stage: str,
+    cost: int,
+    priority: Priority,
+    kwargs: dict,
+    outputs: int = 1,
+):
+    """
+    One upstream request, sent once the scheduler admits it. The timeout is
+    taken after admission so time spent queued comes out of the budget. For
+    streams the slot is held until the response starts; usage isn't known yet.
+    """
+    model = kwargs["model"]
+    profile = generation.current_profile()
+    async with scheduler.slot(model, cost, priority) as admission:
+        timeout = _attempt_timeout(stage)
+        started = time.perf_counter()
+        try:
+            completion = await client.chat.completions.create(
+                timeout=timeout, **kwargs
+            )
+        except Exception as e:
+            # a 429 pauses the model's queue (see create_completion); it says
+            # the model is busy, not broken, so it isn't counted as a failure
+            if isinstance(e, TRANSIENT_ERRORS) and not isinstance(
+                e, groq.RateLimitError
+            ):
+                errors[model].observe(False)
+                _record_outcome(model, stage, False)
+            elapsed = time.perf_counter() - started
+            metrics.UPSTREAM_LATENCY.labels(model, stage, profile, "error").observe(
+                elapsed
+            )
+            metrics.record_error("upstream", e)
+            raise
+        elapsed = time.perf_counter() - started
+        timing.record("upstream", elapsed)
+        if kwargs.get("stream"):
+            stream_latency[model].observe(elapsed)
+        elif outputs == 1:
+            latency[model].observe(elapsed)
+        errors[model].observe(True)
+        _record_outcome(model, stage, True, elapsed)
+        metrics.UPSTREAM_LATENCY.labels(model, stage, profile, "ok").observe(elapsed)
+        usage = getattr(completion, "usage", None)
+        admission.record_usage(usage)
+        metrics.record_usage(model, usage)
+        if not kwargs.get("stream"):
+            metrics.record_completion(
+                model, stage, profile, completion.choices[0].finish_reason
+            )
+        return completion
+
+
+async def create_completion(
+    client: AsyncGroq, *, stage: str, outputs: int = 1, **kwargs
+):
+    """
+    Single entry point for chat completions from VLM, TranscriptionAnalysis
+    and LLMSynthesis.
+
+    Before each attempt the router may swap the requested model for another
+    tier of the stage (see ModelRouter), and the generation profile's
+    parameters for that model are added to the request; the caller can tell
+    from the completion's `model` which one answered. Each attempt gets the
+    stage timeout, shortened to what is left of the request deadline.
+    Transient errors are retried with jittered exponential backoff while the
+    budget allows, and for single-answer calls of stages in
+    UPSTREAM_HEDGE_STAGES a duplicate request is sent once the call has run
+    longer than the model's recent UPSTREAM_HEDGE_PERCENTILE latency. Every
+    request (hedges included) first waits for admission from the per-model
+    scheduler, and a 429 pauses that model's queue for the server's
+    retry-after. Transient errors and slow calls feed the model's circuit
+    breaker; while it is open (and the router has no other tier to offer) the
+    call raises CircuitOpen at once. 429s don't count against the model's
+    error rate or breaker.
+
+    Args:
+        client: The async Groq client
+        stage: "vlm", "transcription_analysis" or "synthesis"
+        outputs: Number of answers in the completion (batched VLM frames)
+        kwargs: Passed through to `chat.completions.create`, over the
+            generation profile's parameters
+    """
+    stats = _stats[stage]
+    stats["calls"] += 1
+    priority = current_priority()
+    if priority is None:
+        priority = Priority[c.SCHEDULER_STAGE_PRIORITIES.get(stage, "normal").upper()]
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            timeout = _attempt_timeout(stage)
+        except DeadlineExceeded:
+            stats["deadline_exceeded"] += 1
+            raise
+
+        model = router.choose(stage, kwargs["model"], kwargs["messages"], outputs)
+        if c.CIRCUIT_BREAKER_ENABLED and not breakers[model].allow():
+            # no tier of this stage is available: fail fast instead of queueing
+            stats["circuit_open"] += 1
+            metrics.CIRCUIT_REJECTED.labels(model, stage).inc()
+            raise CircuitOpen(model, breakers[model].retry_after())
+        request = {
+            **generation.params(stage, model, outputs),
+            **kwargs,
+            "model": model,
+        }
+        cost = estimate_request_tokens(
+            request["messages"],
+            request.get("max_completion_tokens") or request.get("max_tokens"),
+        )
+
+        try:
+            # a batched call would nearly always outlast the single-answer
+            # percentile, and duplicating it doubles its image tokens
+            hedge_delay = (
+                _hedge_delay(model)
+                if stage in c.UPSTREAM_HEDGE_STAGES
+                and outputs == 1
+                and not request.get("stream")
+                else None
+            )
+            if hedge_delay is not None and hedge_delay < timeout:
+                completion, was_hedged = await hedged(
+                    lambda: _admitted_create(
+                        client, stage, cost, priority, request, outputs
+                    ),
+                    hedge_delay,
+                )
+                if was_hedged:
+                    stats["hedges"] += 1
+            else:
+                completion = await _admitted_create(
+                    client, stage, cost, priority, request, outputs
+                )
+        except DeadlineExceeded:
+            # ran out of budget queued for admission
+            stats["deadline_exceeded"] += 1
+            raise
+        except TRANSIENT_ERRORS as e:
+            if isinstance(e, groq.RateLimitError):
+                scheduler.pause(model, retry_after(e))
+            delay = _retry_delay(attempt, e)
+            deadline = current_deadline()
+            out_of_budget = deadline is not None and (
+                deadline.remaining() < delay + c.UPSTREAM_MIN_ATTEMPT_SECONDS
+            )
+            if attempt >= c.UPSTREAM_MAX_ATTEMPTS or out_of_budget:
+                if deadline is not None and deadline.expired:
+                    stats["deadline_exceeded"] += 1
+                    raise DeadlineExceeded(
+                        f"Latency budget exhausted during {stage} call"
+                    ) from e
+                raise
+            stats["retries"] += 1
+            await asyncio.sleep(delay)
+            continue
+
+        return completion
+
+
+def stats() -> dict:
+    return {stage: dict(values) for stage, values in _stats.items()}
+
+
+def stream_stats() -> dict:
+    """
+    Median time to response headers of streamed calls, per model.
+    """
+    return {
+        model: {"p50_seconds": round(tracker.percentile(50), 3)}
+        for model, tracker in sorted(stream_latency.items())
+        if len(tracker)
+    }
+
+
+def circuit_stats() -> dict:
+    return {
+        "enabled": c.CIRCUIT_BREAKER_ENABLED,
+        "models": {
+            model: breaker.stats() for model, breaker in sorted(breakers.items())
+        },
+    }
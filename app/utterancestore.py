@@ -0,0 +1,248 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import config as c
+from .responsecache import SQLiteBackend
+
+
+class UtteranceState:
+    """
+    Speculation state of one utterance (see SpeculativeAnalysis).
+    """
+
+    __slots__ = ("snapshot", "text", "profile", "result", "speculated_at")
+
+    def __init__(
+        self,
+        snapshot: Optional[str],
+        text: Optional[str],
+        profile: Optional[str],
+        result: Optional[str],
+        speculated_at: Optional[float],
+    ):
+        self.snapshot = snapshot  # last partial transcript received
+        self.text = text  # text being / last speculatively analyzed
+        self.profile = profile  # generation profile of that analysis
+        # analysis JSON of `text`; "" when the speculation failed, None while it runs
+        self.result = result
+        self.speculated_at = speculated_at
+
+
+class MemoryUtteranceBackend:
+    """
+    Utterance states in process memory. Private to one worker.
+    """
+
+    blocking = False
+
+    def __init__(self, max_utterances: int, ttl: float):
+        self.max_utterances = max_utterances
+        self.ttl = ttl
+        # utterance id -> (updated_at, state); least recently updated first
+        self._utterances: OrderedDict[str, tuple[float, UtteranceState]] = OrderedDict()
+
+    def get(self, utterance_id: str) -> Optional[UtteranceState]:
+        entry = self._utterances.get(utterance_id)
+        if entry is None or entry[0] <= time.time() - self.ttl:
+            return None
+        return entry[1]
+
+    def update(
+        self,
+        utterance_id: str,
+        snapshot: str,
+        text: Optional[str],
+        profile: Optional[str],
+        now: float,
+    ):
+        entry = self._utterances.pop(utterance_id, None)
+        state = entry[1] if entry is not None else None
+        if state is None or state.text != text or state.profile != profile:
+            state = UtteranceState(snapshot, text, profile, None, now)
+        else:
+            state.snapshot = snapshot
+        self._utterances[utterance_id] = (now, state)
+        # abandoned utterances (never committed) past the TTL, then the oldest over the cap
+        while self._utterances:
+            updated_at, _ = next(iter(self._utterances.values()))
+            if (
+                updated_at > now - self.ttl
+                and len(self._utterances) <= self.max_utterances
+            ):
+                break
+            self._utterances.popitem(last=False)
+
+    def set_result(self, utterance_id: str, text: str, result: str):
+        entry = self._utterances.get(utterance_id)
+        if entry is not None and entry[1].text == text:
+            entry[1].result = result
+
+    def delete(self, utterance_id: str):
+        self._utterances.pop(utterance_id, None)
+
+    def stats(self) -> dict:
+        return {"utterances": len(self._utterances)}
+
+
+class SQLiteUtteranceBackend(SQLiteBackend):
+    """
+    Utterance states in a SQLite file, so partial transcripts and the final
+    commit of an utterance can be handled by different gunicorn workers.
+    """
+
+    EVICT_EVERY = 64  # writes between TTL and cap checks in this process
+
+    def __init__(self, path: str, max_utterances: int, ttl: float):
+        super().__init__(path)
+        self.max_utterances = max_utterances
+        self.ttl = ttl
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS utterances ("
+                " utterance_id TEXT PRIMARY KEY, snapshot TEXT, text TEXT,"
+                " profile TEXT, result TEXT, speculated_at REAL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS utterances_updated_at"
+                " ON utterances (updated_at)"
+            )
+
+    def get(self, utterance_id: str) -> Optional[UtteranceState]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT snapshot, text, profile, result, speculated_at FROM utterances"
+                " WHERE utterance_id = ? AND updated_at > ?",
+                (utterance_id, time.time() - self.ttl),
+            )
+            .fetchone()
+        )
+        return UtteranceState(*row) if row is not None else None
+
+    def update(
+        self,
+        utterance_id: str,
+        snapshot: str,
+        text: Optional[str],
+        profile: Optional[str],
+        now: float,
+    ):
+        conn = self._connect()
+        # a new text (or profile) starts a new speculation: its result isn't known yet
+        conn.execute(
+            "INSERT INTO utterances"
+            " (utterance_id, snapshot, text, profile, result, speculated_at, updated_at)"
+            " VALUES (?, ?, ?, ?, NULL, ?, ?)"
+            " ON CONFLICT (utterance_id) DO UPDATE SET"
+            " snapshot = excluded.snapshot,"
+            " result = CASE WHEN text IS excluded.text AND profile IS excluded.profile"
+            "  THEN result ELSE NULL END,"
+            " speculated_at = CASE WHEN text IS excluded.text"
+            "  AND profile IS excluded.profile"
+            "  THEN speculated_at ELSE excluded.speculated_at END,"
+            " text = excluded.text, profile = excluded.profile,"
+            " updated_at = excluded.updated_at",
+            (utterance_id, snapshot, text, profile, now, now),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM utterances WHERE updated_at <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM utterances WHERE utterance_id IN"
+            " (SELECT utterance_id FROM utterances ORDER BY updated_at DESC"
+            " LIMIT -1 OFFSET ?)",
+            (self.max_utterances,),
+        )
+
+    def set_result(self, utterance_id: str, text: str, result: str):
+        # only if the utterance hasn't moved on to a newer text meanwhile
+        self._connect().execute(
+            "UPDATE utterances SET result = ? WHERE utterance_id = ? AND text = ?",
+            (result, utterance_id, text),
+        )
+
+    def delete(self, utterance_id: str):
+        self._connect().execute(
+            "DELETE FROM utterances WHERE utterance_id = ?", (utterance_id,)
+        )
+
+
+class UtteranceStore:
+    """
+    Speculation state per utterance id, shared by the workers when the
+    backend is SQLite. Backend failures are counted and otherwise ignored
+    (the utterance is then analyzed without speculation).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.errors = 0
+
+    async def _call(self, method, *args):
+        try:
+            if self.backend.blocking:
+                return await asyncio.to_thread(method, *args)
+            return method(*args)
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+
+    async def get(self, utterance_id: str) -> Optional[UtteranceState]:
+        return await self._call(self.backend.get, utterance_id)
+
+    async def update(
+        self,
+        utterance_id: str,
+        snapshot: str,
+        text: Optional[str],
+        profile: Optional[str],
+    ):
+        """
+        Record the latest partial transcript and the text being speculated
+        on; a different text than before clears the previous result.
+        """
+        await self._call(
+            self.backend.update, utterance_id, snapshot, text, profile, time.time()
+        )
+
+    async def set_result(self, utterance_id: str, text: str, result: str):
+        """
+        Store the result of the speculation on `text`, unless the utterance
+        has moved on to another text since.
+        """
+        await self._call(self.backend.set_result, utterance_id, text, result)
+
+    async def delete(self, utterance_id: str):
+        await self._call(self.backend.delete, utterance_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "errors": self.errors,
+            **(self.backend.stats() if not self.backend.blocking else {}),
+        }
+
+
+def create_utterance_store() -> UtteranceStore:
+    """
+    Build the utterance store configured by SPECULATION_STORE_BACKEND ("sqlite" or "memory").
+    """
+    if c.SPECULATION_STORE_BACKEND == "sqlite":
+        backend = SQLiteUtteranceBackend(
+            c.SPECULATION_STORE_PATH,
+            c.SPECULATION_MAX_UTTERANCES,
+            c.SPECULATION_TTL_SECONDS,
+        )
+    else:
+        backend = MemoryUtteranceBackend(
+            c.SPECULATION_MAX_UTTERANCES, c.SPECULATION_TTL_SECONDS
+        )
+    return UtteranceStore(backend)
@@ -1,20 +1,58 @@
-import os
-from groq import Groq
+import asyncio
+import base64
+import json
+from contextlib import nullcontext
+from typing import Callable, Optional, Union
+
+from groq import AsyncGroq
+from pydantic import ValidationError
+
 import config as c
+from .groqclient import get_client
+from . import generation, prompts
+from .upstream import create_completion
+from .framecache import FrameCache
+from .resilience import CircuitOpen
+from .responsecache import cache_key
+from .schemas import SCENE_UNCLEAR, SceneAnalysis, extract_json, parse_analysis
+from .singleflight import SingleFlight
+
+# Image types accepted as raw request bodies or multipart uploads
+IMAGE_MIME_TYPES = ("image/jpeg", "image/png", "image/webp")
+
+
+def encode_image(image: bytes, mime_type: str = "image/jpeg") -> str:
+    """
+    Encode raw image bytes as the data URI the chat completions API expects.
+    """
+    if not image:
+        raise ValueError("Image body is empty")
+    return f"data:{mime_type};base64,{base64.b64encode(image).decode('ascii')}"
 
 
 class VLM:
-    def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-        if not self.client.api_key:
-            raise ValueError("GROQ_API_KEY not found in env vars")
+    def __init__(
+        self,
+        client: Optional[AsyncGroq] = None,
+        frame_cache: Optional[FrameCache] = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.frame_cache = frame_cache
+        self.single_flight = SingleFlight()
+        self.batches = 0
+        self.batch_fallbacks = 0
 
-    def get_response(self, base64_image: str, prompt: str = None):
+    async def get_response(
+        self, base64_image: str, prompt: str = None
+    ) -> Union[SceneAnalysis, str]:
         """
         Get VLM response from base64 encoded image.
+
+        With the default prompt the model runs in JSON mode and the result is
+        a validated SceneAnalysis; a custom prompt's output is returned as is.
         """
         # use custom prompt
-        sys_prompt = prompt if prompt is not None else c.GROQ_VLM_SYSTEM_PROMPT
+        sys_prompt = prompt if prompt is not None else prompts.VLM_SYSTEM_PROMPT
 
         # ensure base64 string doesn't have data URI prefix
         if base64_image.startswith("data:image"):
@@ -22,17 +60,249 @@ class VLM:
         else:
             image_url = f"data:image/jpeg;base64,{base64_image}"
 
-        chat_completion = self.client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": sys_prompt},
-                        {"type": "image_url", "image_url": {"url": image_url}},
-                    ],
-                }
-            ],
-            model=c.GROQ_VLM_MODEL,
+        # identical frames in flight at the same time share one upstream call
+        key = cache_key(
+            c.GROQ_VLM_MODEL, generation.current_profile(), sys_prompt, image_url
+        )
+        return await self.single_flight.do(
+            key, lambda: self._complete(image_url, sys_prompt, structured=prompt is None)
+        )
+
+    async def _complete(
+        self, image_url: str, sys_prompt: str, structured: bool
+    ) -> Union[SceneAnalysis, str]:
+        try:
+            chat_completion = await create_completion(
+                self.client,
+                stage="vlm",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": sys_prompt},
+                            {"type": "image_url", "image_url": {"url": image_url}},
+                        ],
+                    }
+                ],
+                model=c.GROQ_VLM_MODEL,
+                **_json_mode(structured),
+            )
+        except CircuitOpen:
+            # the VLM is cut off: answer at once with the prompt's own fallback
+            if not structured:
+                raise
+            return SCENE_UNCLEAR
+
+        content = chat_completion.choices[0].message.content
+        if not structured:
+            return content
+        return parse_analysis(SceneAnalysis, content, "vlm", SCENE_UNCLEAR)[0]
+
+    async def analyze_frame(
+        self, image_url: str, phash: Optional[int] = None, prompt: str = None
+    ) -> tuple[Union[SceneAnalysis, str], Optional[int]]:
+        """
+        Get VLM response for a preprocessed frame, reusing the result of a
+        recent near-identical frame when the frame cache has one.
+
+        Returns:
+            The VLM response and the Hamming distance of the cache hit (None on a miss)
+        """
+        if self.frame_cache is None or phash is None:
+            return await self.get_response(base64_image=image_url, prompt=prompt), None
+
+        cached = self.frame_cache.get(phash, prompt)
+        if cached is not None:
+            return cached
+
+        response = await self.get_response(base64_image=image_url, prompt=prompt)
+        if response is not SCENE_UNCLEAR:
+            self.frame_cache.put(phash, response, prompt)
+        return response, None
+
+    async def get_responses(
+        self,
+        image_urls: list[str],
+        prompt: str = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        on_result: Optional[Callable[[int, Union[SceneAnalysis, str]], None]] = None,
+    ) -> list[Union[SceneAnalysis, str]]:
+        """
+        Get VLM responses for several frames, packing up to VLM_BATCH_SIZE
+        frames into each chat completion so the system prompt is sent once
+        per batch instead of once per frame.
+
+        Args:
+            image_urls: Base64 encoded images (with or without data URI prefix), in order
+            prompt: Optional custom prompt to override the default system prompt
+            semaphore: Optional bound on concurrent upstream calls
+            on_result: Called with (frame index, analysis) as each batch finishes,
+                so hazards can be acted on before the slowest batch is back
+
+        Returns:
+            One VLM response per frame, in the same order
+        """
+        size = max(1, c.VLM_BATCH_SIZE)
+
+        async def batch(start: int) -> list[Union[SceneAnalysis, str]]:
+            analyses = await self._get_batch(
+                image_urls[start : start + size], prompt, semaphore
+            )
+            if on_result is not None:
+                for i, analysis in enumerate(analyses):
+                    on_result(start + i, analysis)
+            return analyses
+
+        results = await asyncio.gather(
+            *[batch(start) for start in range(0, len(image_urls), size)]
+        )
+        return [analysis for analyses in results for analysis in analyses]
+
+    async def _get_batch(
+        self,
+        image_urls: list[str],
+        prompt: Optional[str],
+        semaphore: Optional[asyncio.Semaphore],
+    ) -> list[Union[SceneAnalysis, str]]:
+        limit = semaphore if semaphore is not None else nullcontext()
+
+        if len(image_urls) == 1:
+            async with limit:
+                return [await self.get_response(base64_image=image_urls[0], prompt=prompt)]
+
+        sys_prompt = prompt if prompt is not None else prompts.VLM_SYSTEM_PROMPT
+        content = [
+            {
+                "type": "text",
+                "text": sys_prompt
+                + prompts.VLM_BATCH_INSTRUCTIONS.format(count=len(image_urls)),
+            }
+        ]
+        for i, image_url in enumerate(image_urls):
+            if not image_url.startswith("data:image"):
+                image_url = f"data:image/jpeg;base64,{image_url}"
+            content.append({"type": "text", "text": f"Frame {i + 1}:"})
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+
+        structured = prompt is None
+        try:
+            async with limit:
+                chat_completion = await create_completion(
+                    self.client,
+                    stage="vlm",
+                    messages=[{"role": "user", "content": content}],
+                    model=c.GROQ_VLM_MODEL,
+                    outputs=len(image_urls),
+                    **_json_mode(structured),
+                )
+        except CircuitOpen:
+            if not structured:
+                raise
+            return [SCENE_UNCLEAR] * len(image_urls)
+        self.batches += 1
+
+        analyses = _split_batch(
+            chat_completion.choices[0].message.content, len(image_urls), structured
+        )
+        if analyses is not None:
+            return analyses
+
+        # the model didn't return one analysis per frame; redo them one by one
+        self.batch_fallbacks += 1
+
+        async def single(image_url: str) -> Union[SceneAnalysis, str]:
+            async with limit:
+                return await self.get_response(base64_image=image_url, prompt=prompt)
+
+        return list(await asyncio.gather(*[single(url) for url in image_urls]))
+
+    async def analyze_frames(
+        self,
+        frames: list[tuple[str, Optional[int]]],
+        prompt: str = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        on_result: Optional[Callable[[int, Union[SceneAnalysis, str]], None]] = None,
+    ) -> list[Union[SceneAnalysis, str]]:
+        """
+        Batched counterpart of `analyze_frame`: frames the frame cache can
+        answer are served from it, the rest go through `get_responses`.
+
+        Args:
+            frames: (image_url, phash) pairs for preprocessed frames, in order
+            on_result: Called with (frame index, analysis) as each frame's analysis is ready
+
+        Returns:
+            One VLM response per frame, in the same order
+        """
+        results: list[Optional[Union[SceneAnalysis, str]]] = [None] * len(frames)
+        misses = []
+        for i, (_, phash) in enumerate(frames):
+            if self.frame_cache is not None and phash is not None:
+                cached = self.frame_cache.get(phash, prompt)
+                if cached is not None:
+                    results[i] = cached[0]
+                    if on_result is not None:
+                        on_result(i, cached[0])
+                    continue
+            misses.append(i)
+
+        analyses = await self.get_responses(
+            [frames[i][0] for i in misses],
+            prompt=prompt,
+            semaphore=semaphore,
+            on_result=(
+                (lambda j, analysis: on_result(misses[j], analysis))
+                if on_result is not None
+                else None
+            ),
         )
+        for i, analysis in zip(misses, analyses):
+            results[i] = analysis
+            phash = frames[i][1]
+            if (
+                self.frame_cache is not None
+                and phash is not None
+                and analysis is not SCENE_UNCLEAR
+            ):
+                self.frame_cache.put(phash, analysis, prompt)
+        return results
+
+    def batch_stats(self) -> dict:
+        return {
+            "batch_size": c.VLM_BATCH_SIZE,
+            "batches": self.batches,
+            "fallbacks": self.batch_fallbacks,
+        }
+
+
+def _json_mode(structured: bool) -> dict:
+    # JSON mode only for the default prompt; custom prompts may ask for plain text
+    return {"response_format": {"type": "json_object"}} if structured else {}
+
+
+def _split_batch(
+    content: Optional[str], count: int, structured: bool = True
+) -> Optional[list[Union[SceneAnalysis, str]]]:
+    """
+    Split a batched VLM completion into one analysis per frame: a validated
+    SceneAnalysis each, or (custom prompt) one JSON string each.
 
-        return chat_completion.choices[0].message.content
+    Returns:
+        The per-frame analyses, or None if the output isn't exactly `count` valid objects
+    """
+    try:
+        parsed = json.loads(content or "")
+    except ValueError:
+        parsed = extract_json(content or "")
+    if isinstance(parsed, dict):
+        parsed = parsed.get("frames")
+    if not isinstance(parsed, list) or len(parsed) != count:
+        return None
+    if not all(isinstance(frame, dict) for frame in parsed):
+        return None
+    if not structured:
+        return [json.dumps(frame, ensure_ascii=False) for frame in parsed]
+    try:
+        return [SceneAnalysis.model_validate(frame) for frame in parsed]
+    except ValidationError:
+        return None
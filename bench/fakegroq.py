@@ -0,0 +1,233 @@
+"""
+Local stand-in for the Groq chat completions API, for benchmarking without
+hitting Groq.
+
+Serves `POST /openai/v1/chat/completions` with canned VLM, transcription
+analysis and synthesis outputs (picked by stage, whatever the model), with
+lognormal latency, injected 5xx errors and 429s, and SSE streaming. Point the
+API at it with GROQ_BASE_URL:
+
+    python -m bench.fakegroq --port 9000 --latency-ms 300 --rate-limit-rate 0.02
+    GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=fake uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from groq.resources.chat.completions import AsyncCompletions
+
+VLM_RESPONSE = {
+    "hazard": "none",
+    "people": "2 front 3 m walking away",
+    "actions": ["walking forward"],
+    "objects": ["door front 5 m", "sign: Exit"],
+    "path": "clear front 4 m",
+    "notes": "indoor hallway, bright",
+    "confidence": 0.9,
+}
+TRANSCRIPTION_RESPONSE = {
+    "context": "User asking for directions to the exit",
+    "keywords": ["exit", "where"],
+    "domain": "navigation",
+    "actions": ["find exit"],
+    "tone": "neutral",
+    "confidence": 0.92,
+}
+SYNTHESIS_RESPONSE = (
+    "The exit is straight ahead, about 5 meters away. "
+    "Two people are walking in front of you in the same direction. "
+    "The path is clear."
+)
+
+# Body fields the groq SDK can send; anything else means the caller relies on
+# a parameter the real client would reject before making the request
+SDK_PARAMS = frozenset(inspect.signature(AsyncCompletions.create).parameters) - {
+    "self",
+    "extra_headers",
+    "extra_query",
+    "extra_body",
+    "timeout",
+}
+
+
+@dataclass
+class FakeSettings:
+    latency_ms: float = 300.0  # median time to the first byte
+    latency_sigma: float = 0.35  # lognormal shape; 0 makes latency constant
+    token_ms: float = 15.0  # delay between streamed chunks
+    error_rate: float = 0.0  # fraction answered with 500
+    rate_limit_rate: float = 0.0  # fraction answered with 429
+    retry_after: float = 1.0
+
+
+def _latency(settings: FakeSettings) -> float:
+    median = settings.latency_ms / 1000
+    if settings.latency_sigma <= 0:
+        return median
+    return random.lognormvariate(math.log(median), settings.latency_sigma)
+
+
+def _image_count(messages: list[dict]) -> int:
+    return sum(
+        1
+        for message in messages
+        if isinstance(message["content"], list)
+        for part in message["content"]
+        if part.get("type") == "image_url"
+    )
+
+
+def _content(body: dict) -> str:
+    # picked by stage, not model: the router sends any text stage to any tier
+    count = _image_count(body.get("messages", []))
+    if count > 1:
+        return json.dumps({"frames": [VLM_RESPONSE] * count})
+    if count == 1:
+        return json.dumps(VLM_RESPONSE)
+    if body.get("response_format") is not None:
+        # only transcription analysis asks for JSON without images
+        return json.dumps(TRANSCRIPTION_RESPONSE)
+    return SYNTHESIS_RESPONSE
+
+
+def _usage(body: dict, content: str) -> dict:
+    prompt_chars = sum(
+        len(message["content"])
+        if isinstance(message["content"], str)
+        else sum(len(part.get("text", "")) for part in message["content"])
+        for message in body.get("messages", [])
+    )
+    prompt_tokens = prompt_chars // 4 + 800 * _image_count(body.get("messages", []))
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _error(status: int, message: str, kind: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "type": kind}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+def create_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    counts = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    @app.get("/stats")
+    async def stats():
+        return counts
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counts["requests"] += 1
+        unsupported = sorted(set(body) - SDK_PARAMS)
+        if unsupported:
+            return _error(
+                400,
+                f"Unsupported parameters: {', '.join(unsupported)}",
+                "invalid_request_error",
+            )
+        await asyncio.sleep(_latency(settings))
+
+        roll = random.random()
+        if roll < settings.rate_limit_rate:
+            counts["rate_limited"] += 1
+            return _error(
+                429,
+                "Rate limit reached (fake)",
+                "rate_limit_exceeded",
+                headers={"retry-after": str(settings.retry_after)},
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            counts["errors"] += 1
+            return _error(500, "Internal server error (fake)", "internal_server_error")
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        content = _content(body)
+        usage = _usage(body, content)
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if chunk_usage is not None:
+                # like Groq: usage rides on the last chunk, under x_groq
+                payload["x_groq"] = {"id": f"req_{completion_id}", "usage": chunk_usage}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for word in content.split(" "):
+                await asyncio.sleep(settings.token_ms / 1000)
+                yield chunk({"content": word + " "})
+            yield chunk({}, finish_reason="stop", chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    defaults = FakeSettings()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument("--token-ms", type=float, default=defaults.token_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    args = parser.parse_args()
+
+    settings = FakeSettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        token_ms=args.token_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
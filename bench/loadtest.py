@@ -0,0 +1,311 @@
+"""
+Load-test harness: replays a JSONL request log against the API and reports
+throughput and p50/p95/p99 latency per endpoint.
+
+Each log line is one request:
+
+    {"endpoint": "/api/vlm", "body": {"base64_image": "..."}}
+    {"endpoint": "/api/transcription-analysis", "body": {"transcript": "..."}}
+    {"endpoint": "/api/synthesize", "body": {"transcription_analysis": "...", "surrounding_analysis": ["..."]}}
+
+Against a running server:
+
+    python -m bench.loadtest --make-log bench/sample.jsonl --count 200
+    python -m bench.loadtest --log bench/sample.jsonl --url http://127.0.0.1:8000 --token secret
+
+Or let the harness start the fake Groq server and one gunicorn per worker
+count, and compare them:
+
+    python -m bench.loadtest --log bench/sample.jsonl --workers 1,2,4 --json results.json
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+
+import config as c
+from app.resilience import percentile
+
+TRANSCRIPTS = [
+    "Where is the exit?",
+    "Is it safe to cross the street now?",
+    "Can you read that sign for me?",
+    "Who is walking towards me?",
+    "Remind me to schedule the meeting for Tuesday.",
+    "What's on the table in front of me?",
+]
+
+
+def _frame(seed: int) -> str:
+    """
+    A synthetic 640x480 JPEG frame: random blocks, so frames don't all hash alike.
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(440)
+        draw.rectangle(
+            (x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)),
+            fill=tuple(rng.randrange(256) for _ in range(3)),
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def make_log(path: str, count: int, seed: int = 0):
+    """
+    Write a synthetic request log: 60% VLM frames, 20% transcripts, 20% synthesis.
+    """
+    rng = random.Random(seed)
+    frames = [_frame(seed + i) for i in range(min(count, 32))]
+    with open(path, "w") as f:
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.6:
+                entry = {"endpoint": "/api/vlm", "body": {"base64_image": rng.choice(frames)}}
+            elif roll < 0.8:
+                entry = {
+                    "endpoint": "/api/transcription-analysis",
+                    "body": {"transcript": rng.choice(TRANSCRIPTS)},
+                }
+            else:
+                entry = {
+                    "endpoint": "/api/synthesize",
+                    "body": {
+                        "transcription_analysis": json.dumps(
+                            {"context": rng.choice(TRANSCRIPTS), "confidence": 0.9}
+                        ),
+                        "surrounding_analysis": [
+                            json.dumps({"hazard": "none", "path": "clear front 4 m"})
+                        ],
+                    },
+                }
+            f.write(json.dumps(entry) + "\n")
+
+
+def load_log(path: str) -> list[dict]:
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    for entry in entries:
+        if "endpoint" not in entry or "body" not in entry:
+            raise ValueError(f"{path}: every line needs 'endpoint' and 'body'")
+    return entries
+
+
+async def replay(
+    url: str,
+    entries: list[dict],
+    total: int,
+    concurrency: int,
+    token: Optional[str],
+) -> dict:
+    """
+    Send `total` requests from `entries` (cycling through the log) with
+    `concurrency` requests in flight, and summarize latency per endpoint.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    next_index = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        for i in next_index:
+            entry = entries[i % len(entries)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    entry["endpoint"],
+                    json=entry["body"],
+                    headers={**headers, **entry.get("headers", {})},
+                )
+                outcome = response.status_code
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if outcome == 200:
+                latencies[entry["endpoint"]].append(elapsed)
+            else:
+                errors[entry["endpoint"]][str(outcome)] += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        wall = time.perf_counter() - started
+
+    summary = {}
+    for endpoint in sorted(set(latencies) | set(errors)):
+        ordered = sorted(latencies[endpoint])
+        summary[endpoint] = {
+            "ok": len(ordered),
+            "errors": dict(errors[endpoint]),
+            "throughput_rps": round(len(ordered) / wall, 2),
+            **{
+                f"p{p}_ms": (
+                    round(percentile(ordered, p) * 1000, 1) if ordered else None
+                )
+                for p in (50, 95, 99)
+            },
+        }
+    ok = sum(len(values) for values in latencies.values())
+    return {
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(ok / wall, 2),
+        "endpoints": summary,
+    }
+
+
+def print_report(label: str, result: dict):
+    print(f"\n== {label}: {result['throughput_rps']} req/s over {result['wall_seconds']} s")
+    print(f"{'endpoint':<30} {'ok':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, stats in result["endpoints"].items():
+        print(
+            f"{endpoint:<30} {stats['ok']:>6} {sum(stats['errors'].values()):>5} "
+            f"{stats['throughput_rps']:>8} {stats['p50_ms'] or '-':>8} "
+            f"{stats['p95_ms'] or '-':>8} {stats['p99_ms'] or '-':>8}"
+        )
+        if stats["errors"]:
+            print(f"{'':<30} errors: {stats['errors']}")
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout} s")
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_worker_matrix(args, entries: list[dict]) -> dict:
+    """
+    Start the fake Groq server, then for each worker count a gunicorn pointed
+    at it, replay the log and collect the results.
+    """
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fakegroq",
+            "--port", str(args.fake_port),
+            "--latency-ms", str(args.fake_latency_ms),
+            "--error-rate", str(args.fake_error_rate),
+            "--rate-limit-rate", str(args.fake_rate_limit_rate),
+        ]
+    )
+    results = {}
+    try:
+        _wait_until_up(f"{fake_url}/stats", fake)
+        for workers in args.workers:
+            # start each configuration with a cold response cache
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(c.RESPONSE_CACHE_PATH + suffix):
+                    os.remove(c.RESPONSE_CACHE_PATH + suffix)
+            env = {
+                **os.environ,
+                "GROQ_BASE_URL": fake_url,
+                "GROQ_API_KEY": "fake",
+                "API_AUTH_TOKEN": args.token,
+            }
+            server = subprocess.Popen(
+                [
+                    "gunicorn", "-c", "gunicorn_conf.py",
+                    "-w", str(workers),
+                    "-b", f"127.0.0.1:{args.port}",
+                    "--log-level", "warning", "--access-logfile", "/dev/null",
+                    "app.main:app",
+                ],
+                env=env,
+            )
+            url = f"http://127.0.0.1:{args.port}"
+            try:
+                _wait_until_up(f"{url}/health", server)
+                result = asyncio.run(
+                    replay(url, entries, args.requests, args.concurrency, args.token)
+                )
+            finally:
+                _stop(server)
+            results[f"workers={workers}"] = result
+            print_report(f"{workers} worker(s)", result)
+    finally:
+        _stop(fake)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0].strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--log", help="JSONL request log to replay")
+    parser.add_argument("--make-log", metavar="PATH", help="write a synthetic log and exit")
+    parser.add_argument("--count", type=int, default=200, help="entries for --make-log")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default=os.environ.get("API_AUTH_TOKEN", "bench"))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, help="requests to send (default: the whole log once)")
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(n) for n in value.split(",")],
+        help="comma separated gunicorn worker counts; starts the fake Groq server and the API itself",
+    )
+    parser.add_argument("--port", type=int, default=8100, help="API port with --workers")
+    parser.add_argument("--fake-port", type=int, default=9000)
+    parser.add_argument("--fake-latency-ms", type=float, default=300)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--fake-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.make_log:
+        make_log(args.make_log, args.count)
+        print(f"Wrote {args.count} requests to {args.make_log}")
+        return
+    if not args.log:
+        parser.error("--log is required (create one with --make-log)")
+
+    entries = load_log(args.log)
+    args.requests = args.requests or len(entries)
+    if args.workers:
+        results = run_worker_matrix(args, entries)
+    else:
+        result = asyncio.run(
+            replay(args.url, entries, args.requests, args.concurrency, args.token)
+        )
+        print_report(args.url, result)
+        results = {args.url: result}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
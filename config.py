@@ -1,7 +1,264 @@
 GROQ_LLM_SYNTHESIS_MODEL = "openai/gpt-oss-20b"
 GROQ_TRANSCRIPTION_ANALYSIS_MODEL = "openai/gpt-oss-120b"
 GROQ_VLM_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
-GROQ_SYNTHESIS_SYSTEM_PROMPT = """
+GROQ_FAST_FALLBACK_MODEL = "llama-3.1-8b-instant"  # last tier for the text stages
+
+# Shared async HTTP client (one connection pool per worker process)
+GROQ_MAX_CONNECTIONS = 200
+GROQ_MAX_KEEPALIVE_CONNECTIONS = 50
+GROQ_KEEPALIVE_EXPIRY = 30.0
+GROQ_REQUEST_TIMEOUT = 30.0
+GROQ_CONNECT_TIMEOUT = 5.0
+
+# Latency budget, timeouts, retries and hedging for upstream calls (app/upstream.py)
+REQUEST_DEFAULT_BUDGET_SECONDS = 55.0  # under gunicorn/nginx's 60 s; override with X-Deadline-Ms
+REQUEST_MAX_BUDGET_SECONDS = 55.0
+UPSTREAM_STAGE_TIMEOUTS = {
+    "vlm": 8.0,
+    "transcription_analysis": 10.0,
+    "synthesis": 12.0,
+}
+UPSTREAM_MAX_ATTEMPTS = 3
+UPSTREAM_BACKOFF_BASE_SECONDS = 0.2
+UPSTREAM_BACKOFF_MAX_SECONDS = 2.0
+UPSTREAM_MIN_ATTEMPT_SECONDS = 0.25  # don't start an attempt with less budget than this
+UPSTREAM_HEDGE_STAGES = ("vlm",)
+UPSTREAM_HEDGE_PERCENTILE = 95
+UPSTREAM_HEDGE_MIN_SAMPLES = 20
+UPSTREAM_HEDGE_MIN_DELAY_SECONDS = 0.3
+
+# Model routing (app/router.py): per stage, models in order of preference. A call
+# goes to the first model that isn't rate-limited or failing and whose recent
+# ROUTER_LATENCY_PERCENTILE latency (plus scheduler wait) fits both the stage
+# target and the request's remaining budget. Only the first tier's results are cached.
+ROUTER_ENABLED = True
+ROUTER_TIERS = {
+    "transcription_analysis": (
+        GROQ_TRANSCRIPTION_ANALYSIS_MODEL,
+        GROQ_LLM_SYNTHESIS_MODEL,
+        GROQ_FAST_FALLBACK_MODEL,
+    ),
+    "synthesis": (GROQ_LLM_SYNTHESIS_MODEL, GROQ_FAST_FALLBACK_MODEL),
+}
+ROUTER_STAGE_TARGET_SECONDS = {
+    "transcription_analysis": 2.0,
+    "synthesis": 2.5,
+}
+ROUTER_LATENCY_PERCENTILE = 90
+ROUTER_MIN_SAMPLES = 10  # per model, before its latency / error rate are trusted
+ROUTER_MAX_ERROR_RATE = 0.25  # over the last 50 calls
+ROUTER_PROBE_RATE = 0.05  # calls kept on a slow or failing primary so its stats recover
+
+# Circuit breaker per upstream model (app/resilience.py). A model whose recent calls
+# mostly fail or are slow is cut off for CIRCUIT_OPEN_SECONDS: the router skips it,
+# and when no tier of the stage is left, VLM and transcription analysis answer at
+# once with their prompts' fallbacks (SCENE_UNCLEAR / TRANSCRIPT_NO_SALIENT) and
+# synthesis fails fast with a 503. Afterwards single probe calls test recovery.
+CIRCUIT_BREAKER_ENABLED = True
+CIRCUIT_WINDOW_CALLS = 50
+CIRCUIT_WINDOW_SECONDS = 30.0
+CIRCUIT_MIN_CALLS = 10  # in the window before the breaker may open
+CIRCUIT_MAX_ERROR_RATE = 0.5  # transient errors and timeouts
+CIRCUIT_MAX_SLOW_RATE = 0.5
+CIRCUIT_SLOW_CALL_SECONDS = {
+    "vlm": 4.0,
+    "transcription_analysis": 5.0,
+    "synthesis": 6.0,
+}
+CIRCUIT_OPEN_SECONDS = 10.0
+CIRCUIT_PROBE_INTERVAL_SECONDS = 1.0  # while half-open, one probe call per interval
+CIRCUIT_CLOSE_AFTER_PROBES = 2
+
+# /api/pipeline fan-out
+PIPELINE_MAX_CONCURRENCY = 8  # upstream calls in flight per pipeline request
+PIPELINE_MAX_FRAMES = 16
+
+# Offline batch processing of recorded sessions (python -m app.batch). Calls run at
+# BACKGROUND priority through the scheduler, so the rate limits bound throughput.
+BATCH_CONCURRENCY = 32  # sessions in flight
+BATCH_MAX_FRAMES = PIPELINE_MAX_FRAMES  # frames analyzed per session, evenly spaced
+BATCH_SESSION_BUDGET_SECONDS = 300.0  # includes time queued behind the rate limits
+
+# Server-side scene memory per session id (app/scenestore.py): fed by /api/vlm,
+# /api/pipeline and /api/session, read by synthesis. "sqlite" is shared by all
+# gunicorn workers on the host, "memory" is per worker.
+SCENE_STORE_BACKEND = "sqlite"
+SCENE_STORE_PATH = "/tmp/jarvis-scenes.sqlite3"
+SCENE_STORE_MAX_SCENES = 32  # ring buffer size per session
+SCENE_STORE_TTL_SECONDS = 300  # scenes (and idle sessions) expire after this
+SCENE_STORE_MAX_BYTES = 16 * 1024 * 1024  # across all sessions
+SCENE_STORE_DEFAULT_WINDOW_SECONDS = 10.0
+
+# Speculative transcription analysis on partial transcripts (app/speculation.py)
+SPECULATION_ENABLED = True
+SPECULATION_MIN_WORDS = 3  # shorter stable prefixes aren't worth a call
+SPECULATION_BUDGET_SECONDS = 10.0  # latency budget of one speculative call
+SPECULATION_TTL_SECONDS = 60.0  # utterances never committed are dropped after this
+SPECULATION_MAX_UTTERANCES = 1024
+# Utterance state shared by the gunicorn workers ("sqlite"), or per worker
+# ("memory"), in which case partials and commits must reach the same worker
+SPECULATION_STORE_BACKEND = "sqlite"
+SPECULATION_STORE_PATH = "/tmp/jarvis-utterances.sqlite3"
+# A commit waits this long for a speculation still running on another worker
+SPECULATION_REMOTE_WAIT_SECONDS = 1.0
+SPECULATION_REMOTE_POLL_SECONDS = 0.05
+# A speculative analysis is reused when the final transcript only adds up to
+# this many of these trailing words
+SPECULATION_MAX_TRIVIAL_WORDS = 3
+SPECULATION_TRIVIAL_WORDS = frozenset(
+    {
+        "um", "uh", "er", "ah", "hmm", "mm", "ok", "okay", "please", "thanks",
+        "thank", "you", "now", "jarvis", "hey", "yeah",
+    }
+)
+
+# /api/session WebSocket (app/session.py)
+SESSION_WINDOW_FRAMES = 8  # recent scene analyses per session used for synthesis
+SESSION_WINDOW_SECONDS = 10.0
+SESSION_MAX_FRAMES_IN_FLIGHT = 2  # frames arriving while this many are analyzed are skipped
+SESSION_FRAME_BUDGET_SECONDS = 5.0  # latency budget of one frame's analysis
+SESSION_FRAME_WAIT_SECONDS = 1.0  # at the end of an utterance, wait for frames in flight
+SESSION_MAX_UTTERANCE_CHARS = 8000
+SESSION_IDLE_TIMEOUT_SECONDS = 300.0
+
+# Frame normalization before the VLM call (GROQ_VLM_SYSTEM_PROMPT assumes 386x386)
+VLM_PREPROCESS_ENABLED = True
+VLM_FRAME_SIZE = 386
+VLM_JPEG_QUALITY = 85
+VLM_PREPROCESS_WORKERS = 1  # processes per gunicorn worker
+
+# Hazard alert fast path (app/alerts.py): a frame analysis reporting a hazard
+# produces a short alert right away, ahead of (and alongside) full synthesis
+HAZARD_ALERT_ENABLED = True
+HAZARD_ALERT_TEMPLATE = "Careful: {hazard}."
+HAZARD_ALERT_IGNORE = ("unclear", "unknown")  # hazard values that aren't alerted
+HAZARD_ALERT_REPEAT_SECONDS = 5.0  # live sessions: re-alert the same hazard after this
+
+# Multi-frame VLM batching: frames packed into one chat completion (Groq allows up to 5 images)
+VLM_BATCH_SIZE = 5
+GROQ_VLM_BATCH_INSTRUCTIONS = """
+You will receive {count} frames labelled Frame 1 to Frame {count}, in capture order.
+Analyze each frame independently using the rules above.
+Output one JSON object of the form {{"frames": [...]}} whose "frames" array has exactly {count} entries,
+one per frame in the same order, each following output_schema.
+"""
+
+# Perceptual-hash cache for near-identical consecutive frames (needs preprocessing)
+FRAME_CACHE_ENABLED = True
+FRAME_CACHE_MAX_ENTRIES = 256
+FRAME_CACHE_TTL_SECONDS = 3.0
+FRAME_CACHE_MAX_DISTANCE = 4  # Hamming distance out of 64 bits
+# Frames whose hash thumbnail spans fewer gray levels get no hash (and aren't cached):
+# a flat frame hashes to 0 whether it is black, white or anything in between
+FRAME_CACHE_MIN_CONTRAST = 8
+
+# In-process near-duplicate index of transcript analyses (app/transcriptindex.py):
+# MinHash/LSH over word shingles, reused above a Jaccard similarity threshold
+TRANSCRIPT_INDEX_ENABLED = True
+TRANSCRIPT_INDEX_MAX_ENTRIES = 2048  # per worker
+TRANSCRIPT_INDEX_TTL_SECONDS = 3600
+TRANSCRIPT_INDEX_MIN_SIMILARITY = 0.8  # Jaccard similarity of the shingle sets
+TRANSCRIPT_INDEX_MIN_CONFIDENCE = 0.8  # only reuse analyses the model was sure of
+TRANSCRIPT_INDEX_SHINGLE_SIZE = 2  # shingles are runs of 1 to this many words
+# LSH banding of the MinHash signature (BANDS * ROWS permutations); candidates
+# are found down to a similarity of about (1 / BANDS) ** (1 / ROWS) ≈ 0.5
+TRANSCRIPT_INDEX_BANDS = 16
+TRANSCRIPT_INDEX_ROWS = 4
+
+# Content-addressed cache for transcription analysis and synthesis results.
+# "sqlite" is shared by all gunicorn workers on the host, "memory" is per worker, None disables.
+RESPONSE_CACHE_BACKEND = "sqlite"
+RESPONSE_CACHE_PATH = "/tmp/jarvis-response-cache.sqlite3"
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_TTL_SECONDS = 3600
+
+# Admission control in front of Groq (app/scheduler.py). Limits are per deployment
+# (set them to the account's tier) and are split evenly across gunicorn workers.
+SCHEDULER_MODEL_LIMITS = {
+    GROQ_VLM_MODEL: {"max_concurrency": 30, "tokens_per_minute": 300_000},
+    GROQ_TRANSCRIPTION_ANALYSIS_MODEL: {"max_concurrency": 16, "tokens_per_minute": 250_000},
+    GROQ_LLM_SYNTHESIS_MODEL: {"max_concurrency": 32, "tokens_per_minute": 250_000},
+    GROQ_FAST_FALLBACK_MODEL: {"max_concurrency": 32, "tokens_per_minute": 250_000},
+}
+SCHEDULER_DEFAULT_LIMITS = {"max_concurrency": 8, "tokens_per_minute": 60_000}
+SCHEDULER_MAX_QUEUE = 200  # queued calls per model before shedding with 503
+SCHEDULER_OVERLOAD_RETRY_AFTER_SECONDS = 1.0
+SCHEDULER_STAGE_PRIORITIES = {  # when the client sends no X-Priority
+    "vlm": "high",
+    "transcription_analysis": "normal",
+    "synthesis": "normal",
+}
+# Token estimates used for budgeting before the real usage is known
+CHARS_PER_TOKEN = 4
+TOKENS_PER_IMAGE = 800
+DEFAULT_COMPLETION_TOKENS = 256
+
+# Sampled request profiling (app/profiling.py); off unless JARVIS_PROFILE_DIR is set.
+# JARVIS_PROFILE_SAMPLE_RATE / JARVIS_PROFILE_MIN_MS override the defaults below.
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_MIN_DURATION_MS = 1000
+PROFILE_INTERVAL_SECONDS = 0.001
+
+# Prompt compaction (app/prompts.py): system prompts are minified once at startup
+# and the frame analyses sent to synthesis are deduplicated and capped.
+PROMPT_COMPACTION_ENABLED = True
+PROMPT_DROP_KEYS = ("implementation_tips",)  # notes for developers, not the model
+SYNTHESIS_CONTEXT_MAX_TOKENS = 1200  # frame analyses in the synthesis user message
+
+# Generation profiles (app/generation.py): output bounds and sampling per stage,
+# selected per request with X-Generation-Profile. For the gpt-oss models
+# max_completion_tokens also covers reasoning tokens, so it leaves headroom above
+# the answer lengths in the prompts' implementation_tips (VLM ≤60, transcription
+# analysis ≤80, synthesis ≤150); VLM limits are per frame.
+GENERATION_DEFAULT_PROFILE = "default"
+GENERATION_PROFILES = {
+    "default": {
+        "vlm": {"max_completion_tokens": 160, "temperature": 0.3},
+        "transcription_analysis": {
+            "max_completion_tokens": 400,
+            "temperature": 0.4,
+            "reasoning_effort": "low",
+        },
+        "synthesis": {
+            "max_completion_tokens": 400,
+            "temperature": 0.7,
+            "reasoning_effort": "low",
+        },
+    },
+    "fast": {
+        "vlm": {"max_completion_tokens": 120, "temperature": 0.2},
+        "transcription_analysis": {
+            "max_completion_tokens": 250,
+            "temperature": 0.3,
+            "reasoning_effort": "low",
+        },
+        "synthesis": {
+            "max_completion_tokens": 250,
+            "temperature": 0.6,
+            "reasoning_effort": "low",
+            "stop": ["\n\n"],  # one paragraph
+        },
+    },
+    "quality": {
+        "vlm": {"max_completion_tokens": 256, "temperature": 0.3},
+        "transcription_analysis": {
+            "max_completion_tokens": 1024,
+            "temperature": 0.4,
+            "reasoning_effort": "medium",
+        },
+        "synthesis": {
+            "max_completion_tokens": 1024,
+            "temperature": 0.7,
+            "reasoning_effort": "medium",
+        },
+    },
+}
+# Per-model parameters merged over every profile, e.g. {"some/model": {"temperature": None}}
+# to stop sending a parameter a model rejects
+GENERATION_MODEL_OVERRIDES = {}
+GENERATION_REASONING_MODELS = (GROQ_LLM_SYNTHESIS_MODEL, GROQ_TRANSCRIPTION_ANALYSIS_MODEL)
+
+GROQ_SYNTHESIS_SYSTEM_PROMPT = r"""
 {
   "name": "Jarvis Synthesis",
   "role": "You are Jarvis, an AI companion that synthesizes audio transcription analysis and visual scene analysis into natural, conversational responses for a user.",
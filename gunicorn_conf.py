@@ -1,5 +1,7 @@
 # gunicorn_conf.py
 import multiprocessing
+import os
+import shutil
 
 # For t3.small/t2.micro memory, start conservative; tune up if stable.
 workers = max(2, multiprocessing.cpu_count() * 2 + 1)  # usually 3 on 1 vCPU
@@ -14,5 +16,26 @@ accesslog = "-"
 errorlog = "-"
 loglevel = "info"
 
-# Slightly smaller worker connections; your endpoints are CPU-light but may hit VLM I/O
+# Endpoints await Groq I/O on the event loop, so each worker keeps many calls in flight
 worker_connections = 1000
+
+# Prometheus multiprocess mode: each worker writes its samples here and /metrics
+# merges them. Must be set before the workers import prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/jarvis-prometheus")
+
+
+def on_starting(server):
+    # lets each worker's scheduler take its share of the per-model rate limits
+    # (server.cfg.workers also reflects a -w given on the command line)
+    os.environ["JARVIS_WORKERS"] = str(server.cfg.workers)
+
+    # samples from a previous run would otherwise be merged into the new one
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,24 @@
+import os
+
+import httpx
+from groq import AsyncGroq
+
+from bench.fakegroq import FakeSettings, create_app
+
+# app.main creates its services (and their Groq client) at import
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+
+def fake_groq_client(**settings) -> AsyncGroq:
+    """
+    A real AsyncGroq client whose requests are served in-process by bench/fakegroq.py.
+    """
+    settings = {"latency_ms": 1.0, "latency_sigma": 0.0, "token_ms": 0.0, **settings}
+    app = create_app(FakeSettings(**settings))
+    return AsyncGroq(
+        api_key="test",
+        base_url="http://fakegroq",
+        http_client=httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://fakegroq"
+        ),
+    )
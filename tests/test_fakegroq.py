@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+import config as c
+from app import prompts, upstream
+from app.transcriptionanalysis import TranscriptionAnalysis
+from bench.fakegroq import SYNTHESIS_RESPONSE
+from conftest import fake_groq_client
+
+
+@pytest.mark.parametrize("model", c.ROUTER_TIERS["transcription_analysis"])
+def test_transcription_analysis_on_any_tier(monkeypatch, model):
+    # as if the router had sent the stage to this tier
+    monkeypatch.setattr(upstream.router, "choose", lambda *args: model)
+    service = TranscriptionAnalysis(client=fake_groq_client())
+
+    analysis = asyncio.run(service.analyze_transcript("Where is the exit?"))
+
+    assert analysis.domain == "navigation"
+
+
+@pytest.mark.parametrize("model", c.ROUTER_TIERS["synthesis"])
+def test_synthesis_on_any_tier(model):
+    async def run():
+        completion = await fake_groq_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": prompts.SYNTHESIS_SYSTEM_PROMPT},
+                {"role": "user", "content": "Where is the exit?"},
+            ],
+        )
+        return completion.choices[0].message.content
+
+    assert asyncio.run(run()) == SYNTHESIS_RESPONSE
@@ -0,0 +1,65 @@
+from PIL import Image, ImageDraw
+
+from app import generation
+from app.framecache import FrameCache
+from app.frameworker import dhash
+from app.schemas import SceneAnalysis
+
+SCENE = SceneAnalysis.model_validate(
+    {
+        "hazard": "none",
+        "people": "none",
+        "actions": [],
+        "objects": ["door front 5 m"],
+        "path": "clear front 4 m",
+        "notes": "none",
+        "confidence": 0.9,
+    }
+)
+
+
+def striped(shade: int) -> Image.Image:
+    frame = Image.new("RGB", (64, 64), (shade, shade, shade))
+    draw = ImageDraw.Draw(frame)
+    for x in range(0, 64, 16):
+        draw.rectangle((x, 0, x + 7, 63), fill=(255 - shade,) * 3)
+    return frame
+
+
+def test_flat_frames_have_no_hash():
+    black = Image.new("RGB", (64, 64), (0, 0, 0))
+    white = Image.new("RGB", (64, 64), (255, 255, 255))
+
+    assert dhash(black) is None
+    assert dhash(white) is None
+
+
+def test_textured_frames_are_hashed():
+    assert dhash(striped(0)) is not None
+    assert dhash(striped(0)) == dhash(striped(0))
+
+
+def test_near_identical_frame_hits():
+    cache = FrameCache(max_entries=8, ttl=60, max_distance=4)
+    phash = dhash(striped(0))
+    cache.put(phash, SCENE)
+
+    assert cache.get(phash ^ 0b11) == (SCENE, 2)
+    assert cache.get(~phash & (2**64 - 1)) is None
+
+
+def test_profiles_do_not_share_entries():
+    cache = FrameCache(max_entries=8, ttl=60, max_distance=4)
+    phash = dhash(striped(0))
+    token = generation.set_profile("fast")
+    try:
+        cache.put(phash, SCENE)
+        assert cache.get(phash) == (SCENE, 0)
+    finally:
+        generation.reset_profile(token)
+
+    token = generation.set_profile("quality")
+    try:
+        assert cache.get(phash) is None
+    finally:
+        generation.reset_profile(token)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.resilience import hedged
+
+
+def test_fast_call_is_not_hedged():
+    async def run():
+        async def call():
+            return "primary"
+
+        return await hedged(call, delay=1.0)
+
+    assert asyncio.run(run()) == ("primary", False)
+
+
+def test_hedge_wins_and_loser_is_cancelled():
+    async def run():
+        calls = []
+
+        async def call():
+            index = len(calls)
+            calls.append("running")
+            try:
+                await asyncio.sleep(1.0 if index == 0 else 0.01)
+            except asyncio.CancelledError:
+                calls[index] = "cancelled"
+                raise
+            calls[index] = "done"
+            return index
+
+        return await hedged(call, delay=0.01), calls
+
+    result, calls = asyncio.run(run())
+    assert result == (1, True)
+    assert calls == ["cancelled", "done"]
+
+
+def test_error_surfaces_when_both_calls_fail():
+    async def run():
+        async def call():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("upstream down")
+
+        await hedged(call, delay=0.01)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("cancel_after", [0.01, 0.1])
+def test_cancelling_the_caller_cancels_every_call(cancel_after):
+    # before the hedge is sent, and while both calls are running
+    async def run():
+        states = []
+
+        async def call():
+            states.append("running")
+            index = len(states) - 1
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                states[index] = "cancelled"
+                raise
+
+        caller = asyncio.ensure_future(hedged(call, delay=0.05))
+        await asyncio.sleep(cancel_after)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        # checked before asyncio.run cancels whatever is left
+        return list(states)
+
+    states = asyncio.run(run())
+    assert states and all(state == "cancelled" for state in states)
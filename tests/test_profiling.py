@@ -0,0 +1,42 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import app.main as main
+from app.profiling import RequestProfiler
+
+pytest.importorskip("pyinstrument")
+
+
+def get_health(headers: dict):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://jarvis"
+        ) as client:
+            return await client.get("/health", headers=headers)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def profiler(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "AUTH_TOKEN", "test")
+    profiler = RequestProfiler(str(tmp_path), sample_rate=0.0, min_duration_ms=0)
+    monkeypatch.setattr(main, "request_profiler", profiler)
+    return profiler
+
+
+def test_profile_header_needs_a_valid_token(profiler):
+    get_health({"X-Jarvis-Profile": "1"})
+    get_health({"X-Jarvis-Profile": "1", "Authorization": "Bearer wrong"})
+
+    assert os.listdir(profiler.directory) == []
+
+
+def test_profile_header_with_token_writes_a_profile(profiler):
+    get_health({"X-Jarvis-Profile": "1", "Authorization": "Bearer test"})
+
+    assert len(os.listdir(profiler.directory)) == 1
@@ -0,0 +1,40 @@
+import json
+
+from app.prompts import compact_frames
+
+
+def frame(hazard: str, confidence: float = 0.9) -> str:
+    return json.dumps(
+        {
+            "hazard": hazard,
+            "people": "none",
+            "actions": [],
+            "objects": [],
+            "path": "clear front 4 m" if hazard == "none" else "blocked",
+            "notes": "none",
+            "confidence": confidence,
+        }
+    )
+
+
+def test_identical_consecutive_frames_collapse():
+    lines = compact_frames([frame("none", 0.9), frame("none", 0.8), frame("none")])
+
+    assert len(lines) == 1
+    assert lines[0].startswith("Frames 1-3: ")
+
+
+def test_hazard_that_clears_and_returns_ends_on_the_hazard():
+    lines = compact_frames(
+        [frame("car front 3 m"), frame("none"), frame("none"), frame("car front 3 m")]
+    )
+
+    assert [line.split(":")[0] for line in lines] == ["Frame 1", "Frames 2-3", "Frame 4"]
+    assert "car front 3 m" in lines[-1]
+
+
+def test_hazard_that_clears_ends_clear():
+    lines = compact_frames([frame("none"), frame("car front 3 m"), frame("none")])
+
+    assert [line.split(":")[0] for line in lines] == ["Frame 1", "Frame 2", "Frame 3"]
+    assert '"hazard":"none"' in lines[-1]
@@ -0,0 +1,31 @@
+import asyncio
+
+import app.main as main
+from app.scenestore import MemorySceneBackend, SceneStore
+from app.schemas import SCENE_UNCLEAR, SceneAnalysis
+
+SCENE = SceneAnalysis.model_validate(
+    {
+        "hazard": "none",
+        "people": "none",
+        "actions": [],
+        "objects": ["door front 5 m"],
+        "path": "clear front 4 m",
+        "notes": "none",
+        "confidence": 0.9,
+    }
+)
+
+
+def test_fallback_scenes_are_not_recorded(monkeypatch):
+    store = SceneStore(MemorySceneBackend(max_scenes=8, max_bytes=8192, ttl=60))
+    monkeypatch.setattr(main, "scene_store", store)
+
+    async def run():
+        await main.record_scenes("dev-1", [SCENE, SCENE_UNCLEAR, "custom prompt output"])
+        return await store.recent("dev-1")
+
+    recorded = asyncio.run(run())
+
+    assert len(recorded) == 1
+    assert "door front 5 m" in str(recorded[0])
@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+
+import app.main as main
+from conftest import fake_groq_client
+
+HEADERS = {"Authorization": "Bearer test"}
+
+
+def test_coalesced_requests_report_upstream_timing(monkeypatch):
+    monkeypatch.setattr(main, "AUTH_TOKEN", "test")
+    service = main.transcription_service
+    monkeypatch.setattr(service, "client", fake_groq_client(latency_ms=50))
+    monkeypatch.setattr(service, "cache", None)
+    monkeypatch.setattr(service, "index", None)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://jarvis"
+        ) as client:
+            body = {"transcript": "Where is the nearest exit?"}
+            return await asyncio.gather(
+                *[
+                    client.post(
+                        "/api/transcription-analysis", json=body, headers=HEADERS
+                    )
+                    for _ in range(3)
+                ]
+            )
+
+    responses = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert service.single_flight.stats()["coalesced"] >= 1
+    for response in responses:
+        assert "upstream;dur=" in response.headers["Server-Timing"]
@@ -0,0 +1,99 @@
+import asyncio
+
+from app.resilience import Deadline, current_deadline, set_deadline
+from app.scheduler import Priority, current_priority, set_priority
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("key", fn) for _ in range(5)])
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(run())
+    assert calls == 1 and results == ["result"] * 5
+    assert flight.stats()["coalesced"] == 4 and flight.stats()["in_flight"] == 0
+
+
+def test_shared_call_gets_loosest_deadline_and_most_urgent_priority():
+    async def run():
+        flight = SingleFlight()
+        seen = {}
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.05)
+            seen["remaining"] = current_deadline().remaining()
+            seen["priority"] = current_priority()
+            return "result"
+
+        async def caller(budget: float, priority: Priority):
+            set_deadline(Deadline(budget))
+            set_priority(priority)
+            return await flight.do("key", fn)
+
+        first = asyncio.ensure_future(caller(0.5, Priority.BACKGROUND))
+        await started.wait()
+        second = asyncio.ensure_future(caller(30.0, Priority.HIGH))
+        return await asyncio.gather(first, second), seen
+
+    results, seen = asyncio.run(run())
+    assert results == ["result", "result"]
+    assert seen["remaining"] > 25
+    assert seen["priority"] is Priority.HIGH
+
+
+def test_one_caller_leaving_keeps_the_call():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leaving = asyncio.ensure_future(flight.do("key", fn))
+        staying = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run()) == "result"
+
+
+def test_call_is_cancelled_when_every_caller_leaves():
+    async def run():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def again():
+            return "fresh"
+
+        # the abandoned call isn't joined by the next caller
+        return flight, await flight.do("key", again)
+
+    flight, result = asyncio.run(run())
+    assert result == "fresh"
+    assert flight.stats()["abandoned"] == 1
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.speculation import SpeculativeAnalysis, covers, stable_prefix
+from app.transcriptionanalysis import TranscriptionAnalysis
+from app.utterancestore import SQLiteUtteranceBackend, UtteranceStore
+from conftest import fake_groq_client
+
+
+def workers(tmp_path, count=2, latency_ms=1.0):
+    """
+    SpeculativeAnalysis instances sharing one SQLite utterance store, like gunicorn workers.
+    """
+    path = str(tmp_path / "utterances.sqlite3")
+    return [
+        SpeculativeAnalysis(
+            TranscriptionAnalysis(client=fake_groq_client(latency_ms=latency_ms)),
+            UtteranceStore(SQLiteUtteranceBackend(path, 100, 60.0)),
+        )
+        for _ in range(count)
+    ]
+
+
+def test_stable_prefix_and_covers():
+    assert stable_prefix(None, "where is") == ""
+    assert stable_prefix("where is the", "where is the counter") == "where is the"
+    assert stable_prefix(None, "where is the counter?") == "where is the counter?"
+    assert covers("where is the counter?", "Where is the counter? Thanks.")
+    assert not covers("where is the counter", "where is the counter by the door")
+
+
+def test_commit_on_another_worker_reuses_finished_speculation(tmp_path):
+    async def run():
+        first, second = workers(tmp_path)
+        await first.snapshot("utt-1", "where is")
+        assert await first.snapshot("utt-1", "where is the counter?") == (
+            "where is the counter?"
+        )
+        await asyncio.sleep(0.1)
+        return await second.commit("utt-1", "Where is the counter? Thanks.")
+
+    analysis, outcome = asyncio.run(run())
+    assert outcome == "hit"
+    assert analysis.context
+
+
+def test_commit_on_another_worker_waits_for_running_speculation(tmp_path):
+    async def run():
+        first, second = workers(tmp_path, latency_ms=200.0)
+        await first.snapshot("utt-1", "where is the counter?")
+        return await second.commit("utt-1", "where is the counter?")
+
+    _, outcome = asyncio.run(run())
+    assert outcome == "in_flight"
+
+
+def test_changed_transcript_misses(tmp_path):
+    async def run():
+        first, second = workers(tmp_path)
+        await first.snapshot("utt-1", "where is the counter?")
+        await asyncio.sleep(0.1)
+        _, outcome = await second.commit("utt-1", "where is the sink?")
+        # the commit consumed the utterance
+        state = await second.store.get("utt-1")
+        return outcome, state
+
+    outcome, state = asyncio.run(run())
+    assert outcome == "miss" and state is None
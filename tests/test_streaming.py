@@ -0,0 +1,54 @@
+import asyncio
+
+import groq
+import pytest
+
+import config as c
+from app.llmsynthesis import LLMSynthesis
+from app.schemas import SceneAnalysis, TranscriptAnalysis
+from bench.fakegroq import SYNTHESIS_RESPONSE
+from conftest import fake_groq_client
+
+TRANSCRIPT = TranscriptAnalysis(context="User asking where the exit is", confidence=0.9)
+SCENE = SceneAnalysis.model_validate(
+    {
+        "hazard": "none",
+        "people": "none",
+        "actions": [],
+        "objects": ["door front 5 m"],
+        "path": "clear front 4 m",
+        "notes": "none",
+        "confidence": 0.9,
+    }
+)
+
+
+def test_synthesize_stream_through_sdk():
+    async def run():
+        synthesis = LLMSynthesis(client=fake_groq_client())
+        stream = await synthesis.synthesize_stream(
+            transcription_analysis=TRANSCRIPT,
+            surrounding_analysis=[SCENE],
+        )
+        text = "".join([delta async for delta in stream])
+        return text, stream
+
+    text, stream = asyncio.run(run())
+    assert text.strip() == SYNTHESIS_RESPONSE
+    assert stream.model == c.GROQ_LLM_SYNTHESIS_MODEL
+    assert stream.finish_reason == "stop"
+    # reported by Groq under x_groq in the last chunk
+    assert stream.usage is not None and stream.usage.completion_tokens > 0
+
+
+def test_fake_rejects_parameters_the_sdk_cannot_send():
+    async def run():
+        await fake_groq_client().chat.completions.create(
+            model=c.GROQ_LLM_SYNTHESIS_MODEL,
+            messages=[{"role": "user", "content": "hi"}],
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+
+    with pytest.raises(groq.BadRequestError):
+        asyncio.run(run())
@@ -0,0 +1,52 @@
+from app.schemas import TranscriptAnalysis
+from app.transcriptindex import TranscriptIndex, jaccard, shingles
+
+
+def analysis(confidence=0.9) -> TranscriptAnalysis:
+    return TranscriptAnalysis(context="User looking for the counter", confidence=confidence)
+
+
+def test_contractions_and_punctuation_are_normalized():
+    assert shingles("Where's the counter?") == shingles("where is the counter")
+    assert jaccard(shingles("turn left"), shingles("turn right")) < 0.5
+
+
+def test_near_duplicate_hits():
+    index = TranscriptIndex()
+    stored = analysis()
+    index.put("where's the counter", stored)
+    hit = index.get("Where is the counter?")
+    assert hit is not None
+    assert hit[0] is stored and hit[1] == 1.0
+    assert index.get("where is the sink") is None
+
+
+def test_profiles_are_kept_apart():
+    index = TranscriptIndex()
+    index.put("where is the counter", analysis(), profile="fast")
+    assert index.get("where is the counter", profile="quality") is None
+    assert index.get("where is the counter", profile="fast") is not None
+
+
+def test_missing_or_low_confidence_is_not_indexed():
+    index = TranscriptIndex(min_confidence=0.6)
+    index.put("where is the counter", analysis(confidence=None))
+    index.put("where is the door", analysis(confidence=0.3))
+    assert index.stats()["entries"] == 0
+    assert index.get("where is the counter") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    index = TranscriptIndex(max_entries=2)
+    index.put("where is the counter", analysis())
+    index.put("read the sign ahead", analysis())
+    index.get("where is the counter")
+    index.put("what time is it", analysis())
+    assert index.get("read the sign ahead") is None
+    assert index.get("where is the counter") is not None
+
+
+def test_expired_entries_miss():
+    index = TranscriptIndex(ttl=0.0)
+    index.put("where is the counter", analysis())
+    assert index.get("where is the counter") is None
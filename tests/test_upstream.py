@@ -0,0 +1,87 @@
+import asyncio
+from collections import defaultdict
+
+import groq
+import pytest
+
+import config as c
+from app import upstream
+from app.resilience import CircuitBreaker, LatencyTracker, OutcomeTracker
+from app.scheduler import Priority
+from conftest import fake_groq_client
+
+MODEL = c.GROQ_LLM_SYNTHESIS_MODEL
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(upstream, "latency", defaultdict(LatencyTracker))
+    monkeypatch.setattr(upstream, "stream_latency", defaultdict(LatencyTracker))
+    monkeypatch.setattr(upstream, "errors", defaultdict(OutcomeTracker))
+    monkeypatch.setattr(upstream, "breakers", defaultdict(CircuitBreaker))
+    monkeypatch.setattr(upstream, "_stats", defaultdict(upstream._stats.default_factory))
+
+
+def admitted_create(client, **kwargs):
+    request = {"model": MODEL, "messages": MESSAGES, **kwargs}
+    return upstream._admitted_create(
+        client, "synthesis", 10, Priority.NORMAL, request
+    )
+
+
+def test_rate_limit_is_not_a_failure():
+    client = fake_groq_client(rate_limit_rate=1.0).with_options(max_retries=0)
+
+    with pytest.raises(groq.RateLimitError):
+        asyncio.run(admitted_create(client))
+
+    assert len(upstream.errors[MODEL]) == 0
+    assert len(upstream.breakers[MODEL]._calls) == 0
+
+
+def test_server_error_is_a_failure():
+    client = fake_groq_client(error_rate=1.0).with_options(max_retries=0)
+
+    with pytest.raises(groq.InternalServerError):
+        asyncio.run(admitted_create(client))
+
+    assert upstream.errors[MODEL].error_rate() == 1.0
+
+
+def test_stream_latency_is_tracked_apart():
+    async def run():
+        client = fake_groq_client()
+        await admitted_create(client)
+        stream = await admitted_create(client, stream=True)
+        async for _ in stream:
+            pass
+
+    asyncio.run(run())
+
+    assert len(upstream.latency[MODEL]) == 1
+    assert len(upstream.stream_latency[MODEL]) == 1
+
+
+@pytest.mark.parametrize("outputs, hedges", [(1, 1), (3, 0)])
+def test_only_single_answer_calls_are_hedged(monkeypatch, outputs, hedges):
+    monkeypatch.setattr(c, "UPSTREAM_HEDGE_MIN_DELAY_SECONDS", 0.02)
+    for _ in range(c.UPSTREAM_HEDGE_MIN_SAMPLES):
+        upstream.latency[c.GROQ_VLM_MODEL].observe(0.001)
+    client = fake_groq_client(latency_ms=100)
+
+    asyncio.run(
+        upstream.create_completion(
+            client,
+            stage="vlm",
+            outputs=outputs,
+            model=c.GROQ_VLM_MODEL,
+            messages=MESSAGES,
+        )
+    )
+
+    assert upstream.stats()["vlm"]["hedges"] == hedges
+    # batched calls don't feed the single-answer latencies hedging is based on
+    assert len(upstream.latency[c.GROQ_VLM_MODEL]) == c.UPSTREAM_HEDGE_MIN_SAMPLES + (
+        outputs == 1
+    )